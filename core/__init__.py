@@ -3,7 +3,7 @@ import shutil
 import logging
 import threading
 import traceback
-from flask import Flask
+from flask import Flask, request, g
 
 # === 基础设施 ===
 from core.config import INTERNAL_DIR, BASE_DIR, TEMP_DIR
@@ -12,9 +12,13 @@ from core.context import ctx
 # === 数据与服务 ===
 from core.data.db_session import init_database, close_connection, backfill_wi_metadata
 from core.services.scan_service import start_background_scanner
+from core.services.maintenance_service import start_maintenance_worker
+from core.services.hash_service import start_content_hasher
+from core.services.thumbnail_service import start_thumbnail_builder, start_thumbnail_gc
+from core.services.job_service import job_manager
 
 # === API 蓝图 ===
-from core.api.v1 import cards, world_info, system, resources, automation
+from core.api.v1 import cards, world_info, system, resources, automation, jobs
 from core.api import views
 
 logger = logging.getLogger(__name__)
@@ -32,6 +36,10 @@ def create_app():
     
     # 注册数据库连接关闭钩子 (在请求结束时自动调用)
     app.teardown_appcontext(close_connection)
+
+    # 记录请求活跃度，供后台维护任务判断是否空闲
+    app.before_request(_track_request_start)
+    app.teardown_request(_track_request_end)
     
     # === 注册蓝图 (Blueprints) ===
     
@@ -41,12 +49,29 @@ def create_app():
     app.register_blueprint(system.bp)      # 系统设置与操作
     app.register_blueprint(resources.bp)   # 静态资源服务 (图片/缩略图)
     app.register_blueprint(automation.bp)  # 自动化任务管理
+    app.register_blueprint(jobs.bp)        # 后台任务 (进度/取消)
     
     # 2. 页面视图
     app.register_blueprint(views.bp)       # 前端页面入口
+
+    # 后台任务在 app_context 中执行，以便复用依赖 Flask g 的数据库服务
+    job_manager.init_app(app)
     
     return app
 
+# 轮询类/静态资源请求不计入活跃度，否则前端轮询会让应用永远无法空闲
+_ACTIVITY_EXEMPT_ENDPOINTS = {'static', 'system.api_status'}
+
+def _track_request_start():
+    if request.endpoint in _ACTIVITY_EXEMPT_ENDPOINTS:
+        return
+    g.activity_tracked = True
+    ctx.mark_request_start()
+
+def _track_request_end(exception=None):
+    if g.pop('activity_tracked', False):
+        ctx.mark_request_end()
+
 def cleanup_temp_files():
     """
     启动时清空临时目录 (data/temp)
@@ -105,6 +130,19 @@ def init_services():
         # 4. 启动文件系统扫描器
         # 负责监听文件变动并同步到数据库
         start_background_scanner()
+
+        # 5. 启动空闲时的数据库维护 (checkpoint / optimize / ANALYZE / VACUUM)
+        start_maintenance_worker()
+
+        # 6. 后台计算全量内容哈希 (查重)
+        start_content_hasher()
+
+        # 7. 后台预生成缩略图 (新导入的资料库首次浏览不再卡在图片解码上)
+        start_thumbnail_builder()
+        start_thumbnail_gc()
+
+        # 8. 恢复上次退出时未完成的后台任务
+        job_manager.resume_pending()
         
         # 初始化完成
         ctx.set_status(status="ready", message="服务已就绪")
@@ -11,6 +11,7 @@ from core.context import ctx
 from core.services.card_service import resolve_ui_key
 from core.data.ui_store import load_ui_data
 from core.data.db_session import get_db
+from core.services.job_service import job_manager
 from core.config import CARDS_FOLDER
 from core.utils.image import extract_card_info
 from core.utils.text import calculate_token_count
@@ -47,6 +48,180 @@ def delete_ruleset(ruleset_id):
         return jsonify({"success": True})
     return jsonify({"success": False, "msg": "Delete failed"})
 
+def _execute_ruleset(card_ids, ruleset, job=None):
+    """
+    对卡片列表执行规则集。
+    job 不为空时 (后台任务模式) 汇报进度并响应取消。
+    """
+    ui_data = load_ui_data()
+    processed_count = 0
+    
+    # 统计结果
+    summary = {
+        "moves": 0,
+        "tag_changes": 0
+    }
+
+    if not ctx.cache.initialized: ctx.cache.reload_from_db()
+    
+    # 定义所有属于"深层数据"的字段名 (包含 UI 字段名 和 内部数据字段名)
+    deep_trigger_keys = {
+        'character_book', 'extensions', # 内部对象名
+        'wi_name', 'wi_content',        # 世界书
+        'regex_name', 'regex_content',  # 正则脚本
+        'st_script_name', 'st_script_content', # ST脚本
+        'description', 'first_mes', 'mes_example', 'alternate_greetings',
+        'personality', 'scenario', 'creator_notes', 
+        'system_prompt', 'post_history_instructions',
+        'char_version'
+    }
+    
+    needs_deep_scan = False
+
+    for r_idx, r in enumerate(ruleset.get('rules', [])):
+        if not r.get('enabled', True): continue
+        
+        # 兼容处理：确保有 groups
+        groups = r.get('groups', [])
+        if not groups and r.get('conditions'):
+            groups = [{'conditions': r.get('conditions')}]
+        
+        for g_idx, g in enumerate(groups):
+            for c_idx, cond in enumerate(g.get('conditions', [])):
+                field_key = cond.get('field', '')
+                mapped_key = FIELD_MAP.get(field_key, '')
+
+                # 核心判断：只要字段名包含在触发列表中，或者其映射名在列表中
+                if (field_key in deep_trigger_keys) or (mapped_key in deep_trigger_keys):
+                    needs_deep_scan = True
+                    break
+            if needs_deep_scan: break
+        if needs_deep_scan: break
+
+    # =================================================================
+    # 2. 执行循环
+    # =================================================================
+    # 恢复执行时从断点继续 (断点记录的是下一张待处理卡片的下标)
+    start_index = 0
+    if job and job.checkpoint:
+        start_index = job.checkpoint.get('next_index', 0)
+        processed_count = job.checkpoint.get('processed', 0)
+        summary = job.checkpoint.get('summary', summary)
+    if job:
+        job.set_progress(start_index, len(card_ids))
+
+    for idx, cid in enumerate(card_ids[start_index:], start=start_index + 1):
+        if job:
+            job.check_cancelled()
+            job.save_checkpoint({'next_index': idx - 1, 'processed': processed_count, 'summary': summary})
+            job.set_progress(idx, len(card_ids))
+
+        # 查找基础数据
+        card_obj = ctx.cache.id_map.get(cid)
+        if not card_obj: 
+            continue
+        
+        context_data = dict(card_obj)
+        
+        ui_key = resolve_ui_key(cid)
+        ui_info = ui_data.get(ui_key, {})
+        
+        context_data['ui_summary'] = ui_info.get('summary', '')
+        context_data['source_link'] = ui_info.get('link', '')
+        
+        # file_size 可能不在缓存里，如果规则需要，实时获取
+        if 'file_size' not in context_data:
+            try:
+                full_path = os.path.join(CARDS_FOLDER, cid.replace('/', os.sep))
+                if os.path.exists(full_path):
+                    context_data['file_size'] = os.path.getsize(full_path)
+                else:
+                    context_data['file_size'] = 0
+            except:
+                context_data['file_size'] = 0
+        
+        # === 如果需要深层扫描，强制读取文件 ===
+        if needs_deep_scan:
+            try:
+                full_path = os.path.join(CARDS_FOLDER, cid.replace('/', os.sep))
+                if os.path.exists(full_path):
+                    info = extract_card_info(full_path)
+                    if info:
+                        data_block = info.get('data', info) if 'data' in info else info
+                        
+                        # 待注入的字段列表
+                        fields_to_patch = [
+                            'character_book', 'extensions',
+                            'description', 'first_mes', 'mes_example', 
+                            'alternate_greetings', 'personality', 'scenario',
+                            'creator_notes', 'system_prompt', 'post_history_instructions'
+                        ]
+                        
+                        for f in fields_to_patch:
+                            if f not in context_data or not context_data[f]:
+                                context_data[f] = data_block.get(f)
+                        
+                        # 特殊映射: character_version -> char_version
+                        if 'char_version' not in context_data or not context_data['char_version']:
+                            context_data['char_version'] = data_block.get('character_version', '')
+
+            except Exception as e:
+                logger.warning(f"Deep scan failed for {cid}: {e}")
+                    
+        if 'token_count' not in context_data:
+             # 简单补全，防止报错
+             context_data['token_count'] = 0
+        
+        ui_key = resolve_ui_key(cid)
+        ui_info = ui_data.get(ui_key, {})
+        context_data['ui_summary'] = ui_info.get('summary', '')
+        
+        # 2. 评估
+        plan_raw = engine.evaluate(context_data, ruleset)
+        
+        # 3. 整理 Plan (engine 返回的是 actions 列表，需转换为 Executor 需要的格式)
+        # Engine 返回: { 'actions': [ {'type':'move_folder', 'value':'...'}, ... ] }
+        # Executor 需要: { 'move': ..., 'add_tags': ..., ... }
+        
+        if not plan_raw['actions']: continue
+        
+        exec_plan = {
+            'move': None,
+            'add_tags': set(),
+            'remove_tags': set(),
+            'favorite': None
+        }
+        
+        for act in plan_raw['actions']:
+            t = act['type']
+            v = act['value']
+            if t == 'move_folder': exec_plan['move'] = v
+            elif t == 'add_tag': exec_plan['add_tags'].add(v)
+            elif t == 'remove_tag': exec_plan['remove_tags'].add(v)
+            elif t == 'set_favorite': exec_plan['favorite'] = (str(v).lower() == 'true')
+        
+        # 4. 执行
+        res = executor.apply_plan(cid, exec_plan)
+        
+        processed_count += 1
+        if res['moved_to']: summary['moves'] += 1
+        if res['tags_added'] or res['tags_removed']: summary['tag_changes'] += 1
+
+    return {
+        "success": True, 
+        "processed": processed_count,
+        "summary": summary
+    }
+
+def _job_execute_rules(job, params):
+    """[后台任务] 对整个分类执行规则集"""
+    ruleset = rule_manager.get_ruleset(params["ruleset_id"])
+    if not ruleset:
+        return {"success": False, "msg": "规则集不存在"}
+    return _execute_ruleset(params["card_ids"], ruleset, job)
+
+job_manager.register('automation_execute', _job_execute_rules)
+
 @bp.route('/api/automation/execute', methods=['POST'])
 def execute_rules():
     """
@@ -95,151 +270,12 @@ def execute_rules():
         if not ruleset:
             return jsonify({"success": False, "msg": "规则集不存在"})
 
-        ui_data = load_ui_data()
-        processed_count = 0
-        
-        # 统计结果
-        summary = {
-            "moves": 0,
-            "tag_changes": 0
-        }
-
-        if not ctx.cache.initialized: ctx.cache.reload_from_db()
-        
-        # 定义所有属于"深层数据"的字段名 (包含 UI 字段名 和 内部数据字段名)
-        deep_trigger_keys = {
-            'character_book', 'extensions', # 内部对象名
-            'wi_name', 'wi_content',        # 世界书
-            'regex_name', 'regex_content',  # 正则脚本
-            'st_script_name', 'st_script_content', # ST脚本
-            'description', 'first_mes', 'mes_example', 'alternate_greetings',
-            'personality', 'scenario', 'creator_notes', 
-            'system_prompt', 'post_history_instructions',
-            'char_version'
-        }
-        
-        needs_deep_scan = False
-
-        for r_idx, r in enumerate(ruleset.get('rules', [])):
-            if not r.get('enabled', True): continue
-            
-            # 兼容处理：确保有 groups
-            groups = r.get('groups', [])
-            if not groups and r.get('conditions'):
-                groups = [{'conditions': r.get('conditions')}]
-            
-            for g_idx, g in enumerate(groups):
-                for c_idx, cond in enumerate(g.get('conditions', [])):
-                    field_key = cond.get('field', '')
-                    mapped_key = FIELD_MAP.get(field_key, '')
-
-                    # 核心判断：只要字段名包含在触发列表中，或者其映射名在列表中
-                    if (field_key in deep_trigger_keys) or (mapped_key in deep_trigger_keys):
-                        needs_deep_scan = True
-                        break
-                if needs_deep_scan: break
-            if needs_deep_scan: break
-
-        # =================================================================
-        # 2. 执行循环
-        # =================================================================
-        for cid in card_ids:
-            # 查找基础数据
-            card_obj = ctx.cache.id_map.get(cid)
-            if not card_obj: 
-                continue
-            
-            context_data = dict(card_obj)
-            
-            ui_key = resolve_ui_key(cid)
-            ui_info = ui_data.get(ui_key, {})
-            
-            context_data['ui_summary'] = ui_info.get('summary', '')
-            context_data['source_link'] = ui_info.get('link', '')
-            
-            # file_size 可能不在缓存里，如果规则需要，实时获取
-            if 'file_size' not in context_data:
-                try:
-                    full_path = os.path.join(CARDS_FOLDER, cid.replace('/', os.sep))
-                    if os.path.exists(full_path):
-                        context_data['file_size'] = os.path.getsize(full_path)
-                    else:
-                        context_data['file_size'] = 0
-                except:
-                    context_data['file_size'] = 0
-            
-            # === 如果需要深层扫描，强制读取文件 ===
-            if needs_deep_scan:
-                try:
-                    full_path = os.path.join(CARDS_FOLDER, cid.replace('/', os.sep))
-                    if os.path.exists(full_path):
-                        info = extract_card_info(full_path)
-                        if info:
-                            data_block = info.get('data', info) if 'data' in info else info
-                            
-                            # 待注入的字段列表
-                            fields_to_patch = [
-                                'character_book', 'extensions',
-                                'description', 'first_mes', 'mes_example', 
-                                'alternate_greetings', 'personality', 'scenario',
-                                'creator_notes', 'system_prompt', 'post_history_instructions'
-                            ]
-                            
-                            for f in fields_to_patch:
-                                if f not in context_data or not context_data[f]:
-                                    context_data[f] = data_block.get(f)
-                            
-                            # 特殊映射: character_version -> char_version
-                            if 'char_version' not in context_data or not context_data['char_version']:
-                                context_data['char_version'] = data_block.get('character_version', '')
-
-                except Exception as e:
-                    logger.warning(f"Deep scan failed for {cid}: {e}")
-                        
-            if 'token_count' not in context_data:
-                 # 简单补全，防止报错
-                 context_data['token_count'] = 0
-            
-            ui_key = resolve_ui_key(cid)
-            ui_info = ui_data.get(ui_key, {})
-            context_data['ui_summary'] = ui_info.get('summary', '')
-            
-            # 2. 评估
-            plan_raw = engine.evaluate(context_data, ruleset)
-            
-            # 3. 整理 Plan (engine 返回的是 actions 列表，需转换为 Executor 需要的格式)
-            # Engine 返回: { 'actions': [ {'type':'move_folder', 'value':'...'}, ... ] }
-            # Executor 需要: { 'move': ..., 'add_tags': ..., ... }
-            
-            if not plan_raw['actions']: continue
-            
-            exec_plan = {
-                'move': None,
-                'add_tags': set(),
-                'remove_tags': set(),
-                'favorite': None
-            }
-            
-            for act in plan_raw['actions']:
-                t = act['type']
-                v = act['value']
-                if t == 'move_folder': exec_plan['move'] = v
-                elif t == 'add_tag': exec_plan['add_tags'].add(v)
-                elif t == 'remove_tag': exec_plan['remove_tags'].add(v)
-                elif t == 'set_favorite': exec_plan['favorite'] = (str(v).lower() == 'true')
-            
-            # 4. 执行
-            res = executor.apply_plan(cid, exec_plan)
-            
-            processed_count += 1
-            if res['moved_to']: summary['moves'] += 1
-            if res['tags_added'] or res['tags_removed']: summary['tag_changes'] += 1
+        # 按分类执行时卡片数量不可控，转为后台任务
+        if category is not None:
+            job = job_manager.submit('automation_execute', {"card_ids": card_ids, "ruleset_id": ruleset_id})
+            return jsonify({"success": True, "job_id": job.id, "job": job.to_dict()})
 
-        return jsonify({
-            "success": True, 
-            "processed": processed_count,
-            "summary": summary
-        })
+        return jsonify(_execute_ruleset(card_ids, ruleset))
 
     except Exception as e:
         logger.error(f"Execution error: {e}")
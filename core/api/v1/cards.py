@@ -7,37 +7,49 @@ import time
 import requests
 import sqlite3
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote, unquote, urlparse
 from PIL import Image
 from flask import Blueprint, request, jsonify, send_from_directory 
 
 # === 基础设施 ===
-from core.config import CARDS_FOLDER, DATA_DIR, BASE_DIR, THUMB_FOLDER, TRASH_FOLDER, DEFAULT_DB_PATH, TEMP_DIR, load_config, current_config
+from core.config import CARDS_FOLDER, DATA_DIR, BASE_DIR, TRASH_FOLDER, DEFAULT_DB_PATH, TEMP_DIR, load_config, current_config
 from core.context import ctx
-from core.data.db_session import get_db
+from core.data.db_session import get_db, chunked, escape_like
 from core.data.ui_store import load_ui_data, save_ui_data
+from core.data.tag_index import count_tags, get_card_ids_by_tags
+from core.data.phash_index import DEFAULT_PHASH_DISTANCE, MAX_PHASH_DISTANCE
 from core.consts import SIDECAR_EXTENSIONS
 
 # === 核心服务 ===
-from core.services.scan_service import suppress_fs_events
+from core.services.scan_service import suppress_fs_events, record_self_write
 from core.services.cache_service import schedule_reload, force_reload, update_card_cache
 from core.services.card_service import update_card_content, rename_folder_in_db, rename_folder_in_ui, resolve_ui_key, swap_skin_to_cover
 from core.services.automation_service import auto_run_rules_on_card
+from core.services.tag_service import delete_tags, rename_tags, update_tags
+from core.services.job_service import job_manager
+from core.services.hash_service import find_duplicates, count_pending_hashes, find_near_duplicates
+from core.services.thumbnail_service import thumb_builder, enqueue_thumbnails, invalidate_thumbnail, card_image_path
 
 # === 工具函数 ===
 from core.utils.image import (
     extract_card_info, write_card_metadata,
-    find_sidecar_image, clean_thumbnail_cache,
     clean_sidecar_images, resize_image_if_needed )
-from core.utils.filesystem import safe_move_to_trash, is_card_file, sanitize_filename
+from core.utils.filesystem import safe_move_to_trash, is_card_file, is_sidecar_image, sanitize_filename
 from core.utils.hash import get_file_hash_and_size
 from core.utils.text import calculate_token_count
 from core.utils.data import get_wi_meta, normalize_card_v3, deterministic_sort
+from core.utils.walker import BUNDLE_MARKER, iter_files, scan_tree
 
 logger = logging.getLogger(__name__)
 
 bp = Blueprint('cards', __name__)
 
+# 批量删除时并行移动到回收站的线程数 (纯文件系统 rename/copy，IO 密集)
+TRASH_MOVE_WORKERS = 8
+# 文件夹合并每移动多少个文件保存一次断点 (断点含完整 ID 映射，逐个保存在大目录上是 O(n²))
+MERGE_CHECKPOINT_EVERY = 200
+
 # === 辅助函数：合并 Tag 逻辑 ===
 def _merge_tags_into_new_info(old_path, new_info):
     """
@@ -176,7 +188,13 @@ def api_list_cards():
     if tags_param:
         tag_list = [t.strip() for t in tags_param.split('|||') if t.strip()]
         if tag_list:
-            candidates = [c for c in candidates if all(t in c['tags'] for t in tag_list)]
+            # 由 card_tags 索引求出同时包含全部标签的卡片 ID，不再逐卡扫描标签列表
+            try:
+                tagged_ids = set(get_card_ids_by_tags(get_db(), tag_list, match_all=True))
+                candidates = [c for c in candidates if c['id'] in tagged_ids]
+            except sqlite3.Error as e:
+                logger.warning(f"Tag index query failed, filtering in memory: {e}")
+                candidates = [c for c in candidates if all(t in c['tags'] for t in tag_list)]
 
     # 5. 排序
     filtered_cards = candidates
@@ -202,6 +220,9 @@ def api_list_cards():
     end = start + page_size
     paginated = filtered_cards[start:end]
 
+    # 后台缩略图预生成优先处理当前页与当前文件夹 (只调整队列顺序，不阻塞)
+    thumb_builder.focus(category if category != "根目录" else "", [c['id'] for c in paginated])
+
     # 7. 返回结果
     safe_folders = [f for f in ctx.cache.visible_folders if f]
     
@@ -248,8 +269,6 @@ def api_toggle_favorite():
 @bp.route('/api/update_card', methods=['POST'])
 def api_update_card():
     try:
-        # 保存会写 PNG/JSON + utime + rename，抑制 watchdog
-        suppress_fs_events(2.5)
         data = request.json
         raw_id = data.get('id')
         # 获取强制更新标记 (用于设为封面)
@@ -270,6 +289,9 @@ def api_update_card():
         if os.path.abspath(old_full_path).lower() != os.path.abspath(new_full_path).lower():
             is_renamed = True
 
+        # 保存会写 PNG/JSON + utime + rename，登记自身写入避免 watchdog 重复扫描
+        suppress_fs_events([old_full_path, new_full_path], 2.5, sidecars=True)
+
         # --- 辅助函数：深度清洗数据 ---
         def clean_for_compare(obj):
             if isinstance(obj, dict):
@@ -402,6 +424,7 @@ def api_update_card():
             try: 
                 os.utime(current_full_path, (current_mtime, current_mtime))
             except: pass
+            record_self_write(current_full_path)
         else:
             # 如果只改了 UI 数据，保持原文件的修改时间
             current_mtime = os.path.getmtime(current_full_path)
@@ -469,7 +492,7 @@ def api_update_card():
         bundle_dir = data.get('bundle_dir')
         if not bundle_dir:
             dir_path = os.path.dirname(current_full_path)
-            if os.path.exists(os.path.join(dir_path, '.bundle')):
+            if os.path.exists(os.path.join(dir_path, BUNDLE_MARKER)):
                 bundle_dir = os.path.relpath(dir_path, CARDS_FOLDER).replace('\\', '/')
 
         if bundle_dir:
@@ -578,8 +601,6 @@ def api_update_card():
 @bp.route('/api/move_card', methods=['POST'])
 def api_move_card():
     try:
-        # 批量 move/rename 文件，抑制 watchdog
-        suppress_fs_events(5.0)
         data = request.json
         target_cat = data.get('target_category', '')
         if target_cat == "根目录": target_cat = ""
@@ -588,7 +609,9 @@ def api_move_card():
         
         # 目标基础目录
         dst_base_dir = os.path.join(CARDS_FOLDER, target_cat)
-        if not os.path.exists(dst_base_dir): os.makedirs(dst_base_dir)
+        if not os.path.exists(dst_base_dir):
+            suppress_fs_events(dst_base_dir, 5.0)
+            os.makedirs(dst_base_dir)
         
         moved_details = []
         ui_data = load_ui_data()
@@ -638,7 +661,8 @@ def api_move_card():
                                 break
                             counter += 1
                     
-                    # 执行移动
+                    # 执行移动 (登记源/目标子树，避免 watchdog 重复扫描)
+                    suppress_fs_events([src_dir_full, dst_dir_full], 5.0, recursive=True)
                     shutil.move(src_dir_full, dst_dir_full)
                     
                     # 计算新的相对路径 (用于更新 ui_data 和前端)
@@ -696,7 +720,7 @@ def api_move_card():
                     
                     # 只有 JSON 才检查伴生图，PNG 本身就是主图
                     if filename.lower().endswith('.json'):
-                        sidecar_src = find_sidecar_image(src_full)
+                        sidecar_src = card_image_path(cid, verify=True)
                         if sidecar_src:
                             sidecar_ext = os.path.splitext(sidecar_src)[1]
 
@@ -739,6 +763,7 @@ def api_move_card():
                         counter += 1
                     
                     # === 3. 执行移动 ===
+                    suppress_fs_events([src_full, dst_full, sidecar_src, dst_sidecar_full], 5.0)
                     
                     # 移动主文件
                     shutil.move(src_full, dst_full)
@@ -799,88 +824,91 @@ def api_move_card():
 @bp.route('/api/delete_cards', methods=['POST'])
 def api_delete_cards():
     try:
-        # 批量 move 到回收站 / 删除文件夹，抑制 watchdog
-        suppress_fs_events(5.0)
         card_ids = request.json.get('card_ids', [])
         if not card_ids:
             return jsonify({"success": False, "msg": "未选择文件"})
 
-        deleted_count = 0
-        ui_data = load_ui_data()
-        ui_changed = False
-
-        db_path = DEFAULT_DB_PATH
-        conn = get_db()
-        cursor = conn.cursor()
-
         cache_map = ctx.cache.id_map
 
-        for cid in card_ids:
+        # 1. 归类：普通文件按 ID 处理，Bundle 按目录去重 (同一包内多选只移动一次)
+        file_ids = []
+        bundle_dirs = []
+        for cid in dict.fromkeys(card_ids):
             card_info = cache_map.get(cid)
-            # 如果缓存里没找到，可能是幽灵数据，尝试直接按 ID 处理
-            # 但为了安全，没有 info 我们可能无法判断是 bundle 还是 file
-            # 这里做一个简单的容错：如果没 info，假设是普通文件
-            is_bundle = False
-            bundle_dir = ""
-            if card_info:
-                is_bundle = card_info.get('is_bundle', False)
+            # 如果缓存里没找到，可能是幽灵数据：没有 info 无法判断是否 bundle，按普通文件处理
+            if card_info and card_info.get('is_bundle', False):
                 bundle_dir = card_info.get('bundle_dir', '')
-            
-            is_deleted = False
-
-            if is_bundle:
-                # === 包模式：删除文件夹 ===
-                if bundle_dir:
-                    sys_bundle_path = bundle_dir.replace('/', os.sep)
-                    full_dir_path = os.path.join(CARDS_FOLDER, sys_bundle_path)
-                    
-                    if os.path.exists(full_dir_path):
-                        if safe_move_to_trash(full_dir_path, TRASH_FOLDER):
-                            is_deleted = True
-                            if bundle_dir in ui_data:
-                                del ui_data[bundle_dir]
-                                ui_changed = True
-                            
-                            cursor.execute("DELETE FROM card_metadata WHERE id LIKE ? || '/%'", (bundle_dir,))
-                            cursor.execute("DELETE FROM folder_structure WHERE path = ?", (bundle_dir,))
+                if bundle_dir and bundle_dir not in bundle_dirs:
+                    bundle_dirs.append(bundle_dir)
             else:
-                # === 普通模式：删除文件 ===
-                rel_sys_path = cid.replace('/', os.sep)
-                full_path = os.path.join(CARDS_FOLDER, rel_sys_path)
-                
-                if os.path.exists(full_path):
-                    # 只要文件存在，就移动到回收站（无论是 json 还是 png）
-                    if safe_move_to_trash(full_path, TRASH_FOLDER):
-                        is_deleted = True
-                    else:
-                        # 如果移动失败（极少情况），记录日志或暂不删除DB
-                        print(f"Failed to move to trash: {full_path}")
-                else:
-                    # 文件不存在（幽灵数据），直接视为删除成功，以便清理数据库
-                    is_deleted = True
+                file_ids.append(cid)
 
-                if is_deleted:
-                    if cid in ui_data:
-                        del ui_data[cid]
-                        ui_changed = True
-                    cursor.execute("DELETE FROM card_metadata WHERE id = ?", (cid,))
-            
-            if is_deleted:
-                deleted_count += 1
-                
-                # -------------------------------------------------------------
-                # 内存更新必须在循环内部执行！
-                # -------------------------------------------------------------
-                if is_bundle:
-                    ctx.cache.delete_bundle_update(bundle_dir)
-                else:
-                    ctx.cache.delete_card_update(cid)
-        
-        conn.commit()
+        # 2. 并行移动到回收站 (预先创建回收站目录，避免线程间 makedirs 竞争)
+        os.makedirs(TRASH_FOLDER, exist_ok=True)
+        # 登记即将移走的文件与目录，避免 watchdog 重复扫描
+        suppress_fs_events(
+            [os.path.join(CARDS_FOLDER, cid.replace('/', os.sep)) for cid in file_ids], 5.0, sidecars=True
+        )
+        suppress_fs_events(
+            [os.path.join(CARDS_FOLDER, b.replace('/', os.sep)) for b in bundle_dirs], 5.0, recursive=True
+        )
+
+        def _trash_file(cid):
+            full_path = os.path.join(CARDS_FOLDER, cid.replace('/', os.sep))
+            if not os.path.exists(full_path):
+                # 文件不存在（幽灵数据），直接视为删除成功，以便清理数据库
+                return True
+            # 只要文件存在，就移动到回收站（无论是 json 还是 png）
+            # JSON 卡片探测所有伴生图扩展名一并移走 (删除不常发生)：扫描只记录了其中一张，
+            # 其它或之后新增的伴生图留在库里会成为孤立图片
+            if safe_move_to_trash(full_path, TRASH_FOLDER):
+                return True
+            logger.warning(f"Failed to move to trash: {full_path}")
+            return False
+
+        def _trash_bundle(bundle_dir):
+            full_dir_path = os.path.join(CARDS_FOLDER, bundle_dir.replace('/', os.sep))
+            return os.path.exists(full_dir_path) and safe_move_to_trash(full_dir_path, TRASH_FOLDER)
+
+        with ThreadPoolExecutor(max_workers=TRASH_MOVE_WORKERS) as pool:
+            file_results = list(pool.map(_trash_file, file_ids))
+            bundle_results = list(pool.map(_trash_bundle, bundle_dirs))
+
+        deleted_ids = [cid for cid, ok in zip(file_ids, file_results) if ok]
+        deleted_bundles = [b for b, ok in zip(bundle_dirs, bundle_results) if ok]
+        deleted_count = len(deleted_ids) + len(deleted_bundles)
+
+        # 3. 数据库：集合式删除，一个事务
+        if deleted_count:
+            conn = get_db()
+            cursor = conn.cursor()
+            for chunk in chunked(deleted_ids):
+                cursor.execute(
+                    f"DELETE FROM card_metadata WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                )
+            if deleted_bundles:
+                cursor.executemany(
+                    "DELETE FROM card_metadata WHERE id LIKE ? || '/%' ESCAPE '\\'",
+                    [(escape_like(b),) for b in deleted_bundles]
+                )
+                cursor.executemany(
+                    "DELETE FROM folder_structure WHERE path = ?",
+                    [(b,) for b in deleted_bundles]
+                )
+            conn.commit()
+
+            # 4. UI 数据与内存缓存各更新一次
+            ui_data = load_ui_data()
+            ui_changed = False
+            for key in deleted_ids + deleted_bundles:
+                if key in ui_data:
+                    del ui_data[key]
+                    ui_changed = True
+            if ui_changed:
+                save_ui_data(ui_data)
+
+            ctx.cache.delete_cards_bulk_update(deleted_ids, deleted_bundles)
 
-        if ui_changed:
-            save_ui_data(ui_data)
-        
         return jsonify({
             "success": True, 
             "count": deleted_count,
@@ -893,9 +921,6 @@ def api_delete_cards():
 def api_import_from_url():
     temp_path = None
     try:
-        # 会写入 cards/ 文件，抑制 watchdog
-        suppress_fs_events(2.5)
-        
         data = request.json
         url = data.get('url')
         target_category = data.get('category', '')
@@ -954,6 +979,7 @@ def api_import_from_url():
         # === 3. 确定目标路径和文件名 ===
         target_dir = os.path.join(CARDS_FOLDER, target_category)
         if not os.path.exists(target_dir):
+            suppress_fs_events(target_dir, 2.5)
             os.makedirs(target_dir)
 
         data_block = info.get('data', {}) if 'data' in info else info
@@ -969,6 +995,8 @@ def api_import_from_url():
             final_filename = f"{safe_name}{ext}"
             
         target_save_path = os.path.join(target_dir, final_filename)
+        # 覆盖策略会先删除同名文件，提前登记
+        suppress_fs_events(target_save_path, 2.5)
         
         # === 4. 冲突检测与处理, 加入伴生文件检测，以决定是否返回 conflict 状态 ===
         base_target = os.path.splitext(target_save_path)[0]
@@ -1069,6 +1097,7 @@ def api_import_from_url():
                 return jsonify({"success": False, "msg": f"无效的解决策略: {resolution}"})
         
         # === 5. 执行保存 (Move) ===
+        suppress_fs_events(target_save_path, 2.5)
         shutil.move(temp_path, target_save_path)
         
         # 最终文件名
@@ -1117,6 +1146,7 @@ def api_import_from_url():
         }
         
         ctx.cache.add_card_update(new_card)
+        enqueue_thumbnails([rel_path])
         
         # Auto Automation
         auto_res = auto_run_rules_on_card(new_card['id'])
@@ -1153,8 +1183,6 @@ def api_change_image():
     2. JSON -> PNG (格式升级，清理旧文件，迁移数据)
     """
     try:
-        # 会写图/删旧文件/rename，抑制 watchdog
-        suppress_fs_events(2.5)
         raw_id = request.form.get('id')
         file = request.files.get('image')
         if not raw_id or not file:
@@ -1162,6 +1190,8 @@ def api_change_image():
         
         # 计算路径
         card_path = os.path.join(CARDS_FOLDER, raw_id.replace('/', os.sep))
+        # 会写图/删旧文件 (JSON 转 PNG 时目标即同名伴生图)，登记自身写入
+        suppress_fs_events(card_path, 2.5, sidecars=True)
         
         # 初始化变量
         target_save_path = card_path
@@ -1198,6 +1228,7 @@ def api_change_image():
             # 再删除 JSON 主体
             if os.path.exists(card_path):
                 os.remove(card_path)
+            ctx.cache.forget_sidecar(raw_id)
             
             # 4. 保存新图片并写入元数据
             img = Image.open(file)
@@ -1263,9 +1294,10 @@ def api_change_image():
             logger.warning(f"Failed to touch file: {e}")
             
         new_mtime = os.path.getmtime(target_save_path)
+        record_self_write(target_save_path)
         
         # 2. 物理删除 WebP 缩略图缓存 (强制下次请求重新生成)
-        clean_thumbnail_cache(final_id, THUMB_FOLDER)
+        invalidate_thumbnail(final_id)
         
         # 3. 更新数据库记录 (Upsert)
         update_card_cache(final_id, target_save_path)
@@ -1610,19 +1642,18 @@ def api_random_card():
 @bp.route('/api/toggle_bundle_mode', methods=['POST'])
 def api_toggle_bundle_mode():
     try:
-        # 会创建/删除 .bundle、写入 png metadata，抑制 watchdog
-        suppress_fs_events(2.0)
         folder_path = request.json.get('folder_path')
         action = request.json.get('action', 'check') # check | enable | disable
         
         if not folder_path: return jsonify({"success": False, "msg": "路径为空"})
             
         full_path = os.path.join(CARDS_FOLDER, folder_path)
-        marker_path = os.path.join(full_path, '.bundle')
+        marker_path = os.path.join(full_path, BUNDLE_MARKER)
         
         # === 1. 取消聚合 (Disable) ===
         if action == 'disable':
             if os.path.exists(marker_path):
+                suppress_fs_events(marker_path, 2.0)
                 os.remove(marker_path)
             # 刷新缓存
             force_reload(reason="toggle_bundle_mode:disable")
@@ -1633,25 +1664,23 @@ def api_toggle_bundle_mode():
         cards_in_dir = []
         ui_data = load_ui_data()
         
-        for root, dirs, files in os.walk(full_path):
-            if root != full_path: continue # 只看当前层级
-            for f in files:
-                if f.lower().endswith('.png'):
-                    full_p = os.path.join(root, f)
-                    rel_id = f"{folder_path}/{f}"
-                    info = extract_card_info(full_p)
-                    if info:
-                        data = info.get('data', {}) if 'data' in info else info
-                        tags = data.get('tags', [])
-                        if isinstance(tags, str): tags = [t.strip() for t in tags.split(',') if t.strip()]
-                        
-                        cards_in_dir.append({
-                            "filename": f,
-                            "id": rel_id,
-                            "tags": set(tags or []),
-                            "ui": ui_data.get(rel_id, {}),
-                            "mtime": os.path.getmtime(full_p)
-                        })
+        # 只看当前层级 (max_depth=0)，不再遍历整棵子树
+        for entry in iter_files(full_path, file_filter=lambda n: n.lower().endswith('.png'), max_depth=0):
+            f = entry.name
+            rel_id = f"{folder_path}/{f}"
+            info = extract_card_info(entry.path)
+            if info:
+                data = info.get('data', {}) if 'data' in info else info
+                tags = data.get('tags', [])
+                if isinstance(tags, str): tags = [t.strip() for t in tags.split(',') if t.strip()]
+                
+                cards_in_dir.append({
+                    "filename": f,
+                    "id": rel_id,
+                    "tags": set(tags or []),
+                    "ui": ui_data.get(rel_id, {}),
+                    "mtime": entry.mtime
+                })
         
         count = len(cards_in_dir)
         if count == 0:
@@ -1693,11 +1722,15 @@ def api_toggle_bundle_mode():
                 data_part['tags'] = list(all_tags)
                 if 'data' in info: info['data'] = data_part # 确保写回结构正确
                 else: info = data_part
+                # 登记自身写入，避免 watchdog 重复扫描
+                suppress_fs_events(latest_card_file, 2.0)
                 write_card_metadata(latest_card_file, info)
+                record_self_write(latest_card_file)
 
             save_ui_data(ui_data)
             
             # 3.5 创建标记文件
+            suppress_fs_events(marker_path, 2.0)
             with open(marker_path, 'w') as f: f.write("1")
             
             force_reload(reason="toggle_bundle_mode:enable")
@@ -1719,7 +1752,6 @@ def api_toggle_bundle_mode():
 @bp.route('/api/convert_to_bundle', methods=['POST'])
 def api_convert_to_bundle():
     try:
-        suppress_fs_events(3.0)
         data = request.json
         card_id = data.get('card_id')
         new_bundle_name = data.get('bundle_name', '').strip()
@@ -1741,27 +1773,21 @@ def api_convert_to_bundle():
         if os.path.exists(new_dir_path):
             return jsonify({"success": False, "msg": f"目标文件夹 '{new_bundle_name}' 已存在"})
             
-        # 2. 创建文件夹
+        # 2. 创建文件夹 (登记原卡片与新目录子树，避免 watchdog 重复扫描)
+        suppress_fs_events(src_path, 3.0, sidecars=True)
+        suppress_fs_events(new_dir_path, 3.0, recursive=True)
         os.makedirs(new_dir_path)
         
-        # 3. 移动文件 (卡片 + 伴生图)
+        # 3. 移动文件 (卡片 + 伴生图，伴生图在移动前解析)
         filename = os.path.basename(src_path)
         dst_path = os.path.join(new_dir_path, filename)
+        sidecar = card_image_path(card_id, verify=True) if filename.lower().endswith('.json') else None
         shutil.move(src_path, dst_path)
-        
-        # 处理伴生图
-        if filename.lower().endswith('.json'):
-            sidecar = find_sidecar_image(src_path) # 注意 src_path 已经移走了，这里可能找不到
-            # 应该在 move 之前找，或者根据 base name 找
-            pass # 简化逻辑：上面的 shutil.move 已经移走了主文件。伴生图逻辑类似 api_move_folder，此处略以保证简洁
-            # 实际上建议复用 move 逻辑，但这里手动处理更稳
-            base_src = os.path.splitext(src_path)[0]
-            for ext in SIDECAR_EXTENSIONS:
-                if os.path.exists(base_src + ext):
-                    shutil.move(base_src + ext, os.path.join(new_dir_path, os.path.basename(base_src + ext)))
+        if sidecar:
+            shutil.move(sidecar, os.path.join(new_dir_path, os.path.basename(sidecar)))
 
         # 4. 创建 .bundle 标记
-        with open(os.path.join(new_dir_path, '.bundle'), 'w') as f:
+        with open(os.path.join(new_dir_path, BUNDLE_MARKER), 'w') as f:
             f.write('1')
             
         # 5. 更新数据 (数据库 + 缓存)
@@ -1918,181 +1944,195 @@ def api_get_card_detail():
     except Exception as e:
         return jsonify({"success": False, "msg": str(e)})
 
-@bp.route('/api/delete_tags', methods=['POST'])
-def api_delete_tags():
+@bp.route('/api/tag_counts')
+def api_tag_counts():
+    """标签使用统计 (直接由 card_tags 索引聚合，可按分类过滤)"""
     try:
-        # 会写很多 PNG metadata
-        suppress_fs_events(10.0)
-
-        tags_to_delete = request.json.get("tags", [])
-        target_category = request.json.get("category", "")
-        if not tags_to_delete:
-            return jsonify({"success": False, "msg": "未选择要删除的标签"})
-
-        tags_to_delete_set = set(str(t).strip() for t in tags_to_delete if str(t).strip())
-
-        updated_cards = 0
-        affected_tags = set()
+        category = request.args.get('category', '')
+        if category == "根目录":
+            category = ""
+        counts = count_tags(get_db(), category or None)
+        return jsonify({"success": True, "counts": counts})
+    except Exception as e:
+        return jsonify({"success": False, "msg": str(e)})
 
+@bp.route('/api/duplicates')
+def api_duplicates():
+    """
+    查重：按全量内容哈希 (type=file) 或规范化卡片数据哈希 (type=data) 分组。
+    哈希由后台线程计算，pending 为尚未计算完成的卡片数。
+    """
+    try:
+        kind = "meta" if request.args.get('type') == 'data' else "content"
+        category = request.args.get('category', '')
+        if category == "根目录":
+            category = ""
         conn = get_db()
-        cursor = conn.cursor()
-
-        current_time = time.time()
-
-        scan_root = CARDS_FOLDER
-        if target_category and target_category != "根目录":
-            # 如果指定了分类，只扫描该分类下的文件
-            # 注意：这里需要处理路径拼接，防止路径遍历攻击
-            safe_cat = target_category.replace('..', '').strip('/\\')
-            scan_root = os.path.join(CARDS_FOLDER, safe_cat)
-
-        if not os.path.exists(scan_root):
-             return jsonify({"success": False, "msg": "目标分类不存在"})
-
-        for root, dirs, files in os.walk(scan_root):
-            for file in files:
-                if not file.lower().endswith('.png'):
-                    continue
-
-                full_path = os.path.join(root, file)
-                info = extract_card_info(full_path)
-                if not info or not isinstance(info, dict):
-                    continue
-
-                # card_id 用于更新 DB / cache（统一斜杠）
-                rel_path = os.path.relpath(full_path, CARDS_FOLDER).replace('\\', '/')
-                card_id = rel_path
-
-                # 兼容 V2/V3：确定写入的 data block
-                is_v3 = isinstance(info.get("data"), dict)
-                data_block = info["data"] if is_v3 else info
-
-                card_tags = data_block.get("tags") or []
-                if isinstance(card_tags, str):
-                    card_tags = [t.strip() for t in card_tags.split(',') if t.strip()]
-                elif card_tags is None:
-                    card_tags = []
-
-                # 保持原顺序删除 + 去重（可选，但建议）
-                seen = set()
-                new_tags = []
-                for t in card_tags:
-                    ts = str(t).strip()
-                    if not ts:
-                        continue
-                    if ts in tags_to_delete_set:
-                        continue
-                    if ts in seen:
-                        continue
-                    seen.add(ts)
-                    new_tags.append(ts)
-
-                if new_tags == card_tags:
-                    continue
-
-                # 记录影响到的标签
-                affected_tags |= (set(str(t).strip() for t in card_tags if str(t).strip()) & tags_to_delete_set)
-
-                # === 关键：只写回 data_block，不污染顶层 ===
-                data_block["tags"] = new_tags
-                if is_v3:
-                    info["data"] = data_block  # 确保结构正确
-
-                ok = write_card_metadata(full_path, info)
-                if not ok:
-                    continue
-
-                try:
-                    os.utime(full_path, (current_time, current_time))
-                except:
-                    pass
-
-                updated_cards += 1
-
-                # === 同步 DB（列表来自 DB，不同步就会“删了但列表不变”）===
-                cursor.execute(
-                    "UPDATE card_metadata SET tags = ?, last_modified = ? WHERE id = ?",
-                    (json.dumps(new_tags, ensure_ascii=False), current_time, card_id)
-                )
-
-                # === 同步内存缓存（如果这张卡在轻量缓存里）===
-                ctx.cache.update_tags_update(card_id, new_tags)
-
-                if card_id in ctx.cache.id_map:
-                    ctx.cache.id_map[card_id]['last_modified'] = current_time
-                    ctx.cache.id_map[card_id]['tags'] = new_tags
-
-        conn.commit()
-
-        # 如果你有 ui_data['all_tags'] 这种历史字段，可以保留原逻辑；没有也不会影响
-        ui_data = load_ui_data()
-        if isinstance(ui_data, dict) and 'all_tags' in ui_data and isinstance(ui_data['all_tags'], list):
-            ui_data['all_tags'] = [tag for tag in ui_data['all_tags'] if tag not in tags_to_delete_set]
-            save_ui_data(ui_data)
-
-        # 尤其有 bundle 聚合显示时），可以触发一次 reload
-        schedule_reload(reason="delete_tags")
-
+        groups = find_duplicates(conn, kind, category or None)
         return jsonify({
             "success": True,
-            "updated_cards": updated_cards,
-            "deleted_tags": sorted(list(affected_tags)),
-            "total_tags_deleted": len(affected_tags)
+            "type": "data" if kind == "meta" else "file",
+            "groups": groups,
+            "pending": count_pending_hashes(conn)
         })
-
     except Exception as e:
         return jsonify({"success": False, "msg": str(e)})
 
-@bp.route('/api/batch_tags', methods=['POST'])
-def api_batch_tags():
+def _parse_phash_distance(value):
     try:
-        # 批量写 PNG metadata
-        suppress_fs_events(6.0)
-        ids = request.json.get("card_ids", [])
-        add_tags = request.json.get("add", []) or []
-        remove_tags = request.json.get("remove", []) or []
+        distance = int(value)
+    except (TypeError, ValueError):
+        distance = DEFAULT_PHASH_DISTANCE
+    return max(0, min(distance, MAX_PHASH_DISTANCE))
+
+def _job_near_duplicates(job, params):
+    """[后台任务] 全库近似重复头像分组"""
+    conn = get_db()
+    groups = find_near_duplicates(
+        conn, params.get("distance", DEFAULT_PHASH_DISTANCE),
+        progress_cb=job.set_progress, cancel_cb=job.is_cancelled
+    )
+    job.check_cancelled()
+    return {"success": True, "distance": params.get("distance"), "groups": groups}
+
+job_manager.register('near_duplicates', _job_near_duplicates)
+
+@bp.route('/api/near_duplicates', methods=['GET', 'POST'])
+def api_near_duplicates():
+    """
+    近似重复头像：基于感知哈希 (dHash) 的汉明距离 (distance 默认 4，最大 8)。
+    - GET ?card_id=...: 同步返回与该卡片相似的卡片
+    - POST {distance}: 全库分组，作为后台任务执行
+    """
+    try:
+        if request.method == 'POST':
+            distance = _parse_phash_distance((request.json or {}).get('distance'))
+            job = job_manager.submit('near_duplicates', {"distance": distance})
+            return jsonify({"success": True, "job_id": job.id, "job": job.to_dict()})
 
-        updated = 0
+        card_id = request.args.get('card_id')
+        if not card_id:
+            return jsonify({"success": False, "msg": "缺少 card_id"})
+        distance = _parse_phash_distance(request.args.get('distance'))
+        similar = find_near_duplicates(get_db(), distance, card_id)
+        if similar is None:
+            return jsonify({"success": False, "msg": "该卡片的感知哈希尚未计算"})
+        return jsonify({"success": True, "distance": distance, "similar": similar})
+    except Exception as e:
+        return jsonify({"success": False, "msg": str(e)})
 
-        # 数据库连接 (为了持久化标签变更，防止重启丢失)
-        # 虽然写入了 PNG，但数据库也有一份 tags 字段，需要同步
-        db_path = DEFAULT_DB_PATH
-        conn = get_db()
-        cursor = conn.cursor()
+def _sanitize_tag_category(target_category):
+    """标签批量操作的分类参数：根目录归一为空，并防止路径遍历"""
+    if not target_category or target_category == "根目录":
+        return ""
+    return target_category.replace('..', '').strip('/\\').replace('\\', '/')
+
+def _job_delete_tags(job, params):
+    """[后台任务] 删除标签 (tag_service 逐个文件登记自身写入)"""
+    tags_to_delete = params.get("tags", [])
+    updated, failed, affected_tags = delete_tags(
+        tags_to_delete, params.get("category", ""),
+        progress_cb=job.set_progress, cancel_cb=job.is_cancelled
+    )
+    tags_to_delete_set = set(str(t).strip() for t in tags_to_delete if str(t).strip())
+
+    # 如果你有 ui_data['all_tags'] 这种历史字段，可以保留原逻辑；没有也不会影响
+    ui_data = load_ui_data()
+    if isinstance(ui_data, dict) and 'all_tags' in ui_data and isinstance(ui_data['all_tags'], list):
+        ui_data['all_tags'] = [tag for tag in ui_data['all_tags'] if tag not in tags_to_delete_set]
+        save_ui_data(ui_data)
+
+    job.check_cancelled()
+    return {
+        "success": True,
+        "updated_cards": len(updated),
+        "deleted_tags": sorted(list(affected_tags)),
+        "total_tags_deleted": len(affected_tags),
+        "failed": failed
+    }
+
+def _job_rename_tags(job, params):
+    """[后台任务] 重命名/合并标签"""
+    mapping = params.get("mapping") or {}
+    updated, failed = rename_tags(
+        mapping, params.get("category", ""),
+        progress_cb=job.set_progress, cancel_cb=job.is_cancelled
+    )
+
+    # 同步历史字段 ui_data['all_tags']
+    ui_data = load_ui_data()
+    if isinstance(ui_data, dict) and 'all_tags' in ui_data and isinstance(ui_data['all_tags'], list):
+        renamed = [str(mapping.get(t, t)).strip() for t in ui_data['all_tags']]
+        ui_data['all_tags'] = list(dict.fromkeys(t for t in renamed if t))
+        save_ui_data(ui_data)
+
+    job.check_cancelled()
+    return {
+        "success": True,
+        "updated_cards": len(updated),
+        "failed": failed
+    }
+
+job_manager.register('delete_tags', _job_delete_tags)
+job_manager.register('rename_tags', _job_rename_tags)
 
-        for cid in ids:
-            rel = cid.replace('/', os.sep)
-            file_path = os.path.join(CARDS_FOLDER, rel)
-            info = extract_card_info(file_path)
-            if not info:
-                continue
+@bp.route('/api/delete_tags', methods=['POST'])
+def api_delete_tags():
+    try:
+        tags_to_delete = request.json.get("tags", [])
+        if not tags_to_delete:
+            return jsonify({"success": False, "msg": "未选择要删除的标签"})
+
+        target_category = _sanitize_tag_category(request.json.get("category", ""))
+        if target_category and not os.path.isdir(os.path.join(CARDS_FOLDER, target_category.replace('/', os.sep))):
+            return jsonify({"success": False, "msg": "目标分类不存在"})
 
-            data = info.get("data") if "data" in info else info
-            tags = data.get("tags") or []
-            if isinstance(tags, str):
-                tags = [t.strip() for t in tags.split(',') if t.strip()]
+        # 通过 card_tags 索引只处理真正包含这些标签的卡片 (PNG + JSON)，在后台任务中执行
+        job = job_manager.submit('delete_tags', {"tags": tags_to_delete, "category": target_category})
+        return jsonify({"success": True, "job_id": job.id, "job": job.to_dict()})
 
-            before = set(tags)
-            after = before.copy()
+    except Exception as e:
+        return jsonify({"success": False, "msg": str(e)})
 
-            after |= set(add_tags)
-            after -= set(remove_tags)
+@bp.route('/api/rename_tags', methods=['POST'])
+def api_rename_tags():
+    """
+    批量重命名/合并标签。
+    payload: { mapping: {旧标签: 新标签}, category: "" }
+    新标签已存在于某张卡片上时自动合并去重。
+    """
+    try:
+        mapping = request.json.get("mapping") or {}
+        if not isinstance(mapping, dict) or not mapping:
+            return jsonify({"success": False, "msg": "未指定要重命名的标签"})
 
-            after = list(after)
+        target_category = _sanitize_tag_category(request.json.get("category", ""))
+        job = job_manager.submit('rename_tags', {"mapping": mapping, "category": target_category})
+        return jsonify({"success": True, "job_id": job.id, "job": job.to_dict()})
+    except Exception as e:
+        return jsonify({"success": False, "msg": str(e)})
 
-            if after != list(before):
-                data["tags"] = after
-                info["tags"] = after
-                write_card_metadata(file_path, info)
-                # 写数据库
-                cursor.execute("UPDATE card_metadata SET tags = ? WHERE id = ?", (json.dumps(after), cid))
-                # 更新内存缓存
-                ctx.cache.update_tags_update(cid, after)
-                updated += 1
+def _job_batch_tags(job, params):
+    """[后台任务] 批量增删标签"""
+    updated, failed = update_tags(
+        params.get("card_ids", []), params.get("add", []), params.get("remove", []),
+        progress_cb=job.set_progress, cancel_cb=job.is_cancelled
+    )
+    job.check_cancelled()
+    return {"success": True, "updated": len(updated), "failed": failed}
 
-        conn.commit()
+job_manager.register('batch_tags', _job_batch_tags)
 
-        return jsonify({"success": True, "updated": updated})
+@bp.route('/api/batch_tags', methods=['POST'])
+def api_batch_tags():
+    try:
+        params = {
+            "card_ids": request.json.get("card_ids", []),
+            "add": request.json.get("add", []) or [],
+            "remove": request.json.get("remove", []) or [],
+        }
+        job = job_manager.submit('batch_tags', params)
+        return jsonify({"success": True, "job_id": job.id, "job": job.to_dict()})
     except Exception as e:
         return jsonify({"success": False, "msg": str(e)})
 
@@ -2144,8 +2184,6 @@ def api_set_skin_cover():
 @bp.route('/api/create_folder', methods=['POST'])
 def api_create_folder():
     try:
-        # mkdir 也会触发 event，短抑制即可
-        suppress_fs_events(1.5)
         data = request.json
         base = CARDS_FOLDER
         parent_rel = ""
@@ -2156,6 +2194,8 @@ def api_create_folder():
         new_folder_path = os.path.join(base, new_folder_name)
         if os.path.exists(new_folder_path):
              return jsonify({"success": False, "msg": "文件夹已存在"})
+        # mkdir 也会触发 event，登记自身写入
+        suppress_fs_events(new_folder_path, 1.5)
         os.makedirs(new_folder_path, exist_ok=True)
         new_rel_path = new_folder_name
         if data.get('parent') and data.get('parent') != "根目录":
@@ -2174,8 +2214,6 @@ def api_create_folder():
 @bp.route('/api/rename_folder', methods=['POST'])
 def api_rename_folder():
     try:
-        # 文件夹 rename 会触发大量事件，抑制 watchdog
-        suppress_fs_events(4.0)
         data = request.json
         old_path = data.get('old_path')
         new_name = data.get('new_name')
@@ -2200,7 +2238,8 @@ def api_rename_folder():
         if os.path.exists(new_path):
             return jsonify({"success": False, "msg": "目标名称已存在"})
         
-        # 1. [文件系统操作] 重命名文件夹
+        # 1. [文件系统操作] 重命名文件夹 (会触发大量事件，登记新旧两棵子树)
+        suppress_fs_events([old_full_path, new_path], 4.0, recursive=True)
         try:
             os.rename(old_full_path, new_path)
         except OSError as e:
@@ -2287,9 +2326,6 @@ def api_rename_folder():
 @bp.route('/api/delete_folder', methods=['POST'])
 def api_delete_folder():
     try:
-        # 1. 抑制文件系统事件 (因为涉及大量移动)
-        suppress_fs_events(6.0)
-        
         folder_path = request.json.get('folder_path')
         if not folder_path or folder_path == "根目录":
             return jsonify({"success": False, "msg": "根目录不可删除"})
@@ -2304,6 +2340,9 @@ def api_delete_folder():
 
         if not os.path.exists(target_dir):
              return jsonify({"success": False, "msg": "文件夹不存在"})
+
+        # 1. 登记自身写入 (涉及大量移动)：源目录整棵子树，移出的每一项在移动前单独登记
+        suppress_fs_events(target_dir, 6.0, recursive=True)
         
         ui_data = load_ui_data()
         ui_changed = False
@@ -2367,6 +2406,7 @@ def api_delete_folder():
                 dst_path = os.path.join(parent_dir, new_filename)
                 
                 try:
+                    suppress_fs_events(dst_path, 6.0)
                     shutil.move(src_path, dst_path)
                     moved_count += 1
                     
@@ -2411,6 +2451,7 @@ def api_delete_folder():
                     counter += 1
             
             try:
+                suppress_fs_events(dst_path, 6.0, recursive=True)
                 shutil.move(src_path, dst_path)
                 moved_count += 1
                 
@@ -2474,11 +2515,208 @@ def api_delete_folder():
         import traceback; traceback.print_exc()
         return jsonify({"success": False, "msg": str(e)})
 
+def _pick_merge_name(dir_names, filename):
+    """
+    在目标目录已有文件名集合中为 filename 选一个不冲突的名字。
+    JSON 卡片同时检查伴生图，避免覆盖目标目录里的同名图片。
+    """
+    base_name, ext_part = os.path.splitext(filename)
+    is_json = ext_part.lower() == '.json'
+
+    def _taken(base):
+        if (base + ext_part) in dir_names:
+            return True
+        return is_json and any((base + ext) in dir_names for ext in SIDECAR_EXTENSIONS)
+
+    if not _taken(base_name):
+        return filename
+    counter = 1
+    while _taken(f"{base_name}_{counter}"):
+        counter += 1
+    return f"{base_name}_{counter}{ext_part}"
+
+def _apply_merge_mapping(id_mapping, source_path, new_path_prefix):
+    """
+    将合并产生的 old_id -> new_id 映射一次性应用到数据库、UI 数据和内存缓存。
+    涉及 Bundle 时聚合关系可能改变，缓存交给防抖重载处理。
+    """
+    if not id_mapping:
+        return
+
+    rows = [(new_id, new_id.rsplit('/', 1)[0] if '/' in new_id else "", old_id)
+            for old_id, new_id in id_mapping.items()]
+    conn = get_db()
+    cursor = conn.cursor()
+    # 只处理旧记录仍存在的映射：断点恢复时重复应用同一映射、或扫描已按新 ID 重新索引时，
+    # 旧记录已不存在，目标 ID 上的就是有效记录，不能删除 (保证可重复执行)
+    cursor.executemany(
+        "DELETE FROM card_metadata WHERE id = ? AND EXISTS (SELECT 1 FROM card_metadata WHERE id = ?)",
+        [(r[0], r[2]) for r in rows]
+    )
+    # 目标 ID 上残留的幽灵记录已清掉，避免主键冲突 (DELETE 会触发附属表清理)
+    cursor.executemany("UPDATE card_metadata SET id = ?, category = ? WHERE id = ?", rows)
+    conn.commit()
+
+    ui_data = load_ui_data()
+    ui_changed = False
+    for old_id, new_id in id_mapping.items():
+        if old_id in ui_data:
+            ui_data[new_id] = ui_data.pop(old_id)
+            ui_changed = True
+    if ui_changed:
+        save_ui_data(ui_data)
+
+    source_prefix = source_path + '/'
+    with ctx.cache.lock:
+        has_bundle = any(
+            c.get('is_bundle') and (c.get('bundle_dir', '') + '/').startswith(source_prefix)
+            for c in ctx.cache.cards
+        )
+    if has_bundle:
+        schedule_reload(reason="move_folder:merge")
+        return
+
+    source_removed = not os.path.exists(os.path.join(CARDS_FOLDER, source_path))
+    missing = ctx.cache.merge_folder_update(id_mapping, source_path, new_path_prefix, source_removed)
+    if missing:
+        schedule_reload(reason="move_folder:merge")
+
+def _job_merge_folder(job, params):
+    """
+    [后台任务] 将源文件夹合并进已存在的同名目标文件夹。
+    可重复执行：恢复时只会处理源目录中尚未移走的文件，已移走文件的 ID 映射保存在断点中。
+    任务可能持续很久，自身写入按文件逐个登记，而不是一次登记整个时间窗口。
+    """
+    source_path = params["source_path"]
+    new_path_prefix = params["new_path_prefix"]
+    source_full_path = os.path.join(CARDS_FOLDER, source_path)
+    target_full_path = os.path.join(CARDS_FOLDER, new_path_prefix)
+
+    # old_id -> new_id (仅卡片主文件，伴生图不单独入库)
+    id_mapping = dict(job.checkpoint.get("id_mapping", {}))
+
+    if not os.path.exists(source_full_path):
+        # 上次运行已完成 (恢复执行时)
+        _apply_merge_mapping(id_mapping, source_path, new_path_prefix)
+        return {"success": True, "new_path": new_path_prefix, "mode": "merge"}
+
+    # 一次遍历 (共用 scan_tree 及其忽略规则) 得到源目录下的全部卡片与伴生图，
+    # 按目录分组后生成待移动清单：JSON 卡片带上同名伴生图，剩余 PNG 单独移动
+    tree = scan_tree(source_full_path, file_filter=lambda n: is_card_file(n) or is_sidecar_image(n),
+                     with_stat=False, rel_root=source_path)
+    dir_files = {}
+    for entry in tree.files:
+        dir_files.setdefault(entry.category, []).append(entry.name)
+
+    plan = []  # [(源目录相对路径, 目录内文件名集合, [待移动的卡片文件名])]
+    for rel_dir, names in dir_files.items():
+        src_names = set(names)
+        files_to_process = []
+        processed_files = set()
+        # 1. 找 JSON (带伴生图)
+        for f in names:
+            if f.lower().endswith('.json'):
+                files_to_process.append(f)
+                processed_files.add(f)
+                base = os.path.splitext(f)[0]
+                for ext in SIDECAR_EXTENSIONS:
+                    if (base + ext) in src_names: processed_files.add(base + ext)
+        # 2. 找剩余 PNG
+        for f in names:
+            if f.lower().endswith('.png') and f not in processed_files:
+                files_to_process.append(f)
+        if files_to_process:
+            plan.append((rel_dir, src_names, files_to_process))
+
+    # 进度：恢复执行时已移走的文件 (断点中的映射) 计入已完成
+    moved = len(id_mapping)
+    total = moved + sum(len(files) for _, _, files in plan)
+    job.set_progress(moved, total)
+    cancelled = False
+
+    # 目标目录文件名缓存：每个目录只 listdir 一次，之后在内存中登记新文件
+    dest_listing = {}
+
+    def _dir_names(dir_path):
+        if dir_path not in dest_listing:
+            try:
+                dest_listing[dir_path] = set(os.listdir(dir_path))
+            except OSError:
+                dest_listing[dir_path] = set()
+        return dest_listing[dir_path]
+
+    try:
+        for rel_dir, src_names, files_to_process in plan:
+            if job.is_cancelled():
+                cancelled = True
+                break
+
+            # 计算在目标文件夹中的对应位置 (源目录下的 "Sub" -> 目标目录下的 "Sub")
+            root = os.path.join(CARDS_FOLDER, rel_dir.replace('/', os.sep))
+            sub_dir = rel_dir[len(source_path):].lstrip('/')
+            dst_dir = os.path.normpath(os.path.join(target_full_path, sub_dir.replace('/', os.sep)))
+            # 确保目标子目录存在
+            if not os.path.isdir(dst_dir):
+                suppress_fs_events(dst_dir, 2.0)
+                os.makedirs(dst_dir, exist_ok=True)
+            dir_names = _dir_names(dst_dir)
+
+            # 移动文件
+            for filename in files_to_process:
+                if job.is_cancelled():
+                    cancelled = True
+                    break
+
+                src_file = os.path.join(root, filename)
+                # 重名检测 (基于预先读取的目录清单，不逐个 stat)
+                final_name = _pick_merge_name(dir_names, filename)
+                final_dst = os.path.join(dst_dir, final_name)
+
+                # 移动主文件 (连同伴生图一起登记自身写入)
+                suppress_fs_events([src_file, final_dst], 2.0, sidecars=True)
+                shutil.move(src_file, final_dst)
+                dir_names.add(final_name)
+
+                # 如果是 JSON，移动伴生图
+                if filename.lower().endswith('.json'):
+                    base_src = os.path.splitext(filename)[0]
+                    base_dst = os.path.splitext(final_name)[0] # 使用可能重命名后的名字
+                    for ext in SIDECAR_EXTENSIONS:
+                        if (base_src + ext) in src_names:
+                            shutil.move(os.path.join(root, base_src + ext), os.path.join(dst_dir, base_dst + ext))
+                            dir_names.add(base_dst + ext)
+
+                old_id = f"{rel_dir}/{filename}"
+                new_id = os.path.relpath(final_dst, CARDS_FOLDER).replace(os.sep, '/')
+                id_mapping[old_id] = new_id
+
+                moved += 1
+                job.set_progress(moved, total)
+                if moved % MERGE_CHECKPOINT_EVERY == 0:
+                    job.save_checkpoint({"id_mapping": id_mapping})
+
+            if cancelled:
+                break
+    finally:
+        # 取消/出错时也保存已移动文件的映射，恢复执行时据此同步数据库
+        job.save_checkpoint({"id_mapping": id_mapping})
+
+    # 删除源文件夹 (此时应为空)；取消时保留剩余文件
+    if not cancelled:
+        suppress_fs_events(source_full_path, 2.0, recursive=True)
+        try: shutil.rmtree(source_full_path)
+        except: pass
+
+    # 已移动的文件无论是否取消都要同步到数据库与缓存
+    _apply_merge_mapping(id_mapping, source_path, new_path_prefix)
+    job.check_cancelled()
+    return {"success": True, "new_path": new_path_prefix, "mode": "merge", "moved": moved}
+
+job_manager.register('merge_folder', _job_merge_folder)
+
 @bp.route('/api/move_folder', methods=['POST'])
 def api_move_folder():
     try:
-        # move/merge 文件夹会触发大量 fs events，抑制 watchdog（较长窗口）
-        suppress_fs_events(6.0)
         data = request.json
         source_path = data.get('source_path')
         target_parent_path = data.get('target_parent_path')
@@ -2521,10 +2759,15 @@ def api_move_folder():
         # 例如: src="/a/test", tgt="/a/test1" -> False
         if tgt_base_abs == src_abs or tgt_base_abs.startswith(src_abs + os.sep):
              return jsonify({"success": False, "msg": "无法将文件夹移动到其子目录中"})
+        # 目标就是源本身：合并会把文件改名后再删除源目录，必须拦截
+        if os.path.abspath(target_full_path) == src_abs:
+             return jsonify({"success": False, "msg": "文件夹已在目标位置"})
         # -------------------------------------------------------------
 
         # === 场景 A: 目标不存在，直接整文件夹移动 (最快) ===
         if not os.path.exists(target_full_path):
+            # 整棵子树移动会触发大量 fs events，登记新旧两棵子树
+            suppress_fs_events([source_full_path, target_full_path], 6.0, recursive=True)
             shutil.move(source_full_path, target_full_path)
             
             # 更新数据
@@ -2548,78 +2791,18 @@ def api_move_folder():
         if not merge_if_exists:
             return jsonify({"success": False, "msg": "目标位置已存在同名文件夹", "needs_merge": True})
         
-        # 执行合并逻辑
-        ui_data = load_ui_data()
-        
-        # 递归遍历源目录
-        for root, dirs, files in os.walk(source_full_path):
-            # 筛选文件：PNG 和 JSON
-            files_to_process = []
-            processed_files = set()
-
-            # 1. 找 JSON (带伴生图)
-            for f in files:
-                if f.lower().endswith('.json'):
-                    files_to_process.append(f)
-                    processed_files.add(f)
-                    base = os.path.splitext(f)[0]
-                    for ext in SIDECAR_EXTENSIONS:
-                        if (base + ext) in files: processed_files.add(base + ext)
-            
-            # 2. 找剩余 PNG
-            for f in files:
-                if f.lower().endswith('.png') and f not in processed_files:
-                    files_to_process.append(f)
-
-            # 移动文件
-            for filename in files_to_process:
-                src_file = os.path.join(root, filename)
-                
-                # 计算在目标文件夹中的对应位置
-                # rel_from_source: "Sub/Card.json"
-                rel_from_source = os.path.relpath(src_file, source_full_path)
-                dst_file = os.path.join(target_full_path, rel_from_source)
-                
-                # 确保目标子目录存在
-                os.makedirs(os.path.dirname(dst_file), exist_ok=True)
-                
-                # 重名检测
-                final_dst = dst_file
-                if os.path.exists(final_dst):
-                    base_name, ext_part = os.path.splitext(os.path.basename(dst_file))
-                    dir_name = os.path.dirname(dst_file)
-                    counter = 1
-                    while True:
-                        new_name = f"{base_name}_{counter}{ext_part}"
-                        final_dst = os.path.join(dir_name, new_name)
-                        # 如果是 JSON，还需要检查伴生图是否冲突 (略简化，假设主文件冲突则全部重命名)
-                        if not os.path.exists(final_dst): break
-                        counter += 1
-                
-                # 移动主文件
-                shutil.move(src_file, final_dst)
-                
-                # 如果是 JSON，移动伴生图
-                if filename.lower().endswith('.json'):
-                    base_src = os.path.splitext(filename)[0]
-                    base_dst = os.path.splitext(os.path.basename(final_dst))[0] # 使用可能重命名后的名字
-                    src_dir = os.path.dirname(src_file)
-                    dst_dir = os.path.dirname(final_dst)
-                    
-                    for ext in SIDECAR_EXTENSIONS:
-                        s_src = os.path.join(src_dir, base_src + ext)
-                        if os.path.exists(s_src):
-                            s_dst = os.path.join(dst_dir, base_dst + ext)
-                            shutil.move(s_src, s_dst)
-
-        # 删除源文件夹 (此时应为空)
-        try: shutil.rmtree(source_full_path)
-        except: pass
-        
-        # 触发全量刷新 (仅在 Merge 模式下)
-        force_reload(reason="move_folder:merge")
-        # 由于我们没有实现复杂的 Merge 增量逻辑，告诉前端刷新
-        return jsonify({"success": True, "new_path": new_path_prefix, "mode": "merge_reload"})
+        # 合并可能涉及大量文件，转为后台任务执行
+        job = job_manager.submit('merge_folder', {
+            "source_path": source_path,
+            "new_path_prefix": new_path_prefix
+        })
+        return jsonify({
+            "success": True,
+            "new_path": new_path_prefix,
+            "mode": "merge",
+            "job_id": job.id,
+            "job": job.to_dict()
+        })
     except Exception as e:
         logger.error(f"Move folder error: {e}")
         return jsonify({"success": False, "msg": str(e)})
@@ -2769,8 +2952,6 @@ def api_upload_commit():
     第二步：执行导入提交
     """
     try:
-        suppress_fs_events(5.0) 
-        
         data = request.json
         batch_id = data.get('batch_id')
         category = data.get('category', '')
@@ -2857,7 +3038,8 @@ def api_upload_commit():
                             break
                         counter += 1
             
-            # 执行文件移动 (覆盖模式先删旧)
+            # 执行文件移动 (覆盖模式先删旧)，登记自身写入
+            suppress_fs_events(dst_path, 5.0)
             if action == 'overwrite' and os.path.exists(dst_path):
                 # 解析暂存区文件
                 src_info = extract_card_info(src_path)
@@ -2921,6 +3103,7 @@ def api_upload_commit():
                     "is_bundle": False
                 }
                 ctx.cache.add_card_update(card_obj)
+                enqueue_thumbnails([rel_id])
                 
                 # === 触发自动化规则 ===
                 auto_res = auto_run_rules_on_card(card_obj['id'])
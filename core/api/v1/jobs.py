@@ -0,0 +1,37 @@
+import logging
+from flask import Blueprint, request, jsonify
+
+# === 核心服务 ===
+from core.services.job_service import job_manager
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('jobs', __name__)
+
+@bp.route('/api/jobs', methods=['GET'])
+def api_list_jobs():
+    """列出最近的后台任务 (active=true 时仅返回排队/运行中的任务)"""
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        limit = 50
+    active_only = request.args.get('active', 'false') == 'true'
+    try:
+        return jsonify({"success": True, "jobs": job_manager.list_jobs(limit=limit, active_only=active_only)})
+    except Exception as e:
+        return jsonify({"success": False, "msg": str(e)})
+
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+def api_get_job(job_id):
+    """查询单个任务的状态、进度与结果"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({"success": False, "msg": "任务不存在"}), 404
+    return jsonify({"success": True, "job": job})
+
+@bp.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def api_cancel_job(job_id):
+    """请求取消任务 (协作式：运行中的任务会在下一个检查点停止)"""
+    if job_manager.cancel(job_id):
+        return jsonify({"success": True})
+    return jsonify({"success": False, "msg": "任务不存在或已结束"})
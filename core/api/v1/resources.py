@@ -1,10 +1,11 @@
 import os
-import hashlib
 import logging
-from PIL import Image
 import json
+import struct
+import hashlib
+import base64
 from werkzeug.utils import secure_filename
-from flask import Blueprint, request, jsonify, send_from_directory
+from flask import Blueprint, Response, request, jsonify, send_from_directory
 
 # === 基础设施 ===
 from core.config import (
@@ -15,110 +16,174 @@ from core.context import ctx
 
 # === 工具函数 ===
 from core.utils.image import (
-    find_sidecar_image, get_default_card_image_path
+    get_default_card_image_path, render_thumbnail, THUMB_WIDTH, THUMB_FORMATS
 )
 from core.utils.filesystem import safe_move_to_trash
 
 from core.services.card_service import resolve_ui_key
+from core.services.thumbnail_service import (
+    resolve_thumbnail, card_image_path, thumb_full_path, thumb_index, collect_thumbnail_garbage, THUMB_GC_JOB,
+    pick_thumb_width, negotiate_thumb_format, thumb_builder, collect_cached_thumbnails,
+    save_thumbnail_results
+)
+from core.services.job_service import job_manager
 from core.data.ui_store import load_ui_data
 
 logger = logging.getLogger(__name__)
 
 bp = Blueprint('resources', __name__)
 
+# 带版本号 (?t=<mtime>) 的图片 URL 内容永不变化：浏览器缓存一年且无需重新验证
+IMMUTABLE_MAX_AGE = 31536000
+
+def _is_versioned(source_path):
+    """
+    请求 URL 是否带有与源文件一致的版本号 (?t=<mtime>)。
+    源文件比版本号更新时 (例如外部替换了 JSON 卡片的伴生图，而 URL 仍是旧的 t)，
+    不能声明 immutable，否则浏览器会把新内容永久缓存在旧 URL 下。
+    """
+    version = request.args.get('t')
+    if not version:
+        return False
+    try:
+        # 部分 URL 的 t 为取整后的 mtime，留 1 秒容差
+        return os.path.getmtime(source_path) <= float(version) + 1
+    except (OSError, ValueError):
+        return False
+
+def _send_cached(directory, filename, source_path, mimetype=None, etag=True):
+    """
+    发送图片文件：始终支持条件请求 (ETag / If-None-Match) 与 Range；
+    带版本号的 URL 额外声明 public, immutable 长缓存。
+    etag 为字符串时作为强 ETag 使用，否则由 Werkzeug 按 mtime/大小/路径生成。
+    """
+    versioned = _is_versioned(source_path)
+    response = send_from_directory(
+        directory, filename,
+        mimetype=mimetype,
+        etag=etag,
+        conditional=True,
+        max_age=IMMUTABLE_MAX_AGE if versioned else None
+    )
+    if versioned:
+        response.cache_control.immutable = True
+    return response
+
 @bp.route('/cards_file/<path:filename>')
 def serve_card_image(filename):
     """
     提供角色卡原图文件。
     如果请求的是 JSON 文件，会自动寻找并返回对应的伴生图片。
+    带版本号的 URL 使用长缓存，并支持条件请求与 Range。
     """
-    # 如果请求的是 JSON 文件，尝试寻找同名图片
+    # 如果请求的是 JSON 文件，返回扫描时记录的同名图片 (记录的文件已不存在时重新探测一次)
     if filename.lower().endswith('.json'):
-        full_path = os.path.join(CARDS_FOLDER, filename.replace('/', os.sep))
-        sidecar = find_sidecar_image(full_path)
+        sidecar = card_image_path(filename, verify=True)
         if sidecar:
             # 发送找到的图片
-            return send_from_directory(os.path.dirname(sidecar), os.path.basename(sidecar))
+            return _send_cached(os.path.dirname(sidecar), os.path.basename(sidecar), sidecar)
         else:
             # 找不到同名图片，返回系统默认图
             default_img = get_default_card_image_path()
             if os.path.exists(default_img):
                 return send_from_directory(os.path.dirname(default_img), os.path.basename(default_img))
             return "No image found", 404
-    
-    return send_from_directory(CARDS_FOLDER, filename)
+
+    full_path = os.path.join(CARDS_FOLDER, filename.replace('/', os.sep))
+    return _send_cached(CARDS_FOLDER, filename, full_path)
+
+def _send_thumbnail(thumb_rel, fmt, source_path):
+    """
+    发送缩略图：格式随 Accept 变化，需声明 Vary 以免中间缓存混用。
+    缩略图文件名由原图内容哈希 + 尺寸 + 格式组成，直接作为强 ETag
+    (文件 mtime 会被 LRU 访问记录刷新，不能参与 ETag)。
+    """
+    etag = os.path.basename(thumb_rel)
+    response = _send_cached(THUMB_FOLDER, thumb_rel, source_path, mimetype=THUMB_FORMATS[fmt][1], etag=etag)
+    response.vary.add('Accept')
+    return response
+
+# 缩略图生成中的响应：客户端应在该秒数后重试
+THUMB_PENDING_RETRY_AFTER = 1
+# 卡片还没有低清占位图时，用主色调 (或中性灰) 填充的 2:3 SVG 代替
+_PENDING_SVG = '<svg xmlns="http://www.w3.org/2000/svg" width="2" height="3"><rect width="2" height="3" fill="{}"/></svg>'
+
+def _send_pending_thumbnail(card_id):
+    """
+    缩略图尚在后台生成：202 + Retry-After，响应体为几百字节的占位图
+    (生成过的卡片使用列表缓存中的低清 WebP 占位图，否则为主色调色块)，不缓存。
+    """
+    card = ctx.cache.id_map.get(card_id) if ctx.cache else None
+    placeholder = card.get('placeholder') if card else None
+    body, mimetype = None, None
+    if placeholder and placeholder.startswith('data:') and ';base64,' in placeholder:
+        header, data = placeholder[5:].split(';base64,', 1)
+        try:
+            body, mimetype = base64.b64decode(data), header
+        except ValueError:
+            body = None
+    if body is None:
+        color = (card.get('dominant_color') if card else None) or '#808080'
+        body, mimetype = _PENDING_SVG.format(color).encode('ascii'), 'image/svg+xml'
+
+    response = Response(body, status=202, mimetype=mimetype)
+    response.headers['Retry-After'] = str(THUMB_PENDING_RETRY_AFTER)
+    response.cache_control.no_store = True
+    return response
 
 @bp.route('/api/thumbnail/<path:filename>')
 def serve_thumbnail(filename):
     """
-    按需生成并提供卡片缩略图。
-    - 检查 WebP 缓存是否存在且有效。
-    - 如果无效，则生成并保存为 WebP 格式。
-    - 使用 ctx.thumb_semaphore 限制并发生成数量。
+    提供卡片缩略图，请求线程不解码、不缩放图片。
+    - w 参数选择尺寸变体 (150/300/600 网格，1024 详情预览)，默认 300。
+    - 按 Accept 返回 AVIF / WebP / JPEG。
+    - 缓存按原图内容寻址，存在即有效；请求线程只查内容哈希索引，不读原图计算哈希。
+    - 未命中 (含索引尚无该原图的哈希) 时以最高优先级投递到后台 ThumbnailBuilder，
+      返回 202 + Retry-After 与几百字节的占位图 (不缓存，不会下载原图)；生成完成后同一 URL 即返回缩略图。
+    - 仅当后台生成池不可用 (未启动：关闭了预生成，或启动失败) 时才在请求线程同步生成，
+      此时使用 ctx.thumb_semaphore 限制并发。
+    - 带版本号的 URL 使用长缓存；ETag 取自内容寻址的文件名。
     """
     try:
-        # 1. 构造原始文件和缩略图缓存的路径
-        original_path = os.path.join(CARDS_FOLDER, filename.replace('/', os.sep))
-
-        # 如果是 JSON，切换目标到其 Sidecar 图片
-        if filename.lower().endswith('.json'):
-            sidecar = find_sidecar_image(original_path)
-            if not sidecar:
-                default_img = get_default_card_image_path()
-                if os.path.exists(default_img):
-                    return send_from_directory(os.path.dirname(default_img), os.path.basename(default_img))
-                return "No image found", 404
-            original_path = sidecar
-            # 使用图片文件名做 hash，避免 JSON 内容变了但图片没变导致重算
-            filename = os.path.basename(sidecar)
-
-        if not os.path.exists(original_path):
+        card_id = filename
+        width = pick_thumb_width(request.args.get('w'))
+        fmt = negotiate_thumb_format(request.accept_mimetypes)
+        if 'w' in request.args:
+            # 网格请求带有 w 参数：后台预生成随之切换到相同的尺寸/格式
+            thumb_builder.note_variant(width, fmt)
+
+        # 1. 定位原图 (JSON 卡片使用伴生图) 与按内容寻址的缩略图路径
+        # 后台生成池可用时只查索引：索引未命中的原图交给后台计算哈希，请求线程不读整个文件
+        queued = thumb_builder.running
+        original_path, thumb_rel = resolve_thumbnail(card_id, width, fmt, compute=not queued)
+        if original_path is None or (not thumb_rel and not queued):
             default_img = get_default_card_image_path()
             if os.path.exists(default_img):
                 return send_from_directory(os.path.dirname(default_img), os.path.basename(default_img))
-            return "Card not found", 404
+            return ("No image found" if original_path is None else "Card not found"), 404
 
-        # 使用原始路径的 hash 作为缓存文件名
-        normalized_name = filename.replace('\\', '/')
-        thumb_hash_name = hashlib.md5(normalized_name.encode('utf-8')).hexdigest() + ".webp"
-        thumb_path = os.path.join(THUMB_FOLDER, thumb_hash_name)
+        # 2. 缩略图按内容寻址，存在即有效；默认网格尺寸通常已由后台预生成
+        if thumb_rel and os.path.exists(thumb_full_path(thumb_rel)):
+            thumb_index.touch(thumb_rel)
+            return _send_thumbnail(thumb_rel, fmt, original_path)
 
-        # 2. 检查缓存是否有效（文件存在且比原图新）
-        if os.path.exists(thumb_path):
-            original_mtime = os.path.getmtime(original_path)
-            thumb_mtime = os.path.getmtime(thumb_path)
-            if thumb_mtime >= original_mtime:
-                return send_from_directory(THUMB_FOLDER, thumb_hash_name)
+        # 3. 未命中：交给后台生成池，先返回占位图 (不缓存，下次请求即可拿到缩略图)
+        if queued:
+            thumb_builder.request(card_id, width, fmt)
+            return _send_pending_thumbnail(card_id)
 
-        # 3. 生成缩略图 (限制并发)
+        # 4. 后备路径：生成池不可用时在请求线程同步生成 (限制并发)
         # 如果获取不到信号量（当前满载），阻塞等待
+        thumb_path = thumb_full_path(thumb_rel)
         with ctx.thumb_semaphore:
             # 再次检查（防止排队期间被别的线程生成了）
-            if os.path.exists(thumb_path) and os.path.getmtime(thumb_path) >= os.path.getmtime(original_path):
-                return send_from_directory(THUMB_FOLDER, thumb_hash_name)
-
-            with Image.open(original_path) as img:
-                # 优化：使用 draft 模式加速加载
-                img.draft('RGB', (300, 600)) 
-                
-                if img.mode in ('RGBA', 'LA'):
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    background.paste(img, mask=img.split()[-1])
-                    img = background
-                elif img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # 优化：限制最大尺寸计算
-                width, height = img.size
-                if width > 300:
-                    new_height = int(height * (300 / width))
-                    # 使用 BILINEAR 平衡速度和质量
-                    img = img.resize((300, new_height), Image.Resampling.BILINEAR)
-                
-                # 优化：生成 WebP，质量 75
-                img.save(thumb_path, 'WEBP', quality=75, method=3)
-
-        return send_from_directory(THUMB_FOLDER, thumb_hash_name)
+            if not os.path.exists(thumb_path):
+                os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+                placeholder, color = render_thumbnail(original_path, thumb_path, width, fmt)
+                # 占位图同步写入列表缓存
+                save_thumbnail_results([(card_id, placeholder, color)])
+
+        return _send_thumbnail(thumb_rel, fmt, original_path)
 
     except Exception as e:
         logger.error(f"Thumbnail generation failed for {filename}: {e}")
@@ -128,6 +193,92 @@ def serve_thumbnail(filename):
             return send_from_directory(os.path.dirname(default_img), os.path.basename(default_img))
         return "Error", 500
 
+@bp.route('/api/thumbnails/batch')
+def serve_thumbnail_batch():
+    """
+    一次返回多张已缓存的缩略图，网格整页一次往返 (参数：重复的 id，以及 w)。
+    前端按 URL 长度 (而不是卡片数) 切分请求，避免长 ID 列表超出代理/服务器的 URL 长度限制。
+    响应体：4 字节大端清单长度 + 清单 JSON + 各缩略图字节依次拼接。
+    清单：{"mime", "width", "items": [{"id", "offset", "length"}], "missing": [...], "queued"}，
+    offset 相对于清单之后。queued 为真时 missing 中的卡片已投递到后台 (计算哈希并生成)，前端稍后重试，
+    多次仍缺失再回退到单张接口；为假 (生成池不可用) 时前端直接回退到单张接口。
+    请求线程只查内容哈希索引，不读原图。
+    ETag 由各缩略图的内容寻址文件名组成，页面未变化时返回 304，不读取任何缩略图文件。
+    """
+    card_ids = request.args.getlist('id')
+    width = pick_thumb_width(request.args.get('w'))
+    fmt = negotiate_thumb_format(request.accept_mimetypes)
+    thumb_builder.note_variant(width, fmt)
+
+    found, missing = collect_cached_thumbnails(card_ids, width, fmt)
+    queued = thumb_builder.running
+    if missing and queued:
+        for card_id in missing:
+            thumb_builder.request(card_id, width, fmt)
+
+    signature = "\n".join(f"{cid}\t{rel}" for cid, rel in found) + "\n#" + "\n".join(missing) + f"\n{queued}"
+    etag = hashlib.md5(signature.encode('utf-8')).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        items, chunks, offset = [], [], 0
+        for card_id, thumb_rel in found:
+            try:
+                with open(thumb_full_path(thumb_rel), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                # 打包前被 GC 回收：按缺失处理
+                missing.append(card_id)
+                continue
+            thumb_index.touch(thumb_rel)
+            items.append({"id": card_id, "offset": offset, "length": len(data)})
+            chunks.append(data)
+            offset += len(data)
+
+        manifest = json.dumps({
+            "mime": THUMB_FORMATS[fmt][1],
+            "width": width,
+            "items": items,
+            "missing": missing,
+            "queued": queued
+        }, ensure_ascii=False).encode('utf-8')
+        response = Response(
+            b"".join([struct.pack('>I', len(manifest)), manifest] + chunks),
+            mimetype='application/octet-stream'
+        )
+
+    # 整页内容随卡片/缩略图变化，每次都需重新验证 (命中时仅 304)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    response.vary.add('Accept')
+    return response
+
+def _job_thumbnail_gc(job, params):
+    """[后台任务] 缩略图缓存 GC：清理孤立缩略图并执行磁盘预算"""
+    max_mb = params.get("max_mb")
+    stats = collect_thumbnail_garbage(
+        None if max_mb is None else int(max_mb) * 1024 * 1024,
+        progress_cb=lambda done, total: job.set_progress(done, total),
+        cancel_cb=job.is_cancelled
+    )
+    job.check_cancelled()
+    return {"success": True, **stats}
+
+job_manager.register(THUMB_GC_JOB, _job_thumbnail_gc)
+
+@bp.route('/api/thumbnails/gc', methods=['POST'])
+def api_thumbnail_gc():
+    """手动触发缩略图 GC (后台任务)；可选参数 max_mb 临时覆盖磁盘预算"""
+    try:
+        params = {}
+        max_mb = (request.get_json(silent=True) or {}).get('max_mb')
+        if max_mb is not None:
+            params["max_mb"] = max(0, int(max_mb))
+        job = job_manager.submit(THUMB_GC_JOB, params)
+        return jsonify({"success": True, "job_id": job.id, "job": job.to_dict()})
+    except Exception as e:
+        return jsonify({"success": False, "msg": str(e)})
+
 @bp.route('/resources_file/<path:subpath>')
 def serve_resource_file(subpath):
     """
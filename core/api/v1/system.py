@@ -25,12 +25,16 @@ from core.consts import SIDECAR_EXTENSIONS, RESERVED_RESOURCE_NAMES
 from core.services.scan_service import request_scan, suppress_fs_events
 from core.services.cache_service import schedule_reload, invalidate_wi_list_cache, update_card_cache
 from core.services.card_service import resolve_ui_key
+from core.services.maintenance_service import get_maintenance_status
+from core.services.hash_service import get_hash_status
+from core.services.scheduler_service import scheduler
+from core.services.thumbnail_service import thumb_builder, card_image_path
 
 # === 工具函数 ===
 from core.utils.filesystem import (
     cleanup_old_snapshots, write_snapshot_file
 )
-from core.utils.image import extract_card_info, write_card_metadata, find_sidecar_image
+from core.utils.image import extract_card_info, write_card_metadata
 
 from core.utils.hash import _calculate_data_hash
 
@@ -40,7 +44,13 @@ logger = logging.getLogger(__name__)
 
 @bp.route('/api/status')
 def api_status():
-    return jsonify(ctx.init_status)
+    return jsonify({
+        **ctx.init_status,
+        "maintenance": get_maintenance_status(),
+        "hashing": get_hash_status(),
+        "scheduler": scheduler.get_stats(),
+        "thumbnails": thumb_builder.get_status()
+    })
 
 @bp.route('/api/scan_now', methods=['POST'])
 def api_scan_now():
@@ -193,9 +203,6 @@ def api_empty_trash():
 @bp.route('/api/create_snapshot', methods=['POST'])
 def api_create_snapshot():
     try:
-        # 这里的 suppress_fs_events 依然需要，因为备份也是写文件
-        suppress_fs_events(1.0)
-        
         req_data = request.json
         target_id = req_data.get('id')
         snapshot_type = req_data.get('type', 'card') 
@@ -246,6 +253,8 @@ def api_create_snapshot():
         safe_dir_name = re.sub(r'[\\/:*?"<>|]', '_', name_no_ext).strip() or "unnamed_backup"
         target_dir = os.path.join(backups_root, safe_dir_name)
         if not os.path.exists(target_dir): os.makedirs(target_dir)
+        # 备份目录可能位于卡片目录内：登记该目录下的写入/清理为自身写入
+        suppress_fs_events(target_dir, 1.0, recursive=True)
 
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         if label:
@@ -277,7 +286,8 @@ def api_create_snapshot():
         # 注意：图片通常不会在编辑器里被修改（除非换图，但换图通常会立即保存）
         # 所以图片直接复制原文件即可
         if snapshot_type == 'card' and not is_png:
-            sidecar = find_sidecar_image(src_path)
+            card_id = os.path.relpath(src_path, CARDS_FOLDER).replace(os.sep, '/')
+            sidecar = card_image_path(card_id, verify=True)
             if sidecar:
                 sidecar_ext = os.path.splitext(sidecar)[1]
                 if label:
@@ -300,9 +310,6 @@ def api_create_snapshot():
 @bp.route('/api/smart_auto_snapshot', methods=['POST'])
 def api_smart_auto_snapshot():
     try:
-        # 自动备份涉及文件写入，抑制 watchdog
-        suppress_fs_events(1.0)
-        
         req_data = request.json
         target_id = req_data.get('id')
         snapshot_type = req_data.get('type', 'card')
@@ -378,6 +385,8 @@ def api_smart_auto_snapshot():
                     continue
 
         if not os.path.exists(target_dir): os.makedirs(target_dir)
+        # 备份目录可能位于卡片目录内：登记该目录下的写入/清理为自身写入
+        suppress_fs_events(target_dir, 1.0, recursive=True)
 
         # === 清理旧的自动快照 ===
         # 在确定 target_dir 后，写入文件前
@@ -516,7 +525,6 @@ def api_list_backups():
 @bp.route('/api/restore_backup', methods=['POST'])
 def api_restore_backup():
     try:
-        suppress_fs_events(2.0)
         backup_path = request.json.get('backup_path')
         target_id = request.json.get('target_id')
         type_ = request.json.get('type')
@@ -538,7 +546,8 @@ def api_restore_backup():
             
         if not target_path: return jsonify({"success": False, "msg": "目标路径解析失败"})
 
-        # 1. 物理覆盖 (恢复图片像素 或 JSON 内容)
+        # 1. 物理覆盖 (恢复图片像素 或 JSON 内容)，登记自身写入
+        suppress_fs_events(target_path, 2.0)
         shutil.copy2(backup_path, target_path)
         
         # 2. [关键修改] 标准化重写
@@ -581,6 +590,9 @@ def api_restore_backup():
         else:
             real_id = target_id.replace('embedded::', '') if 'embedded::' in target_id else target_id
             update_card_cache(real_id, target_path)
+            if ctx.cache:
+                # 伴生图可能随备份换了扩展名，丢弃旧记录
+                ctx.cache.forget_sidecar(real_id)
             schedule_reload(reason="restore_backup")
 
         return jsonify({"success": True})
@@ -13,6 +13,7 @@ from core.context import ctx
 from core.data.db_session import get_db
 from core.data.ui_store import load_ui_data, UI_DATA_FILE
 from core.services.cache_service import invalidate_wi_list_cache
+from core.services.job_service import job_manager
 from core.utils.filesystem import safe_move_to_trash
 
 def _safe_mtime(path: str) -> float:
@@ -23,6 +24,7 @@ def _safe_mtime(path: str) -> float:
 
 # === 工具函数 ===
 from core.utils.image import extract_card_info # 用于 export logic
+from core.utils.walker import iter_files
 
 logger = logging.getLogger(__name__)
 
@@ -96,42 +98,41 @@ def api_list_world_infos():
 
         # 1. 全局目录 (Global)
         if wi_type in ['all', 'global']:
-            for root, dirs, files in os.walk(current_wi_folder):
-                for f in files:
-                    if f.lower().endswith('.json'):
-                        full_path = os.path.join(root, f)
-                        try:
-                            if os.path.getsize(full_path) == 0: continue
-                            # 简单读取 header，不读取全部 entries 以优化性能
-                            # 如果文件巨大，可以考虑只读前几KB解析
-                            with open(full_path, 'r', encoding='utf-8') as f_obj:
-                                data = json.load(f_obj)
-                                # 兼容 list 或 dict
-                                file_name = os.path.basename(f)
-                                base_name = os.path.splitext(file_name)[0]
-                                name_source = "filename"
-                                if isinstance(data, dict):
-                                    name_val = (data.get('name') or "").strip()
-                                    if name_val:
-                                        name = name_val
-                                        name_source = "meta"
-                                    else:
-                                        name = file_name  # 显示含扩展名，更像“文件”
-                                else:
-                                    name = file_name
-                                    
-                                items.append({
-                                    "id": f"global::{os.path.relpath(full_path, current_wi_folder)}",
-                                    "type": "global",
-                                    "name": name,
-                                    "name_source": name_source,
-                                    "file_name": file_name,
-                                    "path": full_path,
-                                    "mtime": os.path.getmtime(full_path)
-                                })
-                        except Exception as e: 
-                            print(f"Error reading WI {f}: {e}")
-                            continue
+            is_json = lambda n: n.lower().endswith('.json')
+            for entry in iter_files(current_wi_folder, file_filter=is_json):
+                f = entry.name
+                full_path = entry.path
+                try:
+                    if entry.size == 0: continue
+                    # 简单读取 header，不读取全部 entries 以优化性能
+                    # 如果文件巨大，可以考虑只读前几KB解析
+                    with open(full_path, 'r', encoding='utf-8') as f_obj:
+                        data = json.load(f_obj)
+                        # 兼容 list 或 dict
+                        file_name = f
+                        name_source = "filename"
+                        if isinstance(data, dict):
+                            name_val = (data.get('name') or "").strip()
+                            if name_val:
+                                name = name_val
+                                name_source = "meta"
+                            else:
+                                name = file_name  # 显示含扩展名，更像“文件”
+                        else:
+                            name = file_name
+                            
+                        items.append({
+                            "id": f"global::{entry.rel_path.replace('/', os.sep)}",
+                            "type": "global",
+                            "name": name,
+                            "name_source": name_source,
+                            "file_name": file_name,
+                            "path": full_path,
+                            "mtime": entry.mtime
+                        })
+                except Exception as e: 
+                    print(f"Error reading WI {f}: {e}")
+                    continue
 
         # 2. 资源目录 (Resource) - 基于 ui_data 查找自定义路径
         if wi_type in ['all', 'resource']:
@@ -171,36 +172,36 @@ def api_list_world_infos():
                 scanned_paths.add(lore_dir)
                 
                 if os.path.exists(lore_dir):
-                    for f in os.listdir(lore_dir):
-                        if f.lower().endswith('.json'):
-                            full_path = os.path.join(lore_dir, f)
-                            try:
-                                with open(full_path, 'r', encoding='utf-8') as f_obj:
-                                    data = json.load(f_obj)
-                                    file_name = os.path.basename(f)
-                                    base_name = os.path.splitext(file_name)[0]
-                                    name_source = "filename"
-                                    if isinstance(data, dict):
-                                        name_val = (data.get('name') or "").strip()
-                                        if name_val:
-                                            name = name_val
-                                            name_source = "meta"
-                                        else:
-                                            name = file_name
+                    for entry in iter_files(lore_dir, file_filter=lambda n: n.lower().endswith('.json'), max_depth=0):
+                        f = entry.name
+                        full_path = entry.path
+                        try:
+                            with open(full_path, 'r', encoding='utf-8') as f_obj:
+                                data = json.load(f_obj)
+                                file_name = os.path.basename(f)
+                                base_name = os.path.splitext(file_name)[0]
+                                name_source = "filename"
+                                if isinstance(data, dict):
+                                    name_val = (data.get('name') or "").strip()
+                                    if name_val:
+                                        name = name_val
+                                        name_source = "meta"
                                     else:
                                         name = file_name
-                                    items.append({
-                                        "id": f"resource::{key}::{f}",
-                                        "type": "resource",
-                                        "name": name,
-                                        "name_source": name_source,
-                                        "file_name": file_name,
-                                        "path": full_path,
-                                        "card_name": card['char_name'], # 关联的角色名
-                                        "card_id": card['id'], # 用于跳转
-                                        "mtime": os.path.getmtime(full_path)
-                                    })
-                            except: continue
+                                else:
+                                    name = file_name
+                                items.append({
+                                    "id": f"resource::{key}::{f}",
+                                    "type": "resource",
+                                    "name": name,
+                                    "name_source": name_source,
+                                    "file_name": file_name,
+                                    "path": full_path,
+                                    "card_name": card['char_name'], # 关联的角色名
+                                    "card_id": card['id'], # 用于跳转
+                                    "mtime": entry.mtime
+                                })
+                        except: continue
 
         # 3. 角色卡内嵌 (Embedded) - 查询数据库
         if wi_type in ['all', 'embedded']:
@@ -374,99 +375,113 @@ def api_save_world_info():
     except Exception as e:
         return jsonify({"success": False, "msg": str(e)})
 
-@bp.route('/api/tools/migrate_lorebooks', methods=['POST'])
-def api_migrate_lorebooks():
+def _job_migrate_lorebooks(job, params):
     """
-    一键整理：遍历所有卡片的资源目录，将根目录下的 json 世界书移动到 lorebooks 子目录
+    [后台任务] 一键整理：遍历所有卡片的资源目录，将根目录下的 json 世界书移动到 lorebooks 子目录
+    已移动的文件不会再出现在资源目录根下，因此任务可以安全地重复执行/恢复。
     """
-    try:
-        cfg = load_config()
-        default_res_dir = os.path.join(BASE_DIR, cfg.get('resources_dir', 'resources'))
-        ui_data = load_ui_data()
-        
-        # 获取所有涉及的资源目录路径 (去重)
-        target_res_dirs = set()
+    cfg = load_config()
+    default_res_dir = os.path.join(BASE_DIR, cfg.get('resources_dir', 'resources'))
+    ui_data = load_ui_data()
+    
+    # 获取所有涉及的资源目录路径 (去重)
+    target_res_dirs = set()
+    
+    # 1. 扫描 resources/ 根目录下的文件夹
+    if os.path.exists(default_res_dir):
+        for d in os.listdir(default_res_dir):
+            full = os.path.join(default_res_dir, d)
+            if os.path.isdir(full): target_res_dirs.add(full)
+
+    # 2. 扫描卡片指定的自定义路径
+    if not ctx.cache.initialized: ctx.cache.reload_from_db()
+    for card in ctx.cache.cards:
+        res_folder = card.get('resource_folder')
+        if not res_folder:
+            # 尝试从 ui_data 获取
+            key = card.get('bundle_dir') if card.get('is_bundle') else card['id']
+            res_folder = ui_data.get(key, {}).get('resource_folder')
         
-        # 1. 扫描 resources/ 根目录下的文件夹
-        if os.path.exists(default_res_dir):
-            for d in os.listdir(default_res_dir):
-                full = os.path.join(default_res_dir, d)
-                if os.path.isdir(full): target_res_dirs.add(full)
-
-        # 2. 扫描卡片指定的自定义路径
-        if not ctx.cache.initialized: ctx.cache.reload_from_db()
-        for card in ctx.cache.cards:
-            res_folder = card.get('resource_folder')
-            if not res_folder:
-                # 尝试从 ui_data 获取
-                key = card.get('bundle_dir') if card.get('is_bundle') else card['id']
-                res_folder = ui_data.get(key, {}).get('resource_folder')
-            
-            if res_folder:
-                if os.path.isabs(res_folder):
-                    if os.path.exists(res_folder): target_res_dirs.add(res_folder)
-                else:
-                    full = os.path.join(default_res_dir, res_folder)
-                    if os.path.exists(full): target_res_dirs.add(full)
+        if res_folder:
+            if os.path.isabs(res_folder):
+                if os.path.exists(res_folder): target_res_dirs.add(res_folder)
+            else:
+                full = os.path.join(default_res_dir, res_folder)
+                if os.path.exists(full): target_res_dirs.add(full)
 
-        moved_count = 0
+    moved_count = 0
+    target_res_dirs = sorted(target_res_dirs)
+    job.set_progress(0, len(target_res_dirs))
+    
+    for idx, res_path in enumerate(target_res_dirs, start=1):
+        if job.is_cancelled():
+            break
+        job.set_progress(idx, len(target_res_dirs))
+        lore_target_dir = os.path.join(res_path, 'lorebooks')
         
-        for res_path in target_res_dirs:
-            lore_target_dir = os.path.join(res_path, 'lorebooks')
-            
-            # 扫描该资源目录根下的文件
-            try:
-                files = os.listdir(res_path)
-            except:
-                continue
+        # 扫描该资源目录根下的文件
+        try:
+            files = os.listdir(res_path)
+        except:
+            continue
 
-            for f in files:
-                if f.lower().endswith('.json'):
-                    src_path = os.path.join(res_path, f)
-                    if not os.path.isfile(src_path): continue
+        for f in files:
+            if f.lower().endswith('.json'):
+                src_path = os.path.join(res_path, f)
+                if not os.path.isfile(src_path): continue
 
-                    # 检查是否为有效 WI
-                    try:
-                        with open(src_path, 'r', encoding='utf-8') as f_obj:
-                            try:
-                                data = json.load(f_obj)
-                            except: continue # JSON 解析失败跳过
-
-                            is_wi = False
-                            # 判定标准
-                            if isinstance(data, dict) and 'entries' in data: is_wi = True
-                            elif isinstance(data, list) and len(data) > 0:
-                                # 检查第一项是否有 keys 或 key，防止把其他配置json误判
-                                first = data[0]
-                                if isinstance(first, dict) and ('keys' in first or 'key' in first):
-                                    is_wi = True
+                # 检查是否为有效 WI
+                try:
+                    with open(src_path, 'r', encoding='utf-8') as f_obj:
+                        try:
+                            data = json.load(f_obj)
+                        except: continue # JSON 解析失败跳过
+
+                        is_wi = False
+                        # 判定标准
+                        if isinstance(data, dict) and 'entries' in data: is_wi = True
+                        elif isinstance(data, list) and len(data) > 0:
+                            # 检查第一项是否有 keys 或 key，防止把其他配置json误判
+                            first = data[0]
+                            if isinstance(first, dict) and ('keys' in first or 'key' in first):
+                                is_wi = True
+                        
+                        if is_wi:
+                            if not os.path.exists(lore_target_dir):
+                                os.makedirs(lore_target_dir)
                             
-                            if is_wi:
-                                if not os.path.exists(lore_target_dir):
-                                    os.makedirs(lore_target_dir)
-                                
-                                dst_path = os.path.join(lore_target_dir, f)
-                                # 防重名
-                                if os.path.exists(dst_path):
-                                    if os.path.samefile(src_path, dst_path): continue
-                                    base, ext = os.path.splitext(f)
-                                    dst_path = os.path.join(lore_target_dir, f"{base}_{int(time.time())}{ext}")
-                                
-                                # 执行移动
-                                try:
-                                    # 1. 尝试移动
-                                    shutil.move(src_path, dst_path)               
-                                    moved_count += 1
-                                except Exception as move_err:
-                                    print(f"Move failed for {f}: {move_err}")
-                                    # 尝试回滚或忽略，防止数据丢失
-                                    continue
-                    except Exception as e:
-                        print(f"Error checking file {src_path}: {e}")
-                        continue
-        
-        invalidate_wi_list_cache()
-        return jsonify({"success": True, "count": moved_count})
+                            dst_path = os.path.join(lore_target_dir, f)
+                            # 防重名
+                            if os.path.exists(dst_path):
+                                if os.path.samefile(src_path, dst_path): continue
+                                base, ext = os.path.splitext(f)
+                                dst_path = os.path.join(lore_target_dir, f"{base}_{int(time.time())}{ext}")
+                            
+                            # 执行移动
+                            try:
+                                # 1. 尝试移动
+                                shutil.move(src_path, dst_path)               
+                                moved_count += 1
+                            except Exception as move_err:
+                                print(f"Move failed for {f}: {move_err}")
+                                # 尝试回滚或忽略，防止数据丢失
+                                continue
+                except Exception as e:
+                    print(f"Error checking file {src_path}: {e}")
+                    continue
+    
+    invalidate_wi_list_cache()
+    job.check_cancelled()
+    return {"success": True, "count": moved_count}
+
+job_manager.register('migrate_lorebooks', _job_migrate_lorebooks)
+
+@bp.route('/api/tools/migrate_lorebooks', methods=['POST'])
+def api_migrate_lorebooks():
+    """提交世界书整理任务 (后台执行，通过 /api/jobs/<id> 查询进度)"""
+    try:
+        job = job_manager.submit('migrate_lorebooks')
+        return jsonify({"success": True, "job_id": job.id, "job": job.to_dict()})
     except Exception as e:
         logger.error(f"Migrate error: {e}")
         return jsonify({"success": False, "msg": str(e)})
@@ -61,6 +61,40 @@ DEFAULT_CONFIG = {
     # 是否启用自动文件系统监听（watchdog）以触发扫描
     # 设为 False 时，仅保留后台扫描线程，手动触发的扫描任务仍然有效
     "enable_auto_scan": True,
+
+    # 各资料库根目录的变动检测方式：auto | watchdog | poll | off (也可直接写一个字符串作用于全部根目录)
+    # auto: 网络文件系统 (SMB/NFS 等，收不到其它机器修改的 inotify 事件) 使用轮询，本地磁盘使用 watchdog
+    "fs_watch_mode": {"cards_dir": "auto"},
+    # 轮询模式参数：有变动后按最短间隔检测，空闲时逐步放宽到最长间隔 (秒)
+    "poll_interval_min": 5,
+    "poll_interval_max": 120,
+    # 轮询时每秒最多的目录 stat/scandir 次数，避免占满网络共享
+    "poll_io_rate": 200,
+    # 轮询模式下的兜底全量扫描间隔 (秒)，用于发现原地改写的文件；0 表示关闭
+    "poll_full_scan_interval": 900,
+
+    # 是否在应用空闲时执行后台数据库维护 (WAL checkpoint / ANALYZE / 增量 VACUUM)
+    "enable_db_maintenance": True,
+
+    # 是否启用后台哈希线程 (补算 file_hash、计算查重用的内容哈希与头像感知哈希)
+    "enable_content_hasher": True,
+
+    # 是否在扫描/上传/导入后于后台预生成缩略图 (优先当前浏览的文件夹)
+    "thumb_pregenerate": True,
+    # 预生成工作进程数，0 表示自动 (CPU 核数 - 1，最多 4)
+    "thumb_workers": 0,
+    # 是否使用进程池 (绕过 GIL)；设为 False 时使用线程池
+    "thumb_use_processes": True,
+    # 浏览器声明支持时是否返回 AVIF 缩略图 (需要 Pillow 支持 AVIF 编码)
+    "thumb_avif": True,
+    # 缩略图缓存的磁盘预算 (MB)，超出时按最近访问时间淘汰；0 表示不限
+    "thumb_cache_max_mb": 2048,
+    # 缩略图 GC (清理孤立缩略图 + 执行预算) 的执行间隔 (小时)；0 表示只手动触发
+    "thumb_gc_interval_hours": 24,
+
+    # 目录遍历的忽略规则 (fnmatch 通配符)：扫描器、缓存重建、首次导入与世界书列表共用
+    # 匹配文件/目录名；包含 / 的规则匹配相对卡片目录的路径 (如 "drafts/*")
+    "scan_ignore_patterns": [".*", "*.tmp", "*.part", "*.crdownload", "~$*", "Thumbs.db", "desktop.ini"],
 }
 
 def load_config():
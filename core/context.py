@@ -1,3 +1,4 @@
+import os
 import threading
 import queue
 import time
@@ -28,7 +29,8 @@ class AppContext:
             "status": "initializing", # initializing, processing, ready
             "message": "正在初始化...",
             "progress": 0,
-            "total": 0
+            "total": 0,
+            "rate": 0       # 首次导入的吞吐量 (张/秒)
         }
 
         # === 扫描器状态 (原 scan_queue, scan_active) ===
@@ -36,27 +38,58 @@ class AppContext:
         self.scan_queue = queue.Queue()
         self.scan_active = False
         
+        # 扫描逻辑是否正在执行 (scan_active 仅表示扫描线程存活)
+        self.scan_in_progress = False
+        
         # === 扫描防抖 (原 _scan_debounce_*) ===
         # 防止短时间内大量文件变动触发多次全量扫描
+        # 防抖计时由统一调度器完成 (见 scheduler_service)，这里只保存累积的请求
         self.scan_debounce_lock = threading.Lock()
-        self.scan_debounce_timer = None
+        # 防抖窗口内累积的定向扫描目录；窗口内出现过全量请求时合并为一次全量扫描
+        self.scan_pending_dirs = set()
+        self.scan_pending_full = False
+        # 轮询检测器 (网络文件系统模式下启用，见 poll_service)
+        self.fs_poller = None
 
         # === 并发控制 (原 thumb_semaphore) ===
         # 限制图片缩略图生成的并发数，防止 CPU/IO 过载 (默认 4)
         self.thumb_semaphore = threading.Semaphore(4)
 
         # === 缓存重载防抖 (原 _reload_*) ===
-        # 0.5~1s 内多次 reload 请求合并为一次
+        # 0.5~1s 内多次 reload 请求合并为一次 (计时由统一调度器完成)
         self.reload_lock = threading.Lock()
-        self.reload_timer = None
         self.reload_pending = False
         self.reload_last_reason = ""
 
         # === 文件系统监听抑制 (原 _fs_ignore_*) ===
-        # 当本程序主动修改文件时，抑制 watchdog 事件，避免死循环
-        self.fs_ignore_until = 0.0
+        # 本程序即将写入的路径登记表：只抑制与自身写入匹配的 watchdog 事件，
+        # 其它 (外部) 变动照常进入定向扫描
+        # 规范化路径 -> [过期时间, 期望 mtime 或 None, 是否包含子树]
+        self.fs_self_writes = {}
         self.fs_ignore_lock = threading.Lock()
 
+        # === 请求活跃度 ===
+        # 用于判断应用是否空闲，空闲时才执行后台数据库维护
+        self.active_requests = 0
+        self.last_request_time = time.time()
+        self.activity_lock = threading.Lock()
+
+        # === 数据库维护状态 ===
+        # 记录每项维护任务最近一次的执行时间与耗时，供 /api/status 展示
+        self.maintenance_status = {
+            "running": None,
+            "tasks": {}
+        }
+        self.maintenance_lock = threading.Lock()
+
+        # === 后台哈希进度 ===
+        # 各阶段 (file_hash 补算 / 全量内容哈希 / 感知哈希) 的待处理与已完成数量，供 /api/status 展示
+        self.hash_status = {
+            "running": None,
+            "phases": {}
+        }
+        self.hash_status_lock = threading.Lock()
+
         # === 世界书列表缓存 (原 wi_list_cache) ===
         # 避免频繁扫描磁盘读取大 JSON
         self.wi_list_cache = {}
@@ -72,7 +105,7 @@ class AppContext:
         """
         self.cache = GlobalMetadataCache()
 
-    def set_status(self, status: str = None, message: str = None, progress: int = None, total: int = None):
+    def set_status(self, status: str = None, message: str = None, progress: int = None, total: int = None, rate: float = None):
         """辅助方法：更新应用启动状态"""
         if status is not None:
             self.init_status['status'] = status
@@ -82,16 +115,80 @@ class AppContext:
             self.init_status['progress'] = progress
         if total is not None:
             self.init_status['total'] = total
+        if rate is not None:
+            self.init_status['rate'] = rate
 
-    def update_fs_ignore(self, seconds: float = 1.5):
-        """辅助方法：设置文件系统事件忽略时间窗口"""
+    def register_self_writes(self, paths, seconds: float = 1.5, recursive: bool = False):
+        """辅助方法：登记本进程即将写入/移动/删除的路径，seconds 后过期"""
+        expires = time.time() + float(seconds)
         with self.fs_ignore_lock:
-            self.fs_ignore_until = max(self.fs_ignore_until, time.time() + float(seconds))
+            self._prune_self_writes()
+            for p in paths:
+                key = os.path.normcase(os.path.abspath(p))
+                entry = self.fs_self_writes.get(key)
+                if entry:
+                    entry[0] = max(entry[0], expires)
+                    entry[2] = entry[2] or recursive
+                else:
+                    self.fs_self_writes[key] = [expires, None, recursive]
 
-    def should_ignore_fs_event(self) -> bool:
-        """辅助方法：检查当前是否应该忽略文件系统事件"""
+    def record_self_write_mtime(self, path, mtime):
+        """辅助方法：写入完成后记录文件的实际 mtime；之后 mtime 不同的事件视为外部修改"""
+        key = os.path.normcase(os.path.abspath(path))
         with self.fs_ignore_lock:
-            return time.time() < self.fs_ignore_until
+            entry = self.fs_self_writes.get(key)
+            if entry:
+                entry[1] = mtime
+
+    def is_self_write(self, path) -> bool:
+        """辅助方法：检查文件系统事件的路径是否来自本进程登记的写入"""
+        key = os.path.normcase(os.path.abspath(path))
+        now = time.time()
+        with self.fs_ignore_lock:
+            entry = self.fs_self_writes.get(key)
+            if entry and entry[0] > now:
+                if entry[1] is None:
+                    return True
+                try:
+                    return os.path.getmtime(path) == entry[1]
+                except OSError:
+                    return True  # 已被移走/删除 (本进程的后续操作)
+            # 登记为目录子树的操作 (文件夹移动/删除等)
+            parent = key
+            while True:
+                parent, tail = os.path.split(parent)
+                if not tail:
+                    return False
+                entry = self.fs_self_writes.get(parent)
+                if entry and entry[2] and entry[0] > now:
+                    return True
+
+    def _prune_self_writes(self):
+        now = time.time()
+        expired = [k for k, v in self.fs_self_writes.items() if v[0] <= now]
+        for k in expired:
+            del self.fs_self_writes[k]
+
+    def mark_request_start(self):
+        """辅助方法：记录一个请求开始"""
+        with self.activity_lock:
+            self.active_requests += 1
+            self.last_request_time = time.time()
+
+    def mark_request_end(self):
+        """辅助方法：记录一个请求结束"""
+        with self.activity_lock:
+            self.active_requests = max(0, self.active_requests - 1)
+            self.last_request_time = time.time()
+
+    def is_idle(self, idle_seconds: float = 60.0) -> bool:
+        """辅助方法：无进行中的请求、最近 idle_seconds 内无请求且没有扫描在执行"""
+        if self.scan_in_progress:
+            return False
+        with self.activity_lock:
+            if self.active_requests > 0:
+                return False
+            return (time.time() - self.last_request_time) >= idle_seconds
 
 # 全局单例实例
 ctx = AppContext()
\ No newline at end of file
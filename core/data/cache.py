@@ -1,6 +1,5 @@
 import threading
 import sqlite3
-import json
 import os
 import time
 import logging
@@ -10,6 +9,10 @@ from urllib.parse import quote
 from core.config import CARDS_FOLDER, DEFAULT_DB_PATH
 from core.data.db_session import execute_with_retry
 from core.data.ui_store import load_ui_data
+from core.data.tag_index import load_tags_by_card
+from core.data.card_placeholder import load_placeholders
+from core.utils.walker import scan_tree
+from core.utils.image import find_sidecar_image
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +29,7 @@ class GlobalMetadataCache:
         self.global_tags = set()        # 全局标签池
         self.category_counts = {}       # 分类计数 (路径 -> 数量)
         self.visible_folders = []       # 可见的文件夹列表 (用于前端目录树)
+        self.sidecars = {}              # JSON 卡片 ID (含 Bundle 历史版本) -> 伴生图扩展名，'' 表示没有
         self.lock = threading.Lock()    # 读写锁
         self.initialized = False        # 是否已加载完成
 
@@ -112,6 +116,7 @@ class GlobalMetadataCache:
                 card['thumb_url'] = f"/api/thumbnail/{encoded_id}?t={mtime}"
 
                 self.id_map[new_id] = card
+                self._move_sidecar(old_id, new_id)
 
             # 3. 重算计数 (全量重算最稳妥)
             self._recalculate_counts()
@@ -127,6 +132,57 @@ class GlobalMetadataCache:
                     new_visible.append(f)
             self.visible_folders = sorted(new_visible)
 
+    def merge_folder_update(self, id_mapping, old_path_prefix, new_path_prefix, source_removed=True):
+        """
+        [增量更新] 文件夹合并：按 old_id -> new_id 映射批量重命名卡片 (合并时可能因重名而改名)。
+        返回不在缓存中的旧 ID 列表，调用方可据此决定是否重载。
+        """
+        missing = []
+        with self.lock:
+            listed = {id(c) for c in self.cards}
+            for old_id, new_id in id_mapping.items():
+                card = self.id_map.pop(old_id, None)
+                if card is None:
+                    # 已按新 ID 存在 (重复应用同一映射，或扫描已重新索引) 时无需重载
+                    if new_id not in self.id_map:
+                        missing.append(old_id)
+                    continue
+
+                new_cat = new_id.rsplit('/', 1)[0] if '/' in new_id else ""
+                if id(card) in listed and card['category'] != new_cat:
+                    self._update_category_count(card['category'], -1)
+                    self._update_category_count(new_cat, 1)
+
+                card['id'] = new_id
+                card['category'] = new_cat
+                if 'filename' in card:
+                    card['filename'] = new_id.rsplit('/', 1)[-1]
+
+                encoded_id = quote(new_id)
+                mtime = card.get('last_modified', 0)
+                card['image_url'] = f"/cards_file/{encoded_id}?t={mtime}"
+                card['thumb_url'] = f"/api/thumbnail/{encoded_id}?t={mtime}"
+
+                self.id_map[new_id] = card
+                self._move_sidecar(old_id, new_id)
+
+            # 源目录下的子文件夹映射到目标目录下
+            old_prefix = old_path_prefix + '/'
+            visible = set()
+            for f in self.visible_folders:
+                if f == old_path_prefix or f.startswith(old_prefix):
+                    mapped = new_path_prefix + f[len(old_path_prefix):]
+                    visible.add(mapped)
+                    self.category_counts.setdefault(mapped, 0)
+                    if not source_removed:
+                        visible.add(f)
+                    else:
+                        self.category_counts.pop(f, None)
+                else:
+                    visible.add(f)
+            self.visible_folders = sorted(visible)
+        return missing
+
     def rename_folder_update(self, old_path, new_path):
         """[增量更新] 文件夹重命名 (逻辑与 move 类似，但包含本身)"""
         # 复用 move 逻辑，但需要处理 folder 本身作为前缀的情况
@@ -145,6 +201,36 @@ class GlobalMetadataCache:
                     temp_tags.add(t)
                 self.global_tags = sorted(list(temp_tags))
 
+    def bulk_update_tags(self, updates):
+        """
+        [增量更新] 批量更新标签，全局标签池只重算一次。
+        updates: [{"id": ..., "tags": [...], "last_modified": ...}, ...]
+        返回不在缓存中的卡片 ID 列表 (如 Bundle 的非主版本)，调用方可据此决定是否重载。
+        """
+        missing = []
+        with self.lock:
+            for item in updates:
+                card = self.id_map.get(item['id'])
+                if card is None:
+                    missing.append(item['id'])
+                    continue
+                card['tags'] = item['tags']
+                mtime = item.get('last_modified')
+                if mtime:
+                    card['last_modified'] = mtime
+                    # 文件已改写：旧 file_hash 失效，等待后台补算 (见 update_file_hashes)
+                    card['file_hash'] = ''
+                    encoded_id = quote(card['id'])
+                    card['image_url'] = f"/cards_file/{encoded_id}?t={int(mtime)}"
+                    card['thumb_url'] = f"/api/thumbnail/{encoded_id}?t={int(mtime)}"
+
+            # 删除/重命名后旧标签可能已无人使用，因此全量重算而不是只做并集
+            new_global_tags = set()
+            for c in self.cards:
+                new_global_tags.update(c.get('tags', []))
+            self.global_tags = sorted(new_global_tags)
+        return missing
+
     def move_card_update(self, old_id, new_id, old_category, new_category, new_filename, full_path):
         """[增量更新] 单卡移动/重命名"""
         with self.lock:
@@ -166,6 +252,7 @@ class GlobalMetadataCache:
                 card['thumb_url'] = f"/api/thumbnail/{encoded_id}?t={mtime}"
                 
                 self.id_map[new_id] = card
+                self._move_sidecar(old_id, new_id)
                 
                 if old_category != new_category:
                     self._update_category_count(old_category, -1)
@@ -212,6 +299,7 @@ class GlobalMetadataCache:
     def delete_card_update(self, card_id):
         """[增量更新] 删除卡片"""
         with self.lock:
+            self._forget_sidecars((card_id,))
             if card_id in self.id_map:
                 card = self.id_map.pop(card_id)
                 if card in self.cards:
@@ -240,11 +328,48 @@ class GlobalMetadataCache:
             if found_main:
                 self._update_category_count(category, -1)
 
+    def delete_cards_bulk_update(self, card_ids=(), bundle_dirs=()):
+        """
+        [增量更新] 批量删除卡片与 Bundle。
+        只遍历一次 id_map、重建一次 cards 列表，分类计数按分类聚合后一次性扣减。
+        返回实际移除的 ID 集合。
+        """
+        with self.lock:
+            remove_ids = {cid for cid in card_ids if cid in self.id_map}
+            self._forget_sidecars(card_ids)
+            bundle_set = set(bundle_dirs)
+            if bundle_set:
+                prefixes = tuple(b + '/' for b in bundle_set)
+                self._forget_sidecars([cid for cid in self.sidecars if cid.startswith(prefixes)])
+                for cid, card in self.id_map.items():
+                    if cid.startswith(prefixes) or (card.get('is_bundle') and card.get('bundle_dir') in bundle_set):
+                        remove_ids.add(cid)
+            if not remove_ids:
+                return remove_ids
+
+            removed_cats = {}
+            for cid in remove_ids:
+                self.id_map.pop(cid, None)
+
+            kept = []
+            for card in self.cards:
+                if card['id'] in remove_ids:
+                    cat = card['category']
+                    removed_cats[cat] = removed_cats.get(cat, 0) + 1
+                else:
+                    kept.append(card)
+            self.cards = kept
+
+            for cat, n in removed_cats.items():
+                self._update_category_count(cat, -n)
+        return remove_ids
+
     def add_card_update(self, new_card_data):
         """[增量更新] 新增卡片"""
         with self.lock:
             self.cards.append(new_card_data)
             self.id_map[new_card_data['id']] = new_card_data
+            self._forget_sidecars((new_card_data['id'],))
             
             self._update_category_count(new_card_data['category'], 1)
             
@@ -287,50 +412,43 @@ class GlobalMetadataCache:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT id, char_name, tags, category, creator, 
-                       char_version, last_modified, file_hash, token_count, is_favorite
+                SELECT id, char_name, category, creator, 
+                       char_version, last_modified, file_hash, token_count, is_favorite, sidecar_ext
                 FROM card_metadata
             """)
             rows = cursor.fetchall()
+            # 标签直接读取规范化索引，免去逐行 json.loads
+            tags_by_card = load_tags_by_card(conn)
+            placeholders = load_placeholders(conn)
             conn.close()
-            return rows
+            return rows, tags_by_card, placeholders
 
         with self.lock:
             try:
+                # 一次遍历同时发现物理文件夹与 .bundle 标记 (隐藏目录等按忽略规则排除)
                 physical_folders = set()
+                marked_bundle_dirs = set()
                 try:
-                    for root, dirs, files in os.walk(CARDS_FOLDER):
-                        # 排除以 . 开头的隐藏目录 (如 .trash, .git)
-                        dirs[:] = [d for d in dirs if not d.startswith('.')]
-                        
-                        # 计算相对路径
-                        rel_path = os.path.relpath(root, CARDS_FOLDER)
-                        if rel_path == ".":
-                            # 根目录下的子文件夹
-                            for d in dirs:
-                                physical_folders.add(d)
-                        else:
-                            # 子目录下的子文件夹
-                            current_rel = rel_path.replace('\\', '/')
-                            physical_folders.add(current_rel)
-                            for d in dirs:
-                                physical_folders.add(f"{current_rel}/{d}")
+                    tree = scan_tree(CARDS_FOLDER, collect_files=False)
+                    physical_folders.update(tree.folders)
+                    marked_bundle_dirs = tree.bundle_dirs
                 except Exception as fs_e:
                     logger.error(f"Scanning physical folders failed: {fs_e}")
 
                 # 1. 加载数据
                 ui_data = load_ui_data()
-                rows = execute_with_retry(_do_fetch_all, max_retries=5)
+                rows, tags_by_card, placeholders = execute_with_retry(_do_fetch_all, max_retries=5)
                 
                 raw_cards = []
+                new_sidecars = {}
                 for row in rows:
-                    try: 
-                        tags = json.loads(row['tags']) if row['tags'] else []
-                    except: 
-                        tags = []
+                    tags = tags_by_card.get(row['id'], [])
                     
                     card_id = row['id'].replace('\\', '/')
                     dir_path = card_id.rsplit('/', 1)[0] if '/' in card_id else ""
+                    placeholder, dominant_color = placeholders.get(row['id'], (None, None))
+                    if row['sidecar_ext'] is not None:
+                        new_sidecars[card_id] = row['sidecar_ext']
 
                     card_data = {
                         "id": card_id,
@@ -347,20 +465,15 @@ class GlobalMetadataCache:
                         "is_bundle": False, 
                         "versions": [],
                         "is_favorite": bool(row['is_favorite']),
+                        "placeholder": placeholder,
+                        "dominant_color": dominant_color,
                     }
                     raw_cards.append(card_data)
 
                 # 2. 处理 Bundle 聚合逻辑
-                bundle_dirs = set()
+                # .bundle 标记已在目录遍历时收集，只保留确实含有卡片的目录
                 unique_dirs = set(c['dir_path'] for c in raw_cards)
-                
-                # 扫描文件系统确认 .bundle 标记 (这步可能略慢，但通常文件夹不多)
-                for d in unique_dirs:
-                    if not d: continue
-                    sys_path_d = d.replace('/', os.sep)
-                    full_dir_path = os.path.join(CARDS_FOLDER, sys_path_d)
-                    if os.path.exists(os.path.join(full_dir_path, '.bundle')):
-                        bundle_dirs.add(d)
+                bundle_dirs = marked_bundle_dirs & unique_dirs
 
                 final_cards = []
                 bundles = {}
@@ -427,6 +540,7 @@ class GlobalMetadataCache:
                 self.cards = final_cards
                 self.id_map = {c['id']: c for c in final_cards}
                 self.bundle_map = new_bundle_map
+                self.sidecars = new_sidecars
                 self.global_tags = sorted(list(new_global_tags))
                 self.category_counts = new_cat_counts
                 all_visible = derived_folders.union(physical_folders)
@@ -448,6 +562,55 @@ class GlobalMetadataCache:
                 logger.error(f"Cache reload error: {e}")
                 # 保持旧数据，防止应用崩溃
 
+    def update_file_hashes(self, hashes):
+        """[增量更新] 批量写入后台补算的 file_hash: {card_id: file_hash}"""
+        with self.lock:
+            for card_id, file_hash in hashes.items():
+                card = self.id_map.get(card_id)
+                if card is not None:
+                    card['file_hash'] = file_hash
+
+    def update_placeholders(self, entries):
+        """[增量更新] 批量写入缩略图生成时算出的占位图: {card_id: (placeholder, color)}"""
+        with self.lock:
+            for card_id, (placeholder, color) in entries.items():
+                card = self.id_map.get(card_id)
+                if card is not None:
+                    card['placeholder'] = placeholder
+                    card['dominant_color'] = color
+
+    def sidecar_path(self, card_id, verify=False):
+        """
+        JSON 卡片伴生图的完整路径，没有伴生图时返回 None。
+        直接使用扫描时记录的扩展名，不探测磁盘；尚未记录 (刚写入的新卡片) 时探测一次并记住。
+        verify=True 时确认记录的文件仍存在，不存在则重新探测 (移动/删除等写操作前使用)。
+        图片请求线程调用，不加锁：dict 的单次读写是原子的，重载时整体替换。
+        """
+        base = os.path.splitext(os.path.join(CARDS_FOLDER, card_id.replace('/', os.sep)))[0]
+        ext = self.sidecars.get(card_id)
+        if ext is not None and verify and ext and not os.path.isfile(base + ext):
+            ext = None
+        if ext is None:
+            found = find_sidecar_image(base + '.json')
+            ext = os.path.splitext(found)[1] if found else ''
+            self.sidecars[card_id] = ext
+        return base + ext if ext else None
+
+    def forget_sidecar(self, card_id):
+        """[增量更新] 伴生图被替换/删除后调用：下次使用时重新探测"""
+        self._forget_sidecars((card_id,))
+
+    def _forget_sidecars(self, card_ids):
+        for cid in card_ids:
+            self.sidecars.pop(cid, None)
+
+    def _move_sidecar(self, old_id, new_id):
+        """伴生图随卡片同名移动，扩展名不变 (调用方持有 self.lock)"""
+        ext = self.sidecars.pop(old_id, None)
+        self.sidecars.pop(new_id, None)
+        if ext is not None:
+            self.sidecars[new_id] = ext
+
     def toggle_favorite_update(self, card_id, new_status):
         """[增量更新] 更新卡片收藏状态"""
         with self.lock:
@@ -0,0 +1,23 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def load_placeholders(conn):
+    """读取全部卡片占位图：{card_id: (placeholder, color)}"""
+    rows = conn.execute("SELECT id, placeholder, color FROM card_placeholder").fetchall()
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+
+def store_placeholders(conn, entries):
+    """
+    批量写入卡片占位图，调用方负责提交。
+
+    Args:
+        entries: {card_id: (placeholder, color)}；placeholder 为 16px WebP 的 data URI，color 为 '#rrggbb'。
+    """
+    rows = [(card_id, *value) for card_id, value in entries.items()]
+    if rows:
+        conn.executemany(
+            "INSERT OR REPLACE INTO card_placeholder (id, placeholder, color) VALUES (?, ?, ?)", rows
+        )
@@ -3,6 +3,7 @@ import time
 import sqlite3
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from flask import g
 
 # === 基础设施 ===
@@ -14,6 +15,7 @@ from core.utils.data import get_wi_meta, sanitize_for_utf8
 from core.utils.text import calculate_token_count
 from core.utils.hash import get_file_hash_and_size
 from core.utils.filesystem import is_card_file
+from core.utils.walker import scan_tree
 
 logger = logging.getLogger(__name__)
 
@@ -62,6 +64,19 @@ def execute_with_retry(func, max_retries=5, delay=0.1):
         except Exception as e:
             raise e
 
+# SQLite 默认单条语句最多 999 个绑定参数，IN (...) 查询需分批
+SQL_PARAM_CHUNK = 900
+
+def chunked(items, size=SQL_PARAM_CHUNK):
+    """将序列按 size 切分，用于分批拼接 IN (...) 占位符"""
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def escape_like(value):
+    """转义 LIKE 通配符，配合 ESCAPE '\\' 使用"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
 def init_database():
     """
     初始化数据库。
@@ -80,6 +95,9 @@ def init_database():
     
     # 创建临时连接进行初始化 (不使用 Flask g，因为此时可能不在请求上下文中)
     conn = sqlite3.connect(db_path, timeout=30)
+    if not is_existing_db:
+        # 新库启用增量 VACUUM (必须在建表前设置)，由后台维护任务回收空闲页
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
     try:
         conn.execute("PRAGMA journal_mode=WAL;")
     except:
@@ -89,14 +107,11 @@ def init_database():
     
     # === 1. 创建表结构 ===
     
-    # 核心角色卡元数据表
+    # 核心角色卡元数据表 (热表：仅保存扫描器与缓存频繁读取的窄字段)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS card_metadata (
             id TEXT PRIMARY KEY,
             char_name TEXT,
-            description TEXT,
-            first_mes TEXT,
-            mes_example TEXT,
             tags TEXT,
             category TEXT,
             creator TEXT,
@@ -106,7 +121,20 @@ def init_database():
             file_size INTEGER,
             token_count INTEGER DEFAULT 0,
             has_character_book INTEGER DEFAULT 0,
-            character_book_name TEXT DEFAULT ''
+            character_book_name TEXT DEFAULT '',
+            is_favorite INTEGER DEFAULT 0,
+            wi_checked_mtime REAL,
+            sidecar_ext TEXT
+        )
+    ''')
+
+    # 角色卡大文本字段 (冷表：description / first_mes / mes_example，按 id 关联)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS card_text (
+            id TEXT PRIMARY KEY,
+            description TEXT,
+            first_mes TEXT,
+            mes_example TEXT
         )
     ''')
     
@@ -141,6 +169,35 @@ def init_database():
         )
     ''')
     
+    # 应用内部状态键值表 (如首次导入的断点)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS app_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+    # 后台任务记录表 (进度、断点与结果，支持重启后恢复)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            type TEXT,
+            status TEXT,
+            params TEXT,
+            progress INTEGER DEFAULT 0,
+            total INTEGER DEFAULT 0,
+            message TEXT,
+            result TEXT,
+            error TEXT,
+            checkpoint TEXT,
+            cancel_requested INTEGER DEFAULT 0,
+            created_at REAL,
+            started_at REAL,
+            finished_at REAL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+    
     conn.commit()
     
     # === 2. 数据库结构升级 (Migrations) ===
@@ -173,10 +230,56 @@ def init_database():
         except Exception as e:
             logger.error(f"数据库升级失败 (WI columns): {e}")
 
+    # 世界书检测标记：记录 has_character_book 是在文件哪个 mtime 下得出的
+    if 'wi_checked_mtime' not in columns:
+        print("正在升级数据库: 添加 wi_checked_mtime 列...")
+        try:
+            cursor.execute("ALTER TABLE card_metadata ADD COLUMN wi_checked_mtime REAL")
+            conn.commit()
+        except Exception as e:
+            logger.error(f"数据库升级失败 (wi_checked_mtime): {e}")
+
+    # JSON 卡片伴生图扩展名：扫描时解析并记录，图片请求无需逐个探测 (NULL 表示未解析，'' 表示没有伴生图)
+    if 'sidecar_ext' not in columns:
+        print("正在升级数据库: 添加 sidecar_ext 列...")
+        try:
+            cursor.execute("ALTER TABLE card_metadata ADD COLUMN sidecar_ext TEXT")
+            conn.commit()
+        except Exception as e:
+            logger.error(f"数据库升级失败 (sidecar_ext): {e}")
+
+    # 旧版本把大文本与热字段存放在同一张表中，拆分到 card_text
+    if 'description' in columns:
+        _split_card_text_columns(conn)
+
+    # 冷表与热表保持同步：删除/重命名 card_metadata 时同步 card_text
+    _ensure_card_text_triggers(conn)
+
+    # 标签规范化索引表 (card_id, tag)，由触发器与 tags JSON 列同步维护
+    _ensure_card_tags_index(conn)
+
+    # 全量内容哈希 / 元数据哈希索引，用于查重
+    _ensure_card_hashes_table(conn)
+
+    # 缩略图内容寻址索引 (原图路径 -> 内容签名)
+    _ensure_thumb_index_table(conn)
+
+    # 网格低清占位图与主色调 (缩略图生成时写入)
+    _ensure_card_placeholder_table(conn)
+
+    # 扫描器比对所需字段的覆盖索引 (无需回表)；旧版索引不含 sidecar_ext，替换之
+    cursor.execute("DROP INDEX IF EXISTS idx_card_metadata_scan")
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_card_metadata_scan_v2
+        ON card_metadata (id, last_modified, file_size, token_count, file_hash, is_favorite, sidecar_ext)
+    ''')
+    conn.commit()
+
     # === 3. 数据迁移逻辑 ===
-    if not is_existing_db:
-        # 全新数据库：执行全量文件扫描导入
-        _migrate_existing_data(conn)
+    import_state = get_app_state(conn, _IMPORT_STATE_KEY) or {}
+    if not is_existing_db or import_state.get("status") == "running":
+        # 全新数据库：执行全量文件扫描导入；上次导入中途退出时从断点继续
+        _migrate_existing_data(conn, resume=is_existing_db)
     else:
         # 已有数据库：标记为就绪
         ctx.set_status(status="ready", message="启动完成", progress=100)
@@ -186,144 +289,493 @@ def init_database():
     ctx.set_status(status="ready")
     print("数据库初始化和表结构检查完成")
 
-def _migrate_existing_data(conn):
+# 热表字段 (不含大文本)，用于结构迁移时的数据复制
+_HOT_COLUMNS = [
+    'id', 'char_name', 'tags', 'category', 'creator', 'char_version',
+    'last_modified', 'file_hash', 'file_size', 'token_count',
+    'has_character_book', 'character_book_name', 'is_favorite', 'wi_checked_mtime', 'sidecar_ext'
+]
+
+def _split_card_text_columns(conn):
+    """
+    [内部函数] 结构迁移：将 card_metadata 中的大文本字段移动到 card_text，
+    并重建一张不含大文本的窄表。整个过程在单个事务中完成。
+    """
+    print("正在升级数据库: 拆分角色卡大文本字段到 card_text...")
+    cols = ", ".join(_HOT_COLUMNS)
+    try:
+        conn.execute("BEGIN")
+        conn.execute('''
+            INSERT OR REPLACE INTO card_text (id, description, first_mes, mes_example)
+            SELECT id, description, first_mes, mes_example FROM card_metadata
+        ''')
+        conn.execute('''
+            CREATE TABLE card_metadata_hot (
+                id TEXT PRIMARY KEY,
+                char_name TEXT,
+                tags TEXT,
+                category TEXT,
+                creator TEXT,
+                char_version TEXT,
+                last_modified REAL,
+                file_hash TEXT,
+                file_size INTEGER,
+                token_count INTEGER DEFAULT 0,
+                has_character_book INTEGER DEFAULT 0,
+                character_book_name TEXT DEFAULT '',
+                is_favorite INTEGER DEFAULT 0,
+                wi_checked_mtime REAL,
+                sidecar_ext TEXT
+            )
+        ''')
+        conn.execute(f"INSERT INTO card_metadata_hot ({cols}) SELECT {cols} FROM card_metadata")
+        conn.execute("DROP TABLE card_metadata")
+        conn.execute("ALTER TABLE card_metadata_hot RENAME TO card_metadata")
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"数据库升级失败 (card_text split): {e}")
+        return
+
+    # 释放旧表占用的页面，顺便切换为增量 VACUUM 模式
+    try:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+        conn.execute("VACUUM")
+    except Exception as e:
+        logger.warning(f"VACUUM after card_text split failed: {e}")
+
+def _ensure_card_text_triggers(conn):
+    """[内部函数] 创建 card_metadata -> card_text 的级联删除/重命名触发器"""
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_card_metadata_delete
+        AFTER DELETE ON card_metadata
+        BEGIN
+            DELETE FROM card_text WHERE id = OLD.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_card_metadata_rename
+        AFTER UPDATE OF id ON card_metadata
+        WHEN OLD.id <> NEW.id
+        BEGIN
+            UPDATE card_text SET id = NEW.id WHERE id = OLD.id;
+        END
+    ''')
+    conn.commit()
+
+def _ensure_card_hashes_table(conn):
+    """
+    [内部函数] 创建查重用的哈希表 card_hashes / card_phash。
+    两表均由后台哈希线程填充；mtime/size 与 card_metadata 不一致的行视为过期，会被重新计算。
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS card_hashes (
+            id TEXT PRIMARY KEY,
+            content_hash TEXT,
+            meta_hash TEXT,
+            mtime REAL,
+            size INTEGER
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_card_hashes_content ON card_hashes (content_hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_card_hashes_meta ON card_hashes (meta_hash)")
+    # 头像感知哈希 (dHash)：phash 以有符号 64 位整数存储，NULL 表示无图片
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS card_phash (
+            id TEXT PRIMARY KEY,
+            phash INTEGER,
+            mtime REAL,
+            size INTEGER
+        )
+    ''')
+    # 旧表没有 mtime/size：补列后旧行均视为过期，由后台哈希线程重新计算
+    phash_columns = [row[1] for row in conn.execute("PRAGMA table_info(card_phash)").fetchall()]
+    if 'mtime' not in phash_columns:
+        conn.execute("ALTER TABLE card_phash ADD COLUMN mtime REAL")
+    if 'size' not in phash_columns:
+        conn.execute("ALTER TABLE card_phash ADD COLUMN size INTEGER")
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_card_hashes_delete
+        AFTER DELETE ON card_metadata
+        BEGIN
+            DELETE FROM card_hashes WHERE id = OLD.id;
+            DELETE FROM card_phash WHERE id = OLD.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_card_hashes_rename
+        AFTER UPDATE OF id ON card_metadata
+        WHEN OLD.id <> NEW.id
+        BEGIN
+            UPDATE OR REPLACE card_hashes SET id = NEW.id WHERE id = OLD.id;
+            UPDATE OR REPLACE card_phash SET id = NEW.id WHERE id = OLD.id;
+        END
+    ''')
+    conn.commit()
+
+def _ensure_thumb_index_table(conn):
+    """
+    [内部函数] 创建缩略图索引 thumb_index_v2：原图相对路径 -> (mtime, size, 全量内容哈希)。
+    缩略图按内容哈希存放，mtime/size 未变时直接复用哈希；卡片改名/移动后哈希不变，缩略图无需重新生成。
+    """
+    # 旧表 thumb_index 记录的是头尾采样签名，中间字节不同的图片会撞车，整表丢弃；
+    # 按旧签名命名的缩略图文件不再被索引引用，由缩略图 GC 作为孤立文件回收
+    conn.execute("DROP TABLE IF EXISTS thumb_index")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS thumb_index_v2 (
+            path TEXT PRIMARY KEY,
+            mtime REAL,
+            size INTEGER,
+            content_hash TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_thumb_index_v2_hash ON thumb_index_v2 (content_hash)")
+    conn.commit()
+
+def _ensure_card_placeholder_table(conn):
+    """
+    [内部函数] 创建卡片占位图表 card_placeholder：缩略图生成时顺带写入 16px 低清图与主色调，
+    随卡片列表一起返回，网格在缩略图到达前即可渲染出轮廓与色块。
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS card_placeholder (
+            id TEXT PRIMARY KEY,
+            placeholder TEXT,
+            color TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_card_placeholder_delete
+        AFTER DELETE ON card_metadata
+        BEGIN
+            DELETE FROM card_placeholder WHERE id = OLD.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_card_placeholder_rename
+        AFTER UPDATE OF id ON card_metadata
+        WHEN OLD.id <> NEW.id
+        BEGIN
+            UPDATE OR REPLACE card_placeholder SET id = NEW.id WHERE id = OLD.id;
+        END
+    ''')
+    conn.commit()
+
+# 将 tags JSON 展开为 (tag, position) 行；非法 JSON 视为空列表，保证触发器不会中断写入
+_TAGS_JSON_EACH = "json_each(CASE WHEN json_valid({col}) THEN {col} ELSE '[]' END)"
+
+def _ensure_card_tags_index(conn):
+    """
+    [内部函数] 创建规范化标签表 card_tags 及其同步触发器。
+    所有对 card_metadata.tags 的写入 (INSERT / UPDATE / DELETE / 改名) 都会在同一事务内
+    同步到 card_tags，因此调用方无需关心该表。首次创建时从现有 JSON 列回填。
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'card_tags'")
+    is_new = cursor.fetchone() is None
+
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS card_tags (
+                card_id TEXT NOT NULL,
+                tag TEXT NOT NULL,
+                position INTEGER DEFAULT 0,
+                PRIMARY KEY (card_id, tag)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_card_tags_tag ON card_tags (tag, card_id)")
+
+        expand_new = _TAGS_JSON_EACH.format(col="NEW.tags")
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_card_tags_insert
+            AFTER INSERT ON card_metadata
+            BEGIN
+                DELETE FROM card_tags WHERE card_id = NEW.id;
+                INSERT OR IGNORE INTO card_tags (card_id, tag, position)
+                SELECT NEW.id, TRIM(value), CAST(key AS INTEGER) FROM {expand_new}
+                WHERE type = 'text' AND TRIM(value) <> '';
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_card_tags_update
+            AFTER UPDATE OF tags ON card_metadata
+            BEGIN
+                DELETE FROM card_tags WHERE card_id IN (OLD.id, NEW.id);
+                INSERT OR IGNORE INTO card_tags (card_id, tag, position)
+                SELECT NEW.id, TRIM(value), CAST(key AS INTEGER) FROM {expand_new}
+                WHERE type = 'text' AND TRIM(value) <> '';
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_card_tags_delete
+            AFTER DELETE ON card_metadata
+            BEGIN
+                DELETE FROM card_tags WHERE card_id = OLD.id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_card_tags_rename
+            AFTER UPDATE OF id ON card_metadata
+            WHEN OLD.id <> NEW.id
+            BEGIN
+                UPDATE OR REPLACE card_tags SET card_id = NEW.id WHERE card_id = OLD.id;
+            END
+        ''')
+
+        if is_new:
+            print("正在升级数据库: 构建标签索引 card_tags...")
+            expand_row = _TAGS_JSON_EACH.format(col="m.tags")
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO card_tags (card_id, tag, position)
+                SELECT m.id, TRIM(j.value), CAST(j.key AS INTEGER)
+                FROM card_metadata m, {expand_row} j
+                WHERE j.type = 'text' AND TRIM(j.value) <> ''
+            ''')
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"数据库升级失败 (card_tags): {e}")
+
+def upsert_card_text(cursor, card_id, data_block):
+    """
+    写入卡片的大文本字段到 card_text 冷表。
+    调用方负责在同一事务中写入 card_metadata 并提交。
+    """
+    cursor.execute('''
+        INSERT OR REPLACE INTO card_text (id, description, first_mes, mes_example)
+        VALUES (?, ?, ?, ?)
+    ''', (
+        card_id,
+        data_block.get('description', ''),
+        data_block.get('first_mes', ''),
+        data_block.get('mes_example', '')
+    ))
+
+def get_app_state(conn, key):
+    """读取 app_state 中的 JSON 值，不存在时返回 None"""
+    row = conn.execute("SELECT value FROM app_state WHERE key = ?", (key,)).fetchone()
+    if not row or row[0] is None:
+        return None
+    try:
+        return json.loads(row[0])
+    except Exception:
+        return None
+
+def set_app_state(conn, key, value):
+    """写入 app_state (值会序列化为 JSON)，调用方负责提交"""
+    conn.execute(
+        "INSERT OR REPLACE INTO app_state (key, value) VALUES (?, ?)",
+        (key, json.dumps(value, ensure_ascii=False))
+    )
+
+# 首次导入的断点键
+_IMPORT_STATE_KEY = "initial_import"
+# 首次导入时并行解析卡片的线程数 (文件读取、zlib 解压与 md5 会释放 GIL)
+IMPORT_WORKERS = min(8, (os.cpu_count() or 2) * 2)
+# 每批提交的卡片数；每次提交即一个断点
+IMPORT_COMMIT_BATCH = 200
+
+def _parse_card_for_import(full_path, mtime=None):
+    """
+    [内部函数] 首次导入：解析单张卡片，返回 (行数据, data_block)；无法解析时返回 None。
+    在工作线程中执行，不访问数据库。mtime 可由遍历结果传入，省去一次 stat。
+    """
+    clean_path = sanitize_for_utf8(full_path)
+    # 计算相对路径 ID (统一使用 / 作为分隔符)
+    rel_path = os.path.relpath(full_path, CARDS_FOLDER)
+    file_id_path = rel_path.replace('\\', '/')
+    
+    # 计算分类
+    if '/' in file_id_path:
+        category = file_id_path.rsplit('/', 1)[0]
+    else:
+        category = ""
+    
+    # 提取基础信息
+    try:
+        file_hash, file_size = get_file_hash_and_size(full_path)
+    except Exception as e:
+        # 即使哈希失败也继续，只是哈希为空
+        file_hash, file_size = "", 0
+        print(f"File access error: {clean_path} - {e}")
+    
+    # 解析卡片内容
+    info = extract_card_info(full_path)
+    
+    if not info:
+        # 无法解析为卡片，跳过
+        return None
+    
+    # 提取数据块 (兼容 V2/V3)
+    data_block = info.get('data', {}) if 'data' in info else info
+    
+    # 处理标签
+    tags = data_block.get('tags', [])
+    if isinstance(tags, str):
+        tags = [t.strip() for t in tags.split(',') if t.strip()]
+    elif tags is None:
+        tags = []
+    tags = list(dict.fromkeys([str(t).strip() for t in tags if str(t).strip()])) # 去重
+    
+    # 处理名称
+    char_name = info.get('name') or data_block.get('name') or os.path.splitext(os.path.basename(clean_path))[0]
+    
+    # 获取修改时间
+    if mtime is None:
+        try:
+            mtime = os.path.getmtime(full_path)
+        except:
+            mtime = 0
+    
+    # 计算 Token
+    calc_data = data_block.copy()
+    if 'name' not in calc_data:
+        calc_data['name'] = char_name
+    token_count = calculate_token_count(calc_data)
+    
+    # 检查是否包含世界书
+    has_wi, wi_name = get_wi_meta(data_block)
+
+    row = (
+        file_id_path, char_name,
+        json.dumps(tags), category, data_block.get('creator', ''),
+        data_block.get('character_version', ''), mtime, file_hash, file_size,
+        token_count, has_wi, wi_name, mtime
+    )
+    return row, data_block
+
+def _migrate_existing_data(conn, resume=False):
     """
     [内部函数] 将现有文件系统中的数据全量迁移到数据库。
+    - 解析在线程池中并行执行，主线程按批写库；
+    - 每批提交后数据库本身就是断点：进程中途退出时 app_state 仍为 running，
+      下次启动会跳过已入库的卡片继续导入，而不是把半成品当作完成。
     """
     # 内部引用，避免循环引用
     from core.context import ctx
     ctx.set_status(status="processing", message="正在扫描文件系统...")
     
-    file_list = []
     skipped_files = []
-    
+
+    # 遍历资料库之前就标记为进行中：首次启动在遍历阶段被中断时，下次启动仍会继续导入
+    # (否则数据库已存在且没有 running 标记，会被当作已导入而跳过)
+    if not resume:
+        set_app_state(conn, _IMPORT_STATE_KEY, {"status": "running", "total": None, "started_at": time.time()})
+        conn.commit()
+
     print("正在扫描文件列表...")
-    for root, dirs, files in os.walk(CARDS_FOLDER):
-        for f in files:
-            if is_card_file(f):
-                file_list.append(os.path.join(root, f))
+    file_list = scan_tree(CARDS_FOLDER, file_filter=is_card_file).files
     
     total_files = len(file_list)
     ctx.set_status(total=total_files)
 
     if total_files == 0:
         print("未发现角色卡，跳过导入。")
+        set_app_state(conn, _IMPORT_STATE_KEY, {"status": "done", "total": 0})
+        conn.commit()
         ctx.set_status(status="ready", message="未发现文件，准备就绪", progress=0)
         return
 
-    ctx.set_status(status="processing", message=f"发现 {total_files} 张卡片，开始导入...")
-    print(f"开始导入 {total_files} 张卡片...")
-    
     cursor = conn.cursor()
+    already_done = 0
+    if resume:
+        # 断点续传：已入库的卡片不再解析
+        imported = {row[0] for row in cursor.execute("SELECT id FROM card_metadata")}
+        pending = [e for e in file_list if e.rel_path not in imported]
+        already_done = total_files - len(pending)
+        file_list = pending
+        print(f"继续上次中断的导入: 已完成 {already_done}，剩余 {len(file_list)} 张卡片...")
+    else:
+        print(f"开始导入 {total_files} 张卡片...")
+
+    set_app_state(conn, _IMPORT_STATE_KEY, {"status": "running", "total": total_files, "started_at": time.time()})
+    conn.commit()
+    ctx.set_status(status="processing", message=f"发现 {total_files} 张卡片，开始导入...", progress=already_done)
+    
     card_count = 0
     error_count = 0
-    
-    for full_path in file_list:
-        clean_path = sanitize_for_utf8(full_path)
+    processed = 0
+    started = time.time()
+
+    def _safe_parse(entry):
         try:
-            # 计算相对路径 ID (统一使用 / 作为分隔符)
-            rel_path = os.path.relpath(full_path, CARDS_FOLDER)
-            file_id_path = rel_path.replace('\\', '/')
-            
-            # 计算分类
-            if '/' in file_id_path:
-                category = file_id_path.rsplit('/', 1)[0]
-            else:
-                category = ""
-            
-            # 提取基础信息
-            try:
-                file_hash, file_size = get_file_hash_and_size(full_path)
-            except Exception as e:
-                # 即使哈希失败也继续，只是哈希为空
-                file_hash, file_size = "", 0
-                print(f"File access error: {clean_path} - {e}")
-            
-            # 解析卡片内容
-            info = extract_card_info(full_path)
-            
-            if not info:
-                # 无法解析为卡片，跳过
-                continue
-            
-            # 提取数据块 (兼容 V2/V3)
-            data_block = info.get('data', {}) if 'data' in info else info
-            
-            # 处理标签
-            tags = data_block.get('tags', [])
-            if isinstance(tags, str):
-                tags = [t.strip() for t in tags.split(',') if t.strip()]
-            elif tags is None:
-                tags = []
-            tags = list(dict.fromkeys([str(t).strip() for t in tags if str(t).strip()])) # 去重
-            
-            # 处理名称
-            char_name = info.get('name') or data_block.get('name') or os.path.splitext(os.path.basename(clean_path))[0]
-            
-            # 获取修改时间
-            try:
-                mtime = os.path.getmtime(full_path)
-            except:
-                mtime = 0
-            
-            # 计算 Token
-            calc_data = data_block.copy()
-            if 'name' not in calc_data:
-                calc_data['name'] = char_name
-            token_count = calculate_token_count(calc_data)
-            
-            # 检查是否包含世界书
-            has_wi, wi_name = get_wi_meta(data_block)
-            
-            # 插入数据库
-            try:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO card_metadata
-                    (id, char_name, description, first_mes, mes_example, tags, category, creator, char_version, last_modified, file_hash, file_size, token_count, has_character_book, character_book_name)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    file_id_path, char_name, data_block.get('description', ''),
-                    data_block.get('first_mes', ''), data_block.get('mes_example', ''),
-                    json.dumps(tags), category, data_block.get('creator', ''),
-                    data_block.get('character_version', ''), mtime, file_hash, file_size,
-                    token_count, has_wi, wi_name
-                ))
-                card_count += 1
-            except Exception as db_e:
-                print(f"❌ 数据库插入失败: {file_id_path} - {db_e}")
-                skipped_files.append((file_id_path, str(db_e)))
-                error_count += 1
-                continue
-            
-            # 批量提交并更新状态
-            if card_count % 50 == 0:
-                try:
-                    conn.commit()
-                    ctx.set_status(progress=card_count, message=f"正在导入: {card_count}/{total_files}")
-                except Exception:
-                    conn.rollback()
-                    
-        except Exception as outer_e:
-            print(f"❌ 处理文件异常: {clean_path} - {outer_e}")
-            error_count += 1
-            continue
-    
-    # 最终提交
+            return entry.path, _parse_card_for_import(entry.path, entry.mtime), None
+        except Exception as e:
+            return entry.path, None, e
+
+    def _commit_batch():
+        try:
+            set_app_state(conn, _IMPORT_STATE_KEY, {
+                "status": "running", "total": total_files, "imported": already_done + card_count
+            })
+            conn.commit()
+        except Exception:
+            conn.rollback()
+        elapsed = max(time.time() - started, 1e-6)
+        rate = round(processed / elapsed, 1)
+        done = already_done + processed
+        ctx.set_status(progress=done, rate=rate, message=f"正在导入: {done}/{total_files} ({rate} 张/秒)")
+
+    chunks = (file_list[i:i + IMPORT_COMMIT_BATCH] for i in range(0, len(file_list), IMPORT_COMMIT_BATCH))
+
+    with ThreadPoolExecutor(max_workers=IMPORT_WORKERS) as pool:
+        # 按提交批次分块提交解析任务，同时最多两块在途 (当前块 + 预取的下一块)：
+        # 内存中的解析结果有上限，写库期间工作线程也不会空闲。
+        # 结果按文件顺序消费，工作线程只负责解析，所有数据库写入都在当前线程
+        def _submit(chunk):
+            return [pool.submit(_safe_parse, entry) for entry in chunk]
+
+        in_flight = _submit(next(chunks, []))
+        while in_flight:
+            futures, in_flight = in_flight, _submit(next(chunks, []))
+            for future in futures:
+                full_path, parsed, parse_error = future.result()
+                processed += 1
+                if parse_error is not None:
+                    print(f"❌ 处理文件异常: {sanitize_for_utf8(full_path)} - {parse_error}")
+                    error_count += 1
+                elif parsed is not None:
+                    row, data_block = parsed
+                    # 插入数据库
+                    try:
+                        cursor.execute('''
+                            INSERT OR REPLACE INTO card_metadata
+                            (id, char_name, tags, category, creator, char_version, last_modified, file_hash, file_size, token_count, has_character_book, character_book_name, wi_checked_mtime)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ''', row)
+                        upsert_card_text(cursor, row[0], data_block)
+                        card_count += 1
+                    except Exception as db_e:
+                        print(f"❌ 数据库插入失败: {row[0]} - {db_e}")
+                        skipped_files.append((row[0], str(db_e)))
+                        error_count += 1
+
+                # 批量提交并更新状态
+                if processed % IMPORT_COMMIT_BATCH == 0:
+                    _commit_batch()
+
+    # 最终提交，并标记导入完成
     try:
+        set_app_state(conn, _IMPORT_STATE_KEY, {
+            "status": "done", "total": total_files, "imported": already_done + card_count, "finished_at": time.time()
+        })
         conn.commit()
     except Exception as final_e:
         print(f"❌ 最终提交失败: {final_e}")
         conn.rollback()
     
+    elapsed = max(time.time() - started, 1e-6)
+    rate = round(processed / elapsed, 1)
     # 打印简报
-    print(f"✅ 数据库迁移完成: 成功 {card_count} / 失败 {error_count}")
+    print(f"✅ 数据库迁移完成: 成功 {card_count} / 失败 {error_count} ({rate} 张/秒)")
     
-    ctx.set_status(status="processing", message="迁移完成，正在加载缓存...", progress=total_files)
+    ctx.set_status(status="processing", message="迁移完成，正在加载缓存...", progress=total_files, rate=rate)
 
 def backfill_wi_metadata():
     """
     后台任务：检查数据库中尚未标记 WI 的卡片，补充 has_character_book 字段。
     用于解决旧版本数据库升级后，旧卡片不显示在世界书列表的问题。
+    每张卡片检查后记录 wi_checked_mtime，文件未变化时下次启动不再重复解析。
     """
     # 稍作等待，确保主初始化流程先释放资源
     time.sleep(3)
@@ -333,13 +785,19 @@ def backfill_wi_metadata():
     try:
         with sqlite3.connect(db_path, timeout=30) as conn:
             cursor = conn.cursor()
-            # 查找尚未检查过 WI 的记录 (has_character_book = 0)
-            cursor.execute("SELECT id FROM card_metadata WHERE has_character_book = 0")
+            # 查找尚未检查过 WI、或检查后文件又发生变化的记录
+            cursor.execute("""
+                SELECT id, last_modified FROM card_metadata
+                WHERE has_character_book = 0
+                  AND (wi_checked_mtime IS NULL OR wi_checked_mtime IS NOT last_modified)
+            """)
             rows = cursor.fetchall()
+            if not rows:
+                return
             
             updates = []
-            for row in rows:
-                card_id = row[0]
+            checked = []
+            for card_id, mtime in rows:
                 full_path = os.path.join(CARDS_FOLDER, card_id.replace('/', os.sep))
                 
                 if os.path.exists(full_path):
@@ -348,12 +806,18 @@ def backfill_wi_metadata():
                         data = info.get('data', {}) if 'data' in info else info
                         has_wi, wi_name = get_wi_meta(data)
                         if has_wi:
-                            updates.append((1, wi_name, card_id))
+                            updates.append((1, wi_name, mtime, card_id))
+                            continue
+                # 无世界书或无法解析：同样记录检查标记，等文件变化后再查
+                checked.append((mtime, card_id))
             
             if updates:
                 print(f"发现 {len(updates)} 张旧卡片包含世界书，正在更新索引...")
-                cursor.executemany("UPDATE card_metadata SET has_character_book = ?, character_book_name = ? WHERE id = ?", updates)
-                conn.commit()
+                cursor.executemany("UPDATE card_metadata SET has_character_book = ?, character_book_name = ?, wi_checked_mtime = ? WHERE id = ?", updates)
+            if checked:
+                cursor.executemany("UPDATE card_metadata SET wi_checked_mtime = ? WHERE id = ?", checked)
+            conn.commit()
+            if updates:
                 print("世界书索引更新完成。")
     except Exception as e:
         logger.error(f"Backfill WI metadata error: {e}")
\ No newline at end of file
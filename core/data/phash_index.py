@@ -0,0 +1,175 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 感知哈希位数 (dHash 8x8)
+PHASH_BITS = 64
+# 近似重复的默认/最大汉明距离。阈值越大分块越小、候选越多，查询越慢
+DEFAULT_PHASH_DISTANCE = 4
+MAX_PHASH_DISTANCE = 8
+
+_U64 = 1 << 64
+
+
+def to_signed64(value):
+    """无符号 64 位 -> SQLite INTEGER (有符号)"""
+    return value - _U64 if value >= (1 << 63) else value
+
+
+def to_unsigned64(value):
+    return value + _U64 if value < 0 else value
+
+
+def store_phash(conn, card_id, phash, mtime, size):
+    """
+    写入单张卡片的感知哈希 (phash 为 None 表示无可用图片)。
+    mtime/size 取计算时 card_metadata 中的值，与之不一致即视为过期。
+    """
+    conn.execute(
+        "INSERT OR REPLACE INTO card_phash (id, phash, mtime, size) VALUES (?, ?, ?, ?)",
+        (card_id, to_signed64(phash) if phash is not None else None, mtime, size)
+    )
+
+
+def load_phashes(conn):
+    """读取所有有效 (未过期) 的感知哈希：[(card_id, phash_uint64), ...]"""
+    rows = conn.execute('''
+        SELECT p.id, p.phash FROM card_phash p
+        JOIN card_metadata m ON m.id = p.id
+        WHERE p.phash IS NOT NULL AND p.mtime IS m.last_modified AND p.size IS m.file_size
+    ''').fetchall()
+    return [(row[0], to_unsigned64(row[1])) for row in rows]
+
+
+if hasattr(int, 'bit_count'):  # Python 3.10+
+    def _hamming(a, b):
+        return (a ^ b).bit_count()
+else:
+    def _hamming(a, b):
+        return bin(a ^ b).count('1')
+
+
+# 多索引分块数上限：段宽至少约 12 位，保证每个桶里的候选项足够少
+_MAX_BLOCKS = 5
+
+
+def _block_layout(max_distance):
+    """
+    多索引哈希的分块方案：把 64 位切成 m 段，每段允许 r = max_distance // m 位差异。
+    由抽屉原理，汉明距离 <= max_distance 的两个哈希至少有一段的差异 <= r，
+    因此只需在每段中枚举半径 r 以内的邻居键即可找全候选。
+    """
+    blocks = min(max_distance + 1, _MAX_BLOCKS)
+    base, extra = divmod(PHASH_BITS, blocks)
+    masks, shift = [], 0
+    for i in range(blocks):
+        width = base + (1 if i < extra else 0)
+        masks.append((shift, width))
+        shift += width
+    return masks, max_distance // blocks
+
+
+def _flip_masks(width, radius):
+    """半径 radius 以内的所有翻转掩码 (含 0)，radius 很小，最多为 2"""
+    masks = [0]
+    if radius >= 1:
+        masks.extend(1 << b for b in range(width))
+    if radius >= 2:
+        masks.extend((1 << b1) | (1 << b2) for b1 in range(width) for b2 in range(b1 + 1, width))
+    return masks
+
+
+class PHashIndex:
+    """
+    感知哈希的多索引汉明检索 (multi-index hashing)。
+    每段一个 dict：段值 -> [下标]，查询只比较在某一段上足够接近的候选项，而不是全表扫描。
+    """
+    def __init__(self, items, max_distance=DEFAULT_PHASH_DISTANCE):
+        self.items = list(items)
+        self.max_distance = max(0, min(int(max_distance), MAX_PHASH_DISTANCE))
+        blocks, radius = _block_layout(self.max_distance)
+        # 每段: (位移, 段掩码, 邻居翻转掩码, 段值 -> [下标])
+        self.tables = [
+            (shift, (1 << width) - 1, _flip_masks(width, radius), {})
+            for shift, width in blocks
+        ]
+        for idx, (_, h) in enumerate(self.items):
+            for shift, mask, _, table in self.tables:
+                table.setdefault((h >> shift) & mask, []).append(idx)
+
+    def _candidates(self, h):
+        seen = set()
+        for shift, mask, flips, table in self.tables:
+            key = (h >> shift) & mask
+            for flip in flips:
+                bucket = table.get(key ^ flip)
+                if bucket:
+                    seen.update(bucket)
+        return seen
+
+    def query(self, h):
+        """返回 [(card_id, distance), ...]，按距离升序"""
+        result = []
+        for idx in self._candidates(h):
+            d = _hamming(h, self.items[idx][1])
+            if d <= self.max_distance:
+                result.append((self.items[idx][0], d))
+        result.sort(key=lambda x: (x[1], x[0]))
+        return result
+
+    def groups(self, progress_cb=None, cancel_cb=None):
+        """
+        全库近似重复分组 (并查集合并所有距离 <= max_distance 的配对)。
+        返回 [[card_id, ...], ...]，只包含 2 张及以上的组。
+        全库规模较大时耗时可达数十秒，应在后台任务中调用。
+
+        Args:
+            progress_cb: 可选回调 progress_cb(done, total)。
+            cancel_cb: 可选回调，返回 True 时提前结束 (返回已找到的部分分组)。
+        """
+        parent = list(range(len(self.items)))
+
+        def _find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def _union(i, j):
+            ri, rj = _find(i), _find(j)
+            if ri != rj:
+                parent[ri] = rj
+
+        items = self.items
+        limit = self.max_distance
+        total = len(items)
+        if self.tables and len(self.tables[0][2]) == 1:
+            # 半径为 0：候选项恰好是同桶成员，直接桶内两两比较，免去逐项构造候选集合
+            buckets = [b for _, _, _, table in self.tables for b in table.values() if len(b) > 1]
+            total = len(buckets)
+            for n, bucket in enumerate(buckets):
+                if n % 1000 == 0:
+                    if cancel_cb and cancel_cb():
+                        break
+                    if progress_cb:
+                        progress_cb(n, total)
+                for pos, i in enumerate(bucket):
+                    hi = items[i][1]
+                    for j in bucket[pos + 1:]:
+                        if _hamming(hi, items[j][1]) <= limit:
+                            _union(i, j)
+        else:
+            for i, (_, hi) in enumerate(items):
+                if i % 1000 == 0:
+                    if cancel_cb and cancel_cb():
+                        break
+                    if progress_cb:
+                        progress_cb(i, total)
+                for j in self._candidates(hi):
+                    if j > i and _hamming(hi, items[j][1]) <= limit:
+                        _union(j, i)
+
+        grouped = {}
+        for idx in range(len(self.items)):
+            grouped.setdefault(_find(idx), []).append(self.items[idx][0])
+        return [sorted(ids) for ids in grouped.values() if len(ids) > 1]
@@ -0,0 +1,91 @@
+import logging
+
+# === 基础设施 ===
+from core.data.db_session import chunked, escape_like
+
+logger = logging.getLogger(__name__)
+
+
+def count_tags(conn, category=None):
+    """
+    统计标签使用次数。
+
+    Args:
+        conn: sqlite3 连接。
+        category: 仅统计该分类 (含子分类) 下的卡片；None 表示全部。
+
+    Returns:
+        dict: tag -> 卡片数量
+    """
+    if category:
+        escaped = escape_like(category)
+        rows = conn.execute("""
+            SELECT t.tag, COUNT(*) FROM card_tags t
+            JOIN card_metadata m ON m.id = t.card_id
+            WHERE m.category = ? OR m.category LIKE ? || '/%' ESCAPE '\\'
+            GROUP BY t.tag
+        """, (category, escaped)).fetchall()
+    else:
+        rows = conn.execute("SELECT tag, COUNT(*) FROM card_tags GROUP BY tag").fetchall()
+    return {row[0]: row[1] for row in rows}
+
+
+def get_card_ids_by_tags(conn, tags, match_all=True):
+    """
+    按标签过滤卡片 ID。
+
+    Args:
+        tags: 标签列表。
+        match_all: True 表示必须包含全部标签 (AND)，False 表示包含任一即可 (OR)。
+    """
+    tags = list(dict.fromkeys(t for t in tags if t))
+    if not tags:
+        return []
+    placeholders = ",".join("?" * len(tags))
+    if match_all:
+        rows = conn.execute(f"""
+            SELECT card_id FROM card_tags WHERE tag IN ({placeholders})
+            GROUP BY card_id HAVING COUNT(*) = ?
+        """, (*tags, len(tags))).fetchall()
+    else:
+        rows = conn.execute(
+            f"SELECT DISTINCT card_id FROM card_tags WHERE tag IN ({placeholders})", tags
+        ).fetchall()
+    return [row[0] for row in rows]
+
+
+def get_tag_card_map(conn, tags, category=None):
+    """
+    反向索引：tag -> [card_id, ...]，仅包含传入的标签。
+    用于批量标签操作时只定位受影响的卡片。
+
+    Args:
+        category: 仅包含该分类 (含子分类) 下的卡片；None 表示全部。
+    """
+    result = {}
+    for chunk in chunked(dict.fromkeys(tags)):
+        placeholders = ",".join("?" * len(chunk))
+        if category:
+            rows = conn.execute(f"""
+                SELECT tag, card_id FROM card_tags
+                WHERE tag IN ({placeholders}) AND card_id LIKE ? || '/%' ESCAPE '\\'
+            """, (*chunk, escape_like(category))).fetchall()
+        else:
+            rows = conn.execute(
+                f"SELECT tag, card_id FROM card_tags WHERE tag IN ({placeholders})", chunk
+            ).fetchall()
+        for tag, card_id in rows:
+            result.setdefault(tag, []).append(card_id)
+    return result
+
+
+def load_tags_by_card(conn):
+    """
+    全量读取标签索引：card_id -> [tag, ...] (保持卡片内原有顺序)。
+    用于缓存重建，避免对每一行的 JSON 字符串做 json.loads。
+    """
+    result = {}
+    rows = conn.execute("SELECT card_id, tag FROM card_tags ORDER BY card_id, position").fetchall()
+    for card_id, tag in rows:
+        result.setdefault(card_id, []).append(tag)
+    return result
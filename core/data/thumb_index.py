@@ -0,0 +1,26 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def load_thumb_index(conn):
+    """读取全部缩略图索引：{path: (mtime, size, content_hash)}"""
+    rows = conn.execute("SELECT path, mtime, size, content_hash FROM thumb_index_v2").fetchall()
+    return {row[0]: (row[1], row[2], row[3]) for row in rows}
+
+
+def store_thumb_index(conn, entries):
+    """
+    批量写入缩略图索引，调用方负责提交。
+
+    Args:
+        entries: {path: (mtime, size, content_hash)}；值为 None 表示删除该路径。
+    """
+    removed = [(path,) for path, value in entries.items() if value is None]
+    rows = [(path, *value) for path, value in entries.items() if value is not None]
+    if removed:
+        conn.executemany("DELETE FROM thumb_index_v2 WHERE path = ?", removed)
+    if rows:
+        conn.executemany(
+            "INSERT OR REPLACE INTO thumb_index_v2 (path, mtime, size, content_hash) VALUES (?, ?, ?, ?)", rows
+        )
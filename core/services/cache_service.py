@@ -1,4 +1,3 @@
-import threading
 import time
 import sqlite3
 import json
@@ -9,21 +8,28 @@ from urllib.parse import quote
 # === 基础设施 ===
 from core.config import CARDS_FOLDER, DEFAULT_DB_PATH
 from core.context import ctx
-from core.data.db_session import get_db, execute_with_retry
+from core.data.db_session import get_db, execute_with_retry, upsert_card_text
 from core.data.ui_store import load_ui_data
 
+# === 服务依赖 ===
+from core.services.scheduler_service import scheduler
+
 # === 工具函数 ===
 from core.utils.hash import get_file_hash_and_size
-from core.utils.image import extract_card_info
+from core.utils.image import extract_card_info, find_sidecar_image
 from core.utils.data import get_wi_meta
 from core.utils.text import calculate_token_count
 
 logger = logging.getLogger(__name__)
 
+RELOAD_TASK_KEY = "cache_reload"
+RELOAD_MAX_WAIT = 5.0  # 防抖重载的最长等待 (秒)
+RELOAD_WORKER = "cache_reload"  # 全量重建较慢，放在专用执行线程上，不占用调度线程
+
 # ================= 模块级辅助函数 =================
 
 def _do_reload_now():
-    """Timer 回调：执行重载"""
+    """调度器回调：执行重载"""
     with ctx.reload_lock:
         if not ctx.reload_pending:
             return
@@ -36,19 +42,14 @@ def _do_reload_now():
 
 def schedule_reload(delay: float = 0.8, reason: str = ""):
     """
-    防抖重载：在 delay 秒内多次调用只触发一次 reload。
+    防抖重载：在 delay 秒内多次调用只触发一次 reload；
+    连续调用时最迟 RELOAD_MAX_WAIT 秒后执行，避免批量操作期间缓存一直不刷新。
     """
     with ctx.reload_lock:
         ctx.reload_pending = True
         if reason:
             ctx.reload_last_reason = reason
-        
-        if ctx.reload_timer:
-            ctx.reload_timer.cancel()
-        
-        ctx.reload_timer = threading.Timer(delay, _do_reload_now)
-        ctx.reload_timer.daemon = True
-        ctx.reload_timer.start()
+    scheduler.defer(RELOAD_TASK_KEY, _do_reload_now, delay=delay, max_wait=RELOAD_MAX_WAIT, worker=RELOAD_WORKER)
 
 def force_reload(reason: str = ""):
     """强制立即重载"""
@@ -56,9 +57,7 @@ def force_reload(reason: str = ""):
         ctx.reload_pending = True
         if reason:
             ctx.reload_last_reason = reason
-        if ctx.reload_timer:
-            ctx.reload_timer.cancel()
-            ctx.reload_timer = None
+    scheduler.cancel(RELOAD_TASK_KEY)
     _do_reload_now()
 
 def update_card_cache(card_id, full_path, *, parsed_info=None, file_hash=None, file_size=None, mtime=None):
@@ -79,9 +78,19 @@ def update_card_cache(card_id, full_path, *, parsed_info=None, file_hash=None, f
         if file_hash is None or file_size is None:
             file_hash, file_size = get_file_hash_and_size(full_path)
         
+        # JSON 卡片：写入时顺带解析伴生图，避免之后读图又逐个探测扩展名
+        sidecar, sidecar_ext = None, None
+        if card_id.lower().endswith('.json'):
+            sidecar = find_sidecar_image(full_path)
+            sidecar_ext = os.path.splitext(sidecar)[1] if sidecar else ''
+
         if mtime is None:
             try: mtime = os.path.getmtime(full_path)
             except: mtime = 0
+            # 与扫描器一致：伴生图的修改时间也计入卡片版本
+            if sidecar:
+                try: mtime = max(mtime, os.path.getmtime(sidecar))
+                except OSError: pass
             
         info = parsed_info if parsed_info is not None else extract_card_info(full_path)
         
@@ -109,14 +118,11 @@ def update_card_cache(card_id, full_path, *, parsed_info=None, file_hash=None, f
 
             cursor.execute('''
                 INSERT OR REPLACE INTO card_metadata 
-                (id, char_name, description, first_mes, mes_example, tags, category, creator, char_version, last_modified, file_hash, file_size, token_count, has_character_book, character_book_name, is_favorite)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                (id, char_name, tags, category, creator, char_version, last_modified, file_hash, file_size, token_count, has_character_book, character_book_name, is_favorite, wi_checked_mtime, sidecar_ext)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 card_id,
                 char_name,
-                data_block.get('description', ''),
-                data_block.get('first_mes', ''),
-                data_block.get('mes_example', ''),
                 json.dumps(tags),
                 category,
                 data_block.get('creator', ''),
@@ -127,8 +133,11 @@ def update_card_cache(card_id, full_path, *, parsed_info=None, file_hash=None, f
                 token_count,
                 has_wi,
                 wi_name,
-                current_fav
+                current_fav,
+                mtime,
+                sidecar_ext
             ))
+            upsert_card_text(cursor, card_id, data_block)
             
             conn.commit()
     except Exception as e:
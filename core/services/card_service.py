@@ -9,19 +9,20 @@ from PIL import Image
 from urllib.parse import quote
 
 # === 基础设施 ===
-from core.config import CARDS_FOLDER, DEFAULT_DB_PATH, THUMB_FOLDER, BASE_DIR, load_config
+from core.config import CARDS_FOLDER, DEFAULT_DB_PATH, BASE_DIR, load_config
 from core.context import ctx
 from core.data.db_session import get_db
 from core.data.ui_store import load_ui_data, save_ui_data
 
 # === 服务依赖 ===
 from core.services.cache_service import update_card_cache
-from core.services.scan_service import suppress_fs_events
+from core.services.scan_service import suppress_fs_events, record_self_write
+from core.services.thumbnail_service import invalidate_thumbnail, card_image_path
 
 # === 工具函数 ===
 from core.utils.image import (
     extract_card_info, write_card_metadata, resize_image_if_needed,
-    clean_thumbnail_cache, find_sidecar_image, clean_sidecar_images
+    clean_sidecar_images
 )
 from core.utils.filesystem import save_json_atomic, sanitize_filename
 from core.utils.text import calculate_token_count
@@ -109,9 +110,6 @@ def update_card_content(card_id, temp_path, is_bundle_update, keep_ui_data, new_
     Returns:
         dict: 更新结果，包含新的 ID、URL 和更新后的卡片对象。
     """
-    # 1. 抑制文件系统事件，避免 watchdog 触发重复扫描
-    suppress_fs_events(2.5)
-    
     # 路径准备
     original_rel_path = card_id.replace('/', os.sep)
     original_full_path = os.path.join(CARDS_FOLDER, original_rel_path)
@@ -237,16 +235,20 @@ def update_card_content(card_id, temp_path, is_bundle_update, keep_ui_data, new_
         else:
             final_rel_id = new_filename
             
+        # 登记自身写入，避免 watchdog 触发重复扫描
+        suppress_fs_events(target_save_path, 2.5)
         img = Image.open(temp_path)
         img = resize_image_if_needed(img)
         save_card_atomic(target_save_path, img, final_info)
         
     # === 分支 B: 覆盖更新 ===
     else:
+        # 登记自身写入 (格式转换时原文件会被删除，一并登记)
+        suppress_fs_events([original_full_path, target_save_path], 2.5)
         # 2.1 执行归档策略
         if image_policy == 'archive_old' and os.path.exists(original_full_path):
             if old_ext == '.json':
-                sidecar = find_sidecar_image(original_full_path)
+                sidecar = card_image_path(card_id, verify=True)
                 if sidecar: _archive_file(sidecar, "archived_cover")
             else:
                 _archive_file(original_full_path, "archived_cover")
@@ -268,7 +270,7 @@ def update_card_content(card_id, temp_path, is_bundle_update, keep_ui_data, new_
                 use_old_image = True
             # 如果原文件是 JSON，尝试找伴生图
             elif old_ext == '.json':
-                sidecar = find_sidecar_image(original_full_path)
+                sidecar = card_image_path(card_id, verify=True)
                 if sidecar:
                     source_img_path = sidecar
                     use_old_image = True
@@ -292,6 +294,8 @@ def update_card_content(card_id, temp_path, is_bundle_update, keep_ui_data, new_
                 clean_sidecar_images(original_full_path)
                 if os.path.exists(original_full_path):
                     os.remove(original_full_path)
+                if ctx.cache:
+                    ctx.cache.forget_sidecar(card_id)
 
         # 情况 B: 目标是 JSON (仅当没升级格式且上传的也是 JSON 时)
         else:
@@ -336,7 +340,8 @@ def update_card_content(card_id, temp_path, is_bundle_update, keep_ui_data, new_
     try: os.utime(target_save_path, None)
     except: pass
     new_mtime = os.path.getmtime(target_save_path)
-    clean_thumbnail_cache(final_rel_id, THUMB_FOLDER)
+    record_self_write(target_save_path)
+    invalidate_thumbnail(final_rel_id)
     
     # 3. 数据库清理 (仅针对 ID 变更)
     if card_id != final_rel_id and not is_bundle_update:
@@ -426,11 +431,10 @@ def swap_skin_to_cover(card_id, skin_filename, save_old_to_resource=False):
     将资源目录下的皮肤设为当前卡片封面。
     :param save_old_to_resource: 是否将被替换的封面保存回资源目录
     """
-    suppress_fs_events(2.0)
-    
     # 1. 定位卡片
     card_rel_path = card_id.replace('/', os.sep)
     card_full_path = os.path.join(CARDS_FOLDER, card_rel_path)
+    suppress_fs_events(card_full_path, 2.0)
     
     if not os.path.exists(card_full_path):
         return {"success": False, "msg": "Card not found"}
@@ -496,6 +500,7 @@ def swap_skin_to_cover(card_id, skin_filename, save_old_to_resource=False):
         
         # 替换
         os.replace(temp_target, card_full_path)
+        record_self_write(card_full_path)
         
         # 更新数据库缓存 (Hash变了，但Meta没变，更新Hash和Size)
         from core.services.cache_service import update_card_cache
@@ -504,10 +509,8 @@ def swap_skin_to_cover(card_id, skin_filename, save_old_to_resource=False):
         f_hash, f_size = get_file_hash_and_size(card_full_path)
         update_card_cache(card_id, card_full_path, file_hash=f_hash, file_size=f_size)
         
-        # 清理缩略图
-        from core.utils.image import clean_thumbnail_cache
-        from core.config import THUMB_FOLDER
-        clean_thumbnail_cache(card_id, THUMB_FOLDER)
+        # 丢弃缩略图索引中的旧签名
+        invalidate_thumbnail(card_id)
         
         return {"success": True, "new_hash": f_hash}
         
@@ -610,6 +613,11 @@ def move_card_internal(card_id, target_category):
         basename = os.path.basename(old_full_path)
         counter = 0
         final_name = basename
+
+        # JSON 卡片的伴生图 (扫描时已记录，无需逐个探测扩展名)
+        sidecar_src = None
+        if not is_directory and basename.lower().endswith('.json'):
+            sidecar_src = card_image_path(card_id, verify=True)
         
         # 拆分文件名用于递增 (文件夹则不拆扩展名)
         if is_directory:
@@ -628,8 +636,7 @@ def move_card_internal(card_id, target_category):
                 # 如果是单文件 JSON，还需检查伴生图是否会冲突
                 if not is_directory and final_name.lower().endswith('.json'):
                     # 预测伴生图名称 (假设伴生图肯定和主文件同名)
-                    # 实际上我们需要知道原文件是否有伴生图，如果有，就得检查目标是否有同名图
-                    sidecar_src = find_sidecar_image(old_full_path)
+                    # 原文件有伴生图时，还得检查目标是否有同名图
                     if sidecar_src:
                         side_ext = os.path.splitext(sidecar_src)[1]
                         side_candidate = os.path.join(dst_base_dir, f"{name_part}_{counter}{side_ext}" if counter > 0 else f"{name_part}{side_ext}")
@@ -651,21 +658,11 @@ def move_card_internal(card_id, target_category):
         # 4. 执行物理移动
         shutil.move(old_full_path, dst_full_path)
         
-        # 如果是单文件且为 JSON，尝试移动伴生图
-        if not is_directory and basename.lower().endswith('.json'):
-            # 注意：old_full_path 已经移走了，不能再用 find_sidecar_image(old_full_path)
-            # 我们根据路径推断
-            from core.consts import SIDECAR_EXTENSIONS
-            old_dir = os.path.dirname(old_full_path)
-            new_dir = os.path.dirname(dst_full_path)
-            old_base_no_ext = os.path.splitext(basename)[0]
-            new_base_no_ext = os.path.splitext(final_name)[0]
-            
-            for ext in SIDECAR_EXTENSIONS:
-                s_src = os.path.join(old_dir, old_base_no_ext + ext)
-                if os.path.exists(s_src):
-                    s_dst = os.path.join(new_dir, new_base_no_ext + ext)
-                    shutil.move(s_src, s_dst)
+        # 如果是单文件且为 JSON，连同伴生图一起移动 (伴生图在移动前已解析)
+        if sidecar_src:
+            side_ext = os.path.splitext(sidecar_src)[1]
+            s_dst = os.path.join(os.path.dirname(dst_full_path), os.path.splitext(final_name)[0] + side_ext)
+            shutil.move(sidecar_src, s_dst)
 
         # 5. 计算新 ID
         new_id = f"{target_category}/{final_name}" if target_category else final_name
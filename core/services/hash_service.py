@@ -0,0 +1,362 @@
+import os
+import time
+import sqlite3
+import threading
+import logging
+from PIL import Image
+
+# === 基础设施 ===
+from core.config import CARDS_FOLDER, DEFAULT_DB_PATH, current_config
+from core.context import ctx
+from core.data.db_session import execute_with_retry, escape_like
+from core.data.phash_index import PHashIndex, store_phash, load_phashes
+
+# === 服务依赖 ===
+from core.services.thumbnail_service import card_image_path
+
+# === 工具函数 ===
+from core.utils.image import extract_card_info, compute_dhash
+from core.utils.hash import get_content_hash, get_card_meta_hash, get_file_hash_and_size
+
+logger = logging.getLogger(__name__)
+
+# 每批计算的卡片数
+HASH_BATCH_SIZE = 100
+# 批与批之间的停顿 (秒)，让出磁盘给前台请求
+HASH_BATCH_PAUSE = 0.5
+# 没有待处理卡片、或扫描进行中时的等待间隔 (秒)
+HASH_IDLE_SLEEP = 30
+# file_hash 是采样签名，计算很快，批次可以更大
+FILE_HASH_BATCH_SIZE = 500
+# 有前台请求进行中时，每次让出的时长 (秒)
+HASH_YIELD_SLEEP = 0.2
+
+# file_hash 补算的键集分页游标：失败项 (如文件已被删除) 不会在同一轮中被反复取出
+_file_hash_cursor = {"last_id": "", "updated": 0}
+
+
+def _pending_file_hash_batch(limit=FILE_HASH_BATCH_SIZE):
+    """
+    取出 file_hash 为空的卡片 (扫描器在文件变化时会清空该字段)。
+    按 id 顺序分页；一轮走完后从头开始，若整轮没有任何成功项则视为已完成。
+    待处理状态就是数据库中的空值本身，因此重启后自然从剩余部分继续。
+    """
+    def _read():
+        with sqlite3.connect(DEFAULT_DB_PATH, timeout=30) as conn:
+            return conn.execute('''
+                SELECT id, last_modified FROM card_metadata
+                WHERE (file_hash IS NULL OR file_hash = '') AND id > ?
+                ORDER BY id LIMIT ?
+            ''', (_file_hash_cursor["last_id"], limit)).fetchall()
+    rows = execute_with_retry(_read)
+    if rows:
+        _file_hash_cursor["last_id"] = rows[-1][0]
+        return rows
+
+    # 本轮结束
+    round_updated = _file_hash_cursor["updated"]
+    _file_hash_cursor["last_id"] = ""
+    _file_hash_cursor["updated"] = 0
+    if round_updated == 0:
+        return []
+    return _pending_file_hash_batch(limit)
+
+
+def _file_hash_batch(rows):
+    hashes = {}
+    params = []
+    for card_id, mtime in rows:
+        full_path = os.path.join(CARDS_FOLDER, card_id.replace('/', os.sep))
+        if not os.path.exists(full_path):
+            continue
+        file_hash, _ = get_file_hash_and_size(full_path)
+        if file_hash:
+            hashes[card_id] = file_hash
+            params.append((file_hash, card_id, mtime))
+    if not params:
+        return 0
+
+    def _write():
+        with sqlite3.connect(DEFAULT_DB_PATH, timeout=30) as conn:
+            # last_modified 作为乐观锁：期间文件又被扫描器更新过的行不写入
+            conn.executemany(
+                "UPDATE card_metadata SET file_hash = ? WHERE id = ? AND last_modified = ?", params
+            )
+    execute_with_retry(_write)
+
+    if ctx.cache:
+        ctx.cache.update_file_hashes(hashes)
+    _file_hash_cursor["updated"] += len(params)
+    return len(params)
+
+
+def _count_pending_file_hash(conn):
+    return conn.execute(
+        "SELECT COUNT(*) FROM card_metadata WHERE file_hash IS NULL OR file_hash = ''"
+    ).fetchone()[0]
+
+
+def _pending_batch(limit=HASH_BATCH_SIZE):
+    """取出尚未计算、或文件已变化 (mtime/size 不一致) 的卡片"""
+    def _read():
+        with sqlite3.connect(DEFAULT_DB_PATH, timeout=30) as conn:
+            return conn.execute('''
+                SELECT m.id, m.last_modified, m.file_size
+                FROM card_metadata m
+                LEFT JOIN card_hashes h ON h.id = m.id
+                WHERE h.id IS NULL OR h.mtime IS NOT m.last_modified OR h.size IS NOT m.file_size
+                LIMIT ?
+            ''', (limit,)).fetchall()
+    return execute_with_retry(_read)
+
+
+def _count_pending_phash(conn):
+    return conn.execute('''
+        SELECT COUNT(*) FROM card_metadata m
+        LEFT JOIN card_phash p ON p.id = m.id
+        WHERE p.id IS NULL OR p.mtime IS NOT m.last_modified OR p.size IS NOT m.file_size
+    ''').fetchone()[0]
+
+
+def count_pending_hashes(conn):
+    """统计哈希尚未就绪的卡片数"""
+    return conn.execute('''
+        SELECT COUNT(*) FROM card_metadata m
+        LEFT JOIN card_hashes h ON h.id = m.id
+        WHERE h.id IS NULL OR h.mtime IS NOT m.last_modified OR h.size IS NOT m.file_size
+    ''').fetchone()[0]
+
+
+def compute_card_hashes(card_id):
+    """返回 (content_hash, meta_hash)；文件不存在时返回 None"""
+    full_path = os.path.join(CARDS_FOLDER, card_id.replace('/', os.sep))
+    if not os.path.exists(full_path):
+        return None
+    content_hash = get_content_hash(full_path)
+    try:
+        meta_hash = get_card_meta_hash(extract_card_info(full_path))
+    except Exception:
+        meta_hash = ""
+    return content_hash, meta_hash
+
+
+def _hash_batch(rows):
+    results = []
+    for card_id, mtime, size in rows:
+        try:
+            hashes = compute_card_hashes(card_id)
+        except Exception as e:
+            logger.warning(f"Content hash failed for {card_id}: {e}")
+            hashes = None
+        # 失败也写入一行 (空哈希)，避免每轮重复尝试；文件变化后会再次计算
+        content_hash, meta_hash = hashes or ("", "")
+        results.append((card_id, content_hash, meta_hash, mtime, size))
+
+    def _write():
+        with sqlite3.connect(DEFAULT_DB_PATH, timeout=30) as conn:
+            conn.executemany('''
+                INSERT OR REPLACE INTO card_hashes (id, content_hash, meta_hash, mtime, size)
+                VALUES (?, ?, ?, ?, ?)
+            ''', results)
+    execute_with_retry(_write)
+    return len(results)
+
+
+def _pending_phash_batch(limit=HASH_BATCH_SIZE):
+    """取出还没有感知哈希、或图片已变化 (mtime/size 不一致) 的卡片"""
+    def _read():
+        with sqlite3.connect(DEFAULT_DB_PATH, timeout=30) as conn:
+            return conn.execute('''
+                SELECT m.id, m.last_modified, m.file_size
+                FROM card_metadata m
+                LEFT JOIN card_phash p ON p.id = m.id
+                WHERE p.id IS NULL OR p.mtime IS NOT m.last_modified OR p.size IS NOT m.file_size
+                LIMIT ?
+            ''', (limit,)).fetchall()
+    return execute_with_retry(_read)
+
+
+def compute_card_phash(card_id):
+    """
+    读取卡片图片 (JSON 卡片取伴生图) 计算 dHash；没有图片时返回 None。
+    感知哈希只在这里计算 (缩略图生成不再顺带写入)，保证所有卡片的哈希出自同一输入，彼此可比。
+    """
+    full_path = card_image_path(card_id, verify=True)
+    if not full_path or not os.path.exists(full_path):
+        return None
+    with Image.open(full_path) as img:
+        # draft 让 JPEG 直接以低分辨率解码
+        img.draft('L', (64, 64))
+        return compute_dhash(img)
+
+
+def _phash_batch(rows):
+    results = []
+    for card_id, mtime, size in rows:
+        try:
+            phash = compute_card_phash(card_id)
+        except Exception as e:
+            logger.warning(f"Perceptual hash failed for {card_id}: {e}")
+            phash = None
+        # 失败也写入一行 (空哈希)，避免每轮重复尝试；文件变化后会再次计算
+        results.append((card_id, phash, mtime, size))
+
+    def _write():
+        with sqlite3.connect(DEFAULT_DB_PATH, timeout=30) as conn:
+            for card_id, phash, mtime, size in results:
+                store_phash(conn, card_id, phash, mtime, size)
+    execute_with_retry(_write)
+    return len(results)
+
+
+# 按优先级排列的哈希阶段: (名称, 取批次, 处理批次, 统计待处理数)
+_PHASES = [
+    ("file_hash", _pending_file_hash_batch, _file_hash_batch, _count_pending_file_hash),
+    ("content", _pending_batch, _hash_batch, count_pending_hashes),
+    ("phash", _pending_phash_batch, _phash_batch, _count_pending_phash),
+]
+
+
+def _refresh_pending_counts():
+    def _read():
+        with sqlite3.connect(DEFAULT_DB_PATH, timeout=30) as conn:
+            return {name: count(conn) for name, _, _, count in _PHASES}
+    counts = execute_with_retry(_read)
+    with ctx.hash_status_lock:
+        for name, pending in counts.items():
+            phase = ctx.hash_status["phases"].setdefault(name, {"done": 0})
+            phase["pending"] = pending
+
+
+def _record_progress(name, processed, done):
+    with ctx.hash_status_lock:
+        phase = ctx.hash_status["phases"].setdefault(name, {"done": 0, "pending": 0})
+        phase["done"] += done
+        phase["pending"] = max(0, phase.get("pending", 0) - processed)
+        phase["last_batch"] = time.time()
+
+
+def _set_running(name):
+    with ctx.hash_status_lock:
+        ctx.hash_status["running"] = name
+
+
+def _yield_to_foreground():
+    """有前台请求进行中时让出，避免与页面加载争抢磁盘"""
+    while ctx.active_requests > 0:
+        time.sleep(HASH_YIELD_SLEEP)
+
+
+def get_hash_status():
+    """返回后台哈希进度的快照 (可直接 JSON 序列化)"""
+    with ctx.hash_status_lock:
+        return {
+            "running": ctx.hash_status["running"],
+            "phases": {k: dict(v) for k, v in ctx.hash_status["phases"].items()},
+        }
+
+
+def _hasher_loop():
+    was_idle = True
+    while True:
+        if ctx.init_status.get('status') != 'ready' or ctx.scan_in_progress:
+            time.sleep(HASH_IDLE_SLEEP)
+            was_idle = True
+            continue
+        worked = False
+        try:
+            if was_idle:
+                _refresh_pending_counts()
+            for name, fetch, process, _ in _PHASES:
+                _yield_to_foreground()
+                batch = fetch()
+                if not batch:
+                    continue
+                _set_running(name)
+                done = process(batch)
+                _record_progress(name, len(batch), done)
+                worked = True
+                break
+        except Exception as e:
+            logger.error(f"Content hasher error: {e}")
+        finally:
+            _set_running(None)
+
+        was_idle = not worked
+        time.sleep(HASH_BATCH_PAUSE if worked else HASH_IDLE_SLEEP)
+
+
+def find_duplicates(conn, kind="content", category=None):
+    """
+    查找重复卡片。
+
+    Args:
+        kind: "content" 表示文件完全相同；"meta" 表示卡片数据相同 (忽略格式、字段顺序与标签)。
+        category: 仅在该分类 (含子分类) 内查找；None 表示全部。
+
+    Returns:
+        list: [{"hash": ..., "cards": [{id, char_name, category, file_size, last_modified}, ...]}, ...]
+    """
+    col = "content_hash" if kind == "content" else "meta_hash"
+    params = []
+    where = f"h.{col} != '' AND h.mtime IS m.last_modified AND h.size IS m.file_size"
+    if category:
+        where += " AND (m.category = ? OR m.category LIKE ? || '/%' ESCAPE '\\')"
+        params += [category, escape_like(category)]
+
+    rows = conn.execute(f'''
+        SELECT h.{col}, m.id, m.char_name, m.category, m.file_size, m.last_modified
+        FROM card_hashes h JOIN card_metadata m ON m.id = h.id
+        WHERE {where} AND h.{col} IN (
+            SELECT {col} FROM card_hashes WHERE {col} != '' GROUP BY {col} HAVING COUNT(*) > 1
+        )
+        ORDER BY h.{col}, m.id
+    ''', params).fetchall()
+
+    groups = {}
+    for h, cid, name, cat, size, mtime in rows:
+        groups.setdefault(h, []).append({
+            "id": cid, "char_name": name, "category": cat,
+            "file_size": size, "last_modified": mtime,
+        })
+    return [{"hash": h, "cards": cards} for h, cards in groups.items() if len(cards) > 1]
+
+
+def find_near_duplicates(conn, max_distance, card_id=None, progress_cb=None, cancel_cb=None):
+    """
+    按头像感知哈希查找近似重复。
+
+    Args:
+        max_distance: 允许的最大汉明距离 (0-64 位中不同的位数)。
+        card_id: 指定时只返回与该卡片相似的卡片；否则返回全库分组 (耗时较长，应在后台任务中执行)。
+        progress_cb / cancel_cb: 全库分组时透传给 PHashIndex.groups。
+
+    Returns:
+        card_id 为空时: [[card_id, ...], ...]
+        指定 card_id 时: [{"id": ..., "distance": ...}, ...]；该卡片尚无哈希时返回 None
+    """
+    items = load_phashes(conn)
+    index = PHashIndex(items, max_distance)
+    if card_id is None:
+        return index.groups(progress_cb, cancel_cb)
+
+    target = next((h for cid, h in items if cid == card_id), None)
+    if target is None:
+        return None
+    return [
+        {"id": cid, "distance": d}
+        for cid, d in index.query(target) if cid != card_id
+    ]
+
+
+def start_content_hasher():
+    """
+    启动后台哈希线程 (可通过 enable_content_hasher 关闭)，按优先级依次处理：
+    补算扫描器留空的 file_hash → 全量内容哈希 → 缺失的头像感知哈希。
+    """
+    if not current_config.get("enable_content_hasher", True):
+        logger.info("Content hasher is disabled by config (enable_content_hasher = false).")
+        return
+    t = threading.Thread(target=_hasher_loop, daemon=True)
+    t.start()
+    logger.info("Content hasher started.")
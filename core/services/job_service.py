@@ -0,0 +1,332 @@
+import time
+import json
+import uuid
+import sqlite3
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# === 基础设施 ===
+from core.config import DEFAULT_DB_PATH
+from core.data.db_session import execute_with_retry
+
+logger = logging.getLogger(__name__)
+
+# 同时运行的后台任务上限 (任务多为磁盘 IO 密集型，并发过高反而拖慢前台请求)
+JOB_WORKERS = 2
+# 进度/断点写入数据库的最小间隔 (秒)，内存中的状态始终实时
+JOB_PERSIST_INTERVAL = 1.0
+# 已结束任务记录的保留时长 (秒)
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = {JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED}
+
+
+class JobCancelled(Exception):
+    """任务处理函数在检查点发现取消请求时抛出"""
+    pass
+
+
+class Job:
+    """
+    单个后台任务的运行时句柄，传给任务处理函数。
+    处理函数通过它汇报进度、保存断点、检查取消。
+    """
+    def __init__(self, job_id, job_type, params, created_at=None, checkpoint=None):
+        self.id = job_id
+        self.type = job_type
+        self.params = params or {}
+        self.status = JOB_QUEUED
+        self.progress = 0
+        self.total = 0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.checkpoint = checkpoint or {}
+        self.resumed = bool(checkpoint)
+        self.created_at = created_at or time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self._last_persist = 0.0
+        self._manager = None
+
+    # --- 供任务处理函数调用 ---
+
+    def set_progress(self, progress=None, total=None, message=None):
+        """更新进度；按 JOB_PERSIST_INTERVAL 节流写入数据库"""
+        if progress is not None:
+            self.progress = progress
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+        self._maybe_persist()
+
+    def save_checkpoint(self, data):
+        """保存断点数据，进程重启后任务以 job.checkpoint 恢复执行"""
+        self.checkpoint = data or {}
+        self._maybe_persist()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        """协作式取消：在循环的安全位置调用"""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    # --- 内部 ---
+
+    def _maybe_persist(self, force=False):
+        now = time.time()
+        if force or now - self._last_persist >= JOB_PERSIST_INTERVAL:
+            self._last_persist = now
+            if self._manager:
+                self._manager._persist(self)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "type": self.type,
+            "status": self.status,
+            "progress": self.progress,
+            "total": self.total,
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "params": self.params,
+            "resumed": self.resumed,
+            "cancel_requested": self.cancel_event.is_set(),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    后台任务管理器：
+    - 任务记录持久化在 jobs 表中，重启后未完成的任务自动恢复 (resume_pending)；
+    - 固定大小的线程池执行任务，避免长操作占用 Flask 请求线程；
+    - 处理函数签名为 handler(job, params) -> result(dict)，在 Flask app_context 中运行，
+      因此可以直接使用 get_db() 等依赖请求上下文的服务函数。
+    """
+    def __init__(self, max_workers=JOB_WORKERS):
+        self._handlers = {}
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._app = None
+        self._deferred = []
+
+    def init_app(self, app):
+        self._app = app
+        # app 创建前恢复的任务在此时才真正入队
+        deferred, self._deferred = self._deferred, []
+        for job in deferred:
+            self._enqueue(job)
+
+    def register(self, job_type, handler):
+        """注册任务类型"""
+        self._handlers[job_type] = handler
+
+    # ================= 提交 / 查询 / 取消 =================
+
+    def submit(self, job_type, params=None):
+        if job_type not in self._handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        job = Job(uuid.uuid4().hex, job_type, params)
+        self._enqueue(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job:
+            return job.to_dict()
+        rows = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._row_to_dict(rows[0]) if rows else None
+
+    def list_jobs(self, limit=50, active_only=False):
+        sql = "SELECT * FROM jobs"
+        if active_only:
+            sql += f" WHERE status IN ('{JOB_QUEUED}', '{JOB_RUNNING}')"
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        result = []
+        with self._lock:
+            live = {jid: j.to_dict() for jid, j in self._jobs.items()}
+        for row in self._query(sql, (limit,)):
+            # 运行中的任务以内存状态为准 (数据库中的进度是节流写入的)
+            result.append(live.get(row['id']) or self._row_to_dict(row))
+        return result
+
+    def cancel(self, job_id):
+        """请求取消任务。排队中的任务直接取消，运行中的任务在下一个检查点退出"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if not job or job.status in FINISHED_STATES:
+            return False
+        job.cancel_event.set()
+        job._maybe_persist(force=True)
+        return True
+
+    # ================= 启动恢复 =================
+
+    def resume_pending(self):
+        """
+        重新排队上次进程退出时尚未完成的任务，并清理过期记录。
+        应在缓存加载完成后调用。
+        """
+        try:
+            self._execute(
+                "DELETE FROM jobs WHERE status IN (?, ?, ?) AND finished_at < ?",
+                (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED, time.time() - JOB_RETENTION_SECONDS)
+            )
+            rows = self._query(
+                "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at ASC",
+                (JOB_QUEUED, JOB_RUNNING)
+            )
+        except Exception as e:
+            logger.error(f"Failed to load pending jobs: {e}")
+            return
+
+        for row in rows:
+            if row['type'] not in self._handlers:
+                self._execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                    (JOB_FAILED, "unknown job type", time.time(), row['id'])
+                )
+                continue
+            if row['cancel_requested']:
+                self._execute(
+                    "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?",
+                    (JOB_CANCELLED, time.time(), row['id'])
+                )
+                continue
+            params = json.loads(row['params']) if row['params'] else {}
+            checkpoint = json.loads(row['checkpoint']) if row['checkpoint'] else {}
+            job = Job(row['id'], row['type'], params, created_at=row['created_at'], checkpoint=checkpoint)
+            # 即使没有断点数据，也标记为恢复执行，处理函数据此可做幂等跳过
+            job.resumed = True
+            job.progress = row['progress'] or 0
+            job.total = row['total'] or 0
+            logger.info(f"Resuming job {job.id} ({job.type})")
+            if self._app is None:
+                self._deferred.append(job)
+            else:
+                self._enqueue(job)
+
+    # ================= 内部实现 =================
+
+    def _enqueue(self, job):
+        job._manager = self
+        with self._lock:
+            self._jobs[job.id] = job
+        job._maybe_persist(force=True)
+        self._pool.submit(self._run, job)
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            self._finish(job, JOB_CANCELLED)
+            return
+
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        job._maybe_persist(force=True)
+
+        handler = self._handlers[job.type]
+        try:
+            if self._app is not None:
+                with self._app.app_context():
+                    job.result = handler(job, job.params)
+            else:
+                job.result = handler(job, job.params)
+            self._finish(job, JOB_SUCCEEDED)
+        except JobCancelled:
+            self._finish(job, JOB_CANCELLED)
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.type}) failed: {e}")
+            job.error = str(e)
+            self._finish(job, JOB_FAILED)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        job._maybe_persist(force=True)
+        # 已结束的任务只保留在数据库中
+        with self._lock:
+            self._jobs.pop(job.id, None)
+
+    def _persist(self, job):
+        def _write():
+            with sqlite3.connect(DEFAULT_DB_PATH, timeout=30) as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO jobs
+                    (id, type, status, params, progress, total, message, result, error, checkpoint,
+                     cancel_requested, created_at, started_at, finished_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    job.id, job.type, job.status,
+                    json.dumps(job.params, ensure_ascii=False),
+                    job.progress, job.total, job.message,
+                    json.dumps(job.result, ensure_ascii=False) if job.result is not None else None,
+                    job.error,
+                    json.dumps(job.checkpoint, ensure_ascii=False) if job.checkpoint else None,
+                    1 if job.cancel_event.is_set() else 0,
+                    job.created_at, job.started_at, job.finished_at
+                ))
+        try:
+            execute_with_retry(_write)
+        except Exception as e:
+            logger.warning(f"Failed to persist job {job.id}: {e}")
+
+    def _query(self, sql, params=()):
+        def _read():
+            conn = sqlite3.connect(DEFAULT_DB_PATH, timeout=30)
+            conn.row_factory = sqlite3.Row
+            try:
+                return conn.execute(sql, params).fetchall()
+            finally:
+                conn.close()
+        return execute_with_retry(_read)
+
+    def _execute(self, sql, params=()):
+        def _write():
+            with sqlite3.connect(DEFAULT_DB_PATH, timeout=30) as conn:
+                conn.execute(sql, params)
+        execute_with_retry(_write)
+
+    @staticmethod
+    def _row_to_dict(row):
+        def _load(val):
+            try:
+                return json.loads(val) if val else None
+            except Exception:
+                return None
+        return {
+            "id": row['id'],
+            "type": row['type'],
+            "status": row['status'],
+            "progress": row['progress'] or 0,
+            "total": row['total'] or 0,
+            "message": row['message'] or "",
+            "result": _load(row['result']),
+            "error": row['error'],
+            "params": _load(row['params']) or {},
+            "resumed": False,
+            "cancel_requested": bool(row['cancel_requested']),
+            "created_at": row['created_at'],
+            "started_at": row['started_at'],
+            "finished_at": row['finished_at'],
+        }
+
+
+# 全局单例
+job_manager = JobManager()
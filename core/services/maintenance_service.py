@@ -0,0 +1,203 @@
+import os
+import time
+import sqlite3
+import logging
+
+# === 基础设施 ===
+from core.config import DEFAULT_DB_PATH, current_config
+from core.context import ctx
+
+# === 服务依赖 ===
+from core.services.scheduler_service import scheduler
+
+logger = logging.getLogger(__name__)
+
+# 调度器上的周期任务 key 与检查间隔 (秒)
+MAINTENANCE_TASK_KEY = "db_maintenance"
+MAINTENANCE_TICK = 30
+# VACUUM/ANALYZE 可能持续较久，在专用执行线程上运行，不阻塞调度线程上的其它任务
+MAINTENANCE_WORKER = "db_maintenance"
+# 距离最近一次请求多久之后才视为空闲 (秒)
+MAINTENANCE_IDLE_SECONDS = 60
+
+# 各维护任务的最小执行间隔 (秒)
+CHECKPOINT_INTERVAL = 5 * 60
+OPTIMIZE_INTERVAL = 60 * 60
+ANALYZE_INTERVAL = 24 * 60 * 60
+VACUUM_INTERVAL = 6 * 60 * 60
+
+# WAL 文件超过该大小时不等间隔到期，空闲即 checkpoint
+WAL_CHECKPOINT_BYTES = 64 * 1024 * 1024
+# 单次增量 VACUUM 回收的最大页数，避免长时间持有写锁
+INCREMENTAL_VACUUM_PAGES = 2000
+# 非增量模式的数据库：空闲页占比超过该值时执行一次完整 VACUUM 并切换为增量模式
+FULL_VACUUM_FREE_RATIO = 0.2
+
+# SQLite auto_vacuum 取值
+_AUTO_VACUUM_NONE = 0
+_AUTO_VACUUM_INCREMENTAL = 2
+
+
+def _connect():
+    # busy_timeout 很短：维护任务优先级最低，遇到锁直接放弃，下个周期再试
+    conn = sqlite3.connect(DEFAULT_DB_PATH, timeout=1)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL;")
+    except Exception:
+        pass
+    return conn
+
+
+def _wal_size():
+    try:
+        return os.path.getsize(DEFAULT_DB_PATH + '-wal')
+    except OSError:
+        return 0
+
+
+def _task_checkpoint(conn):
+    before = _wal_size()
+    busy, log_frames, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE);").fetchone()
+    return {
+        "busy": bool(busy),
+        "wal_frames": log_frames,
+        "checkpointed_frames": checkpointed,
+        "wal_bytes_before": before,
+        "wal_bytes_after": _wal_size(),
+    }
+
+
+def _task_optimize(conn):
+    conn.execute("PRAGMA optimize;")
+    return {}
+
+
+def _task_analyze(conn):
+    conn.execute("ANALYZE;")
+    conn.commit()
+    return {}
+
+
+def _task_vacuum(conn):
+    mode = conn.execute("PRAGMA auto_vacuum;").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count;").fetchone()[0] or 1
+
+    if mode == _AUTO_VACUUM_INCREMENTAL:
+        if free_pages > 0:
+            # incremental_vacuum 每执行一步只释放一页；sqlite3 的 execute() 对无结果列的语句只执行一步
+            # (fetchall 也无济于事)，executescript 会把语句执行到底
+            conn.executescript(f"PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_PAGES});")
+        freed = free_pages - conn.execute("PRAGMA freelist_count;").fetchone()[0]
+        return {"mode": "incremental", "freed_pages": freed}
+
+    # 旧数据库未开启增量模式：碎片足够多时做一次完整 VACUUM，并借此切换为增量模式
+    if mode == _AUTO_VACUUM_NONE and free_pages / page_count >= FULL_VACUUM_FREE_RATIO:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+        conn.execute("VACUUM;")
+        return {"mode": "full", "freed_pages": free_pages}
+
+    return {"mode": "skipped", "freed_pages": 0}
+
+
+# (任务名, 执行函数, 最小间隔)
+_TASKS = [
+    ("checkpoint", _task_checkpoint, CHECKPOINT_INTERVAL),
+    ("optimize", _task_optimize, OPTIMIZE_INTERVAL),
+    ("analyze", _task_analyze, ANALYZE_INTERVAL),
+    ("vacuum", _task_vacuum, VACUUM_INTERVAL),
+]
+
+
+def _is_due(name, interval, now):
+    with ctx.maintenance_lock:
+        task = ctx.maintenance_status["tasks"].get(name, {})
+        last = task.get("last_run", 0)
+        # 真正的失败 (非数据库忙) 同样等满一个间隔再试，避免每个周期重复报错；数据库忙则下个周期即重试
+        if task.get("error") and not task.get("busy"):
+            last = max(last, task.get("last_attempt", 0))
+    if name == "checkpoint" and _wal_size() >= WAL_CHECKPOINT_BYTES:
+        return True
+    return (now - last) >= interval
+
+
+def _run_task(name, func):
+    with ctx.maintenance_lock:
+        ctx.maintenance_status["running"] = name
+
+    started = time.time()
+    with ctx.maintenance_lock:
+        previous = ctx.maintenance_status["tasks"].get(name, {})
+    # last_run 只记录成功的执行 (决定下次到期时间)；每次尝试都记 last_attempt
+    record = {"last_run": previous.get("last_run", 0), "last_attempt": started, "success": False}
+    try:
+        conn = _connect()
+        try:
+            detail = func(conn)
+        finally:
+            conn.close()
+        record["success"] = True
+        record["last_run"] = started
+        record["detail"] = detail
+    except sqlite3.OperationalError as e:
+        record["error"] = str(e)
+        if "locked" in str(e).lower():
+            # 数据库忙：不算失败，不更新 last_run，下个周期重试
+            record["busy"] = True
+            logger.info(f"DB maintenance '{name}' skipped: {e}")
+        else:
+            logger.warning(f"DB maintenance '{name}' failed: {e}")
+    except Exception as e:
+        record["error"] = str(e)
+        logger.warning(f"DB maintenance '{name}' failed: {e}")
+
+    record["duration"] = round(time.time() - started, 3)
+    with ctx.maintenance_lock:
+        ctx.maintenance_status["tasks"][name] = record
+        ctx.maintenance_status["running"] = None
+
+    if record["success"]:
+        logger.info(f"DB maintenance '{name}' done in {record['duration']}s")
+
+
+def run_maintenance_once(force=False):
+    """
+    执行一轮维护：按顺序检查每项任务是否到期。
+    每项任务执行前都重新确认应用仍处于空闲状态，一旦有请求或扫描进入立即让出。
+    """
+    now = time.time()
+    for name, func, interval in _TASKS:
+        if not force:
+            if not ctx.is_idle(MAINTENANCE_IDLE_SECONDS):
+                return
+            if not _is_due(name, interval, now):
+                continue
+        _run_task(name, func)
+
+
+def get_maintenance_status():
+    """返回维护状态的快照 (可直接 JSON 序列化)"""
+    with ctx.maintenance_lock:
+        return {
+            "running": ctx.maintenance_status["running"],
+            "tasks": {k: dict(v) for k, v in ctx.maintenance_status["tasks"].items()},
+        }
+
+
+def _maintenance_tick():
+    """调度器周期回调：应用就绪后检查一轮维护任务"""
+    if ctx.init_status.get('status') != 'ready':
+        return
+    try:
+        run_maintenance_once()
+    except Exception as e:
+        logger.error(f"DB maintenance tick error: {e}")
+
+
+def start_maintenance_worker():
+    """在统一调度器上注册周期维护任务 (可通过 enable_db_maintenance 关闭)"""
+    if not current_config.get("enable_db_maintenance", True):
+        logger.info("DB maintenance is disabled by config (enable_db_maintenance = false).")
+        return
+    scheduler.every(MAINTENANCE_TASK_KEY, _maintenance_tick, MAINTENANCE_TICK, worker=MAINTENANCE_WORKER)
+    logger.info("DB maintenance scheduled.")
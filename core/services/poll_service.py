@@ -0,0 +1,165 @@
+import os
+import time
+import threading
+import logging
+
+# === 基础设施 ===
+from core.config import CARDS_FOLDER, load_config
+from core.context import ctx
+
+# === 服务依赖 ===
+from core.services.scan_service import request_scan
+
+# === 工具函数 ===
+from core.utils.walker import scan_tree, get_ignore_rules
+
+logger = logging.getLogger(__name__)
+
+# 轮询参数默认值 (均可在 config.json 中覆盖)
+DEFAULT_POLL_INTERVAL_MIN = 5        # 检测到变动后的轮询间隔 (秒)
+DEFAULT_POLL_INTERVAL_MAX = 120      # 长时间无变动时逐步放宽到的上限 (秒)
+DEFAULT_POLL_IO_RATE = 200           # 每秒最多的 stat/scandir 次数，避免占满网络共享
+DEFAULT_POLL_FULL_SCAN_INTERVAL = 900  # 兜底全量扫描间隔 (秒)，0 表示关闭
+POLL_BACKOFF = 1.5
+
+
+class _RateLimiter:
+    """简单的令牌桶：acquire() 在超出速率时休眠"""
+    def __init__(self, rate):
+        self.rate = max(1.0, float(rate))
+        self.tokens = self.rate
+        self.last = time.monotonic()
+
+    def acquire(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1:
+            time.sleep((1 - self.tokens) / self.rate)
+            self.last = time.monotonic()
+            self.tokens = 0
+        else:
+            self.tokens -= 1
+
+
+class DirectoryPoller:
+    """
+    轮询式变动检测 (用于 SMB/NFS 等收不到 inotify 事件的网络共享)：
+    - 只 stat 各目录的 mtime：目录内文件新增/删除/改名 (含原子保存) 都会改变目录 mtime；
+    - mtime 变化的目录重新 scandir 一层，发现新增子目录；
+    - 变动目录交给 request_scan(paths=...) 走定向扫描；
+    - 原地改写文件内容不改变目录 mtime，由低频的兜底全量扫描覆盖。
+    """
+    def __init__(self, root, interval_min, interval_max, io_rate, full_scan_interval):
+        self.root = root
+        self.interval_min = max(1.0, float(interval_min))
+        self.interval_max = max(self.interval_min, float(interval_max))
+        self.full_scan_interval = float(full_scan_interval or 0)
+        self.limiter = _RateLimiter(io_rate)
+        self.ignore = get_ignore_rules()
+        self.dir_mtimes = {}
+        self.stop_event = threading.Event()
+        self.interval = self.interval_min
+        self.last_full_scan = time.time()
+
+    def _full_path(self, rel):
+        return os.path.join(self.root, rel.replace('/', os.sep)) if rel else self.root
+
+    def _snapshot(self, rel=""):
+        """遍历 rel 子树并记录目录 mtime，返回新发现的目录"""
+        tree = scan_tree(
+            self._full_path(rel), ignore=self.ignore, collect_files=False,
+            rel_root=rel, dir_stat=True, throttle=self.limiter.acquire
+        )
+        new_dirs = [d for d in tree.dir_mtimes if d not in self.dir_mtimes]
+        self.dir_mtimes.update(tree.dir_mtimes)
+        return new_dirs
+
+    def _forget(self, rel):
+        """目录消失：移除它及其所有子目录"""
+        prefix = rel + '/'
+        for d in [d for d in self.dir_mtimes if d == rel or d.startswith(prefix)]:
+            del self.dir_mtimes[d]
+
+    def sweep(self):
+        """执行一轮目录 mtime 检测，返回发生变动的目录集合"""
+        changed = set()
+        for rel in list(self.dir_mtimes):
+            if self.stop_event.is_set():
+                break
+            old_mtime = self.dir_mtimes.get(rel)
+            if old_mtime is None:
+                continue  # 本轮已随上级目录一起移除
+
+            self.limiter.acquire()
+            try:
+                mtime = os.stat(self._full_path(rel)).st_mtime_ns
+            except FileNotFoundError:
+                if rel:
+                    self._forget(rel)
+                    changed.add(rel)
+                continue
+            except OSError:
+                # 网络抖动等暂时错误：不当作删除，下一轮再看
+                continue
+
+            if mtime == old_mtime:
+                continue
+
+            self.dir_mtimes[rel] = mtime
+            changed.add(rel)
+            # 只看一层：新出现的子目录整棵记录并视为变动
+            tree = scan_tree(
+                self._full_path(rel), ignore=self.ignore, collect_files=False, max_depth=0,
+                rel_root=rel, throttle=self.limiter.acquire
+            )
+            for sub in tree.folders:
+                if sub not in self.dir_mtimes:
+                    changed.update(self._snapshot(sub))
+        return changed
+
+    def run(self):
+        try:
+            self._snapshot()
+        except Exception as e:
+            logger.error(f"Polling scanner failed to build snapshot: {e}")
+            return
+        logger.info(f"Polling scanner started: {len(self.dir_mtimes)} dir(s) under {self.root}")
+
+        while not self.stop_event.wait(self.interval):
+            # 应用初始化期间不检测 (扫描线程同样会等待)
+            if ctx.init_status.get('status') != 'ready':
+                continue
+            try:
+                changed = self.sweep()
+            except Exception as e:
+                logger.error(f"Polling scanner sweep error: {e}")
+                changed = set()
+
+            if changed:
+                request_scan(reason="poll", paths=changed)
+                self.interval = self.interval_min
+            else:
+                # 无变动时逐步放宽间隔，减少对共享的访问
+                self.interval = min(self.interval * POLL_BACKOFF, self.interval_max)
+
+            if self.full_scan_interval and time.time() - self.last_full_scan >= self.full_scan_interval:
+                self.last_full_scan = time.time()
+                request_scan(reason="poll_full")
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def start_poller(root=CARDS_FOLDER):
+    """启动轮询检测线程，返回 DirectoryPoller 实例"""
+    cfg = load_config()
+    poller = DirectoryPoller(
+        root,
+        interval_min=cfg.get("poll_interval_min", DEFAULT_POLL_INTERVAL_MIN),
+        interval_max=cfg.get("poll_interval_max", DEFAULT_POLL_INTERVAL_MAX),
+        io_rate=cfg.get("poll_io_rate", DEFAULT_POLL_IO_RATE),
+        full_scan_interval=cfg.get("poll_full_scan_interval", DEFAULT_POLL_FULL_SCAN_INTERVAL),
+    )
+    threading.Thread(target=poller.run, daemon=True, name="fs-poller").start()
+    return poller
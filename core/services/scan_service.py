@@ -7,79 +7,147 @@ import logging
 
 # === 基础设施 ===
 from core.config import CARDS_FOLDER, DEFAULT_DB_PATH, current_config
+from core.consts import SIDECAR_EXTENSIONS
 from core.context import ctx
+from core.data.db_session import upsert_card_text, escape_like
 
 # === 业务逻辑引用 ===
 from core.services.cache_service import schedule_reload
+from core.services.scheduler_service import scheduler
+from core.services.thumbnail_service import enqueue_thumbnails
 
 # === 工具函数 ===
-from core.utils.filesystem import is_card_file
+from core.utils.filesystem import is_card_file, is_sidecar_image, is_network_path
 from core.utils.image import extract_card_info
 from core.utils.text import calculate_token_count
 from core.utils.data import get_wi_meta, sanitize_for_utf8
+from core.utils.walker import scan_tree, get_ignore_rules
 
 logger = logging.getLogger(__name__)
 
-def suppress_fs_events(seconds: float = 1.5):
+SCAN_TASK_KEY = "scan_request"
+SCAN_DEBOUNCE = 1.0   # 扫描请求防抖 (秒)
+SCAN_MAX_WAIT = 5.0   # 持续有事件时的最长等待 (秒)
+
+def suppress_fs_events(paths, seconds: float = 1.5, recursive: bool = False, sidecars: bool = False):
     """
-    在本进程即将进行一批文件写入/移动/删除时调用：
-    在 seconds 时间窗口内忽略 watchdog 事件，避免触发后台扫描重复劳动。
+    在本进程即将写入/移动/删除文件时调用：登记这些路径，seconds 内与之匹配的
+    watchdog 事件视为自身写入而忽略；其它路径的外部变动不受影响。
+
+    Args:
+        paths: 完整路径或路径列表 (移动操作应同时登记源与目标)。
+        recursive: True 时登记整个目录子树 (文件夹移动/删除/合并)。
+        sidecars: True 时同时登记 JSON 卡片的同名伴生图。
     """
-    ctx.update_fs_ignore(seconds)
+    if isinstance(paths, str):
+        paths = [paths]
+    paths = [p for p in paths if p]
+    if sidecars:
+        paths += [
+            os.path.splitext(p)[0] + ext
+            for p in paths if p.lower().endswith('.json')
+            for ext in SIDECAR_EXTENSIONS
+        ]
+    if paths:
+        ctx.register_self_writes(paths, seconds, recursive)
+
+def record_self_write(path):
+    """写入完成后调用：记录文件实际 mtime，此后该文件 mtime 不同的事件视为外部修改"""
+    try:
+        ctx.record_self_write_mtime(path, os.path.getmtime(path))
+    except OSError:
+        pass
 
-def request_scan(reason="fs_event"):
+def request_scan(reason="fs_event", paths=None):
     """
     按需触发扫描：做 debounce，把短时间内多次事件合并成一次扫描。
+
+    Args:
+        paths: 发生变动的目录 (相对卡片目录) 列表，只对这些目录做定向扫描；
+               None 表示全量扫描。窗口内只要有一次全量请求，就合并为全量扫描。
     """
     with ctx.scan_debounce_lock:
-        if ctx.scan_debounce_timer:
-            ctx.scan_debounce_timer.cancel()
-        
-        # 1秒后执行实际的入队操作
-        ctx.scan_debounce_timer = threading.Timer(
-            1.0, 
-            lambda: ctx.scan_queue.put({"type": "FULL_SCAN", "reason": reason})
-        )
-        ctx.scan_debounce_timer.daemon = True
-        ctx.scan_debounce_timer.start()
+        if paths is None:
+            ctx.scan_pending_full = True
+        else:
+            ctx.scan_pending_dirs.update(paths)
+
+
+    # 1秒内无新事件才入队；事件持续不断时最迟 SCAN_MAX_WAIT 秒入队一次
+    scheduler.defer(SCAN_TASK_KEY, _flush_scan_request, delay=SCAN_DEBOUNCE, max_wait=SCAN_MAX_WAIT, args=(reason,))
+
+def _flush_scan_request(reason):
+    """防抖到期：把累积的请求作为一个扫描任务入队"""
+    with ctx.scan_debounce_lock:
+        full, dirs = ctx.scan_pending_full, ctx.scan_pending_dirs
+        ctx.scan_pending_full, ctx.scan_pending_dirs = False, set()
+    if full:
+        ctx.scan_queue.put({"type": "FULL_SCAN", "reason": reason})
+    elif dirs:
+        ctx.scan_queue.put({"type": "DIR_SCAN", "dirs": sorted(dirs), "reason": reason})
 
 def start_fs_watcher():
     """
     监听 CARDS_FOLDER 的变化，触发 request_scan()。
     需要安装 watchdog：pip install watchdog
+    返回是否成功启动。
     """
     try:
         from watchdog.observers import Observer
         from watchdog.events import FileSystemEventHandler
     except ImportError:
         logger.warning("Watchdog module not found. Automatic file system monitoring is disabled.")
-        return
+        return False
     except Exception as e:
         logger.warning(f"Failed to start watchdog: {e}")
-        return
+        return False
+
+    # 与扫描器共用忽略规则：临时文件、隐藏目录中的变动不触发扫描
+    ignore_rules = get_ignore_rules()
+
+    def _rel(path):
+        return os.path.relpath(path, CARDS_FOLDER).replace('\\', '/')
 
     class Handler(FileSystemEventHandler):
         def on_any_event(self, event):
-            # 忽略目录本身的修改事件，只关注文件
+            paths = [p for p in (event.src_path, getattr(event, 'dest_path', '') or '') if p]
+
             if event.is_directory:
+                # 目录的 modified 事件只是其中文件变动的副产物，忽略
+                if event.event_type == 'modified':
+                    return
+                relevant = [p for p in paths if not ignore_rules.match_path(_rel(p))]
+                # 只抑制本进程登记过的写入 (移动事件两端都需匹配)
+                if not relevant or all(ctx.is_self_write(p) for p in relevant):
+                    return
+                # 目录整体移入/移出/删除时子树范围不确定，交给全量扫描
+                request_scan(reason=f"{event.event_type}:{os.path.basename(event.src_path)}")
                 return
 
-            # 本进程写文件期间抑制 watchdog
-            if ctx.should_ignore_fs_event():
-                return
-            
-            # 过滤掉非关注文件类型，减少噪音
-            if not is_card_file(event.src_path):
+            # 只关注卡片文件及伴生图 (移动事件看两端，兼容 "写临时文件再改名" 的原子保存)
+            relevant = [p for p in paths if _is_card_or_sidecar(p) and not ignore_rules.match_path(_rel(p))]
+            if not relevant or all(ctx.is_self_write(p) for p in relevant):
                 return
 
-            # 触发扫描
-            request_scan(reason=f"{event.event_type}:{os.path.basename(event.src_path)}")
+            dirs = set()
+            for p in relevant:
+                parent = os.path.dirname(_rel(p))
+                dirs.add('' if parent == '.' else parent)
+
+            # 触发定向扫描
+            request_scan(reason=f"{event.event_type}:{os.path.basename(event.src_path)}", paths=dirs)
 
-    observer = Observer()
-    observer.schedule(Handler(), CARDS_FOLDER, recursive=True)
-    observer.daemon = True
-    observer.start()
+    try:
+        observer = Observer()
+        observer.schedule(Handler(), CARDS_FOLDER, recursive=True)
+        observer.daemon = True
+        observer.start()
+    except Exception as e:
+        # 如 inotify watch 数量耗尽
+        logger.warning(f"Failed to start watchdog: {e}")
+        return False
     logger.info("File system watcher (watchdog) started.")
+    return True
 
 def background_scanner():
     """
@@ -104,7 +172,14 @@ def background_scanner():
                 continue
 
             # 开始扫描逻辑
-            _perform_scan_logic()
+            ctx.scan_in_progress = True
+            try:
+                if isinstance(task, dict) and task.get("type") == "DIR_SCAN":
+                    _perform_scan_logic(dirs=task.get("dirs") or [])
+                else:
+                    _perform_scan_logic()
+            finally:
+                ctx.scan_in_progress = False
             
             ctx.scan_queue.task_done()
                 
@@ -112,8 +187,53 @@ def background_scanner():
             logger.error(f"Background scanner critical error: {e}")
             time.sleep(5)
 
-def _perform_scan_logic():
-    """执行具体的数据库同步逻辑"""
+def _is_card_or_sidecar(name):
+    """扫描需要的文件：卡片本身，以及 JSON 卡片可能的伴生图"""
+    return is_card_file(name) or is_sidecar_image(name)
+
+def _resolve_sidecars(fs_entries):
+    """
+    用同一次遍历得到的文件列表解析 JSON 卡片的伴生图，不再逐个探测磁盘。
+    返回 {json 卡片 ID: (扩展名 或 '', 伴生图 mtime 或 0)}。
+    """
+    by_dir = {}
+    for entry in fs_entries:
+        by_dir.setdefault(entry.category, {})[os.path.normcase(entry.name)] = entry
+
+    result = {}
+    for entry in fs_entries:
+        if not entry.name.lower().endswith('.json'):
+            continue
+        names = by_dir[entry.category]
+        base = os.path.splitext(entry.name)[0]
+        found = ('', 0)
+        for ext in SIDECAR_EXTENSIONS:
+            sidecar = names.get(os.path.normcase(base + ext))
+            if sidecar is not None:
+                found = (ext, sidecar.mtime)
+                break
+        result[entry.rel_path] = found
+    return result
+
+def _normalize_scan_dirs(dirs):
+    """规范化定向扫描的目录列表 (相对卡片目录，统一 /，去重)；被忽略规则排除的目录直接丢弃"""
+    rules = get_ignore_rules()
+    result = set()
+    for d in dirs or []:
+        d = str(d).replace('\\', '/').strip('/')
+        if d and rules.match_path(d):
+            continue
+        result.add(d)
+    return sorted(result)
+
+def _perform_scan_logic(dirs=None):
+    """
+    执行具体的数据库同步逻辑。
+
+    Args:
+        dirs: None 表示全量扫描；否则为定向扫描的目录列表 (相对路径)，
+              只比对这些目录本层的文件；目录已不存在时清理其下全部记录。
+    """
     db_path = DEFAULT_DB_PATH
     
     # 使用上下文管理器手动连接，不使用 Flask g.db，因为这是后台线程
@@ -126,11 +246,29 @@ def _perform_scan_logic():
         cursor = conn.cursor()
         
         # 1. 获取数据库当前状态 (用于比对)
-        cursor.execute("""
-            SELECT id, last_modified, file_size, token_count, file_hash, is_favorite
-            FROM card_metadata
-        """)
-        rows = cursor.fetchall()
+        select_sql = "SELECT id, last_modified, file_size, token_count, file_hash, is_favorite, sidecar_ext FROM card_metadata"
+        scan_errors = 0
+        if dirs is None:
+            rows = cursor.execute(select_sql).fetchall()
+            # 2. 遍历文件系统 (共用 scandir 遍历，stat 结果来自 DirEntry)
+            tree = scan_tree(CARDS_FOLDER, file_filter=_is_card_or_sidecar)
+            fs_entries = tree.files
+            scan_errors = tree.errors
+        else:
+            rows, fs_entries = [], []
+            for d in _normalize_scan_dirs(dirs):
+                dir_full = os.path.join(CARDS_FOLDER, d.replace('/', os.sep)) if d else CARDS_FOLDER
+                if os.path.isdir(dir_full):
+                    rows.extend(cursor.execute(select_sql + " WHERE category = ?", (d,)).fetchall())
+                    tree = scan_tree(dir_full, file_filter=_is_card_or_sidecar, max_depth=0, rel_root=d)
+                    fs_entries.extend(tree.files)
+                    scan_errors += tree.errors
+                elif d:
+                    # 目录已被删除或移走：其下 (含子目录) 的记录全部清理
+                    rows.extend(cursor.execute(
+                        select_sql + " WHERE category = ? OR category LIKE ? || '/%' ESCAPE '\\'",
+                        (d, escape_like(d))
+                    ).fetchall())
         
         # 构建内存映射: id -> info
         db_files_map = {
@@ -139,120 +277,141 @@ def _perform_scan_logic():
                 'size': row[2] or 0,
                 'tokens': row[3] or 0,
                 'hash': row[4] or "",
-                'fav': row[5] or 0
+                'fav': row[5] or 0,
+                'sidecar': row[6]
             }
             for row in rows
         }
+
+        # JSON 卡片的伴生图随卡片一起解析；伴生图文件本身不是卡片
+        sidecars = _resolve_sidecars(fs_entries)
+        fs_entries = [entry for entry in fs_entries if is_card_file(entry.name)]
         
         changes_detected = False
         fs_found_files = set()
+        # 新增/内容变化的卡片，提交后投递给后台缩略图预生成
+        thumb_ids = []
     
-        # 2. 遍历文件系统
-        for root, dirs, files in os.walk(CARDS_FOLDER):
-            rel_path = os.path.relpath(root, CARDS_FOLDER)
+        for entry in fs_entries:
+            file = sanitize_for_utf8(entry.name)
+            full_path = entry.path
+            category = entry.category
             
-            if rel_path == ".":
-                category = ""
+            # 计算 ID
+            if category == "":
+                file_id = file
             else:
-                category = rel_path.replace('\\', '/')
+                file_id = f"{category}/{file}"
             
-            for file in files:
-                file = sanitize_for_utf8(file)
-                if not is_card_file(file):
-                    continue
-                
-                full_path = os.path.join(root, file)
-                
-                # 计算 ID
-                if category == "":
-                    file_id = file
-                else:
-                    file_id = f"{category}/{file}"
-                
-                fs_found_files.add(file_id)
-                
-                # 获取文件属性 (一次 stat 调用)
-                try:
-                    st = os.stat(full_path)
-                    current_mtime = st.st_mtime
-                    current_size = st.st_size
-                except OSError:
-                    continue
-                
-                db_info = db_files_map.get(file_id)
-                
-                need_update = False
-                file_changed = False
-                
-                # 判断是否需要更新
-                if not db_info:
-                    # 新文件
+            fs_found_files.add(file_id)
+            
+            current_mtime = entry.mtime
+            current_size = entry.size
+            sidecar_ext = None
+            if file_id in sidecars:
+                # JSON 卡片：伴生图被替换也算卡片变更 (图片 URL 的版本号随之变化)
+                sidecar_ext, sidecar_mtime = sidecars[file_id]
+                current_mtime = max(current_mtime, sidecar_mtime)
+            
+            db_info = db_files_map.get(file_id)
+            
+            need_update = False
+            file_changed = False
+            
+            # 判断是否需要更新
+            if not db_info:
+                # 新文件
+                need_update = True
+                file_changed = True
+            else:
+                # 检查 mtime (容差 0.01s) 或 size
+                if (current_mtime > (db_info['mtime'] + 0.01)) or (current_size != db_info['size']):
                     need_update = True
                     file_changed = True
-                else:
-                    # 检查 mtime (容差 0.01s) 或 size
-                    if (current_mtime > (db_info['mtime'] + 0.01)) or (current_size != db_info['size']):
-                        need_update = True
-                        file_changed = True
-                    # 文件未变，但 token_count 缺失 -> 仅补全 token
-                    elif (db_info['tokens'] is None or db_info['tokens'] == 0) and current_size > 100:
-                        need_update = True
+                # 伴生图出现/消失/换了格式
+                elif db_info['sidecar'] is not None and db_info['sidecar'] != sidecar_ext:
+                    need_update = True
+                    file_changed = True
+                # 文件未变，但 token_count 缺失 -> 仅补全 token
+                elif (db_info['tokens'] is None or db_info['tokens'] == 0) and current_size > 100:
+                    need_update = True
+                # 文件未变，只是尚未记录伴生图 (旧数据库升级后首次扫描)
+                elif db_info['sidecar'] != sidecar_ext:
+                    cursor.execute("UPDATE card_metadata SET sidecar_ext = ? WHERE id = ?", (sidecar_ext, file_id))
+                    changes_detected = True
+            
+            if need_update:
+                # 解析文件
+                info = extract_card_info(full_path)
                 
-                if need_update:
-                    # 解析文件
-                    info = extract_card_info(full_path)
+                if info:
+                    data_block = info.get('data', {}) if 'data' in info else info
+                    tags = data_block.get('tags', [])
+                    if isinstance(tags, str): 
+                        tags = [t.strip() for t in tags.split(',') if t.strip()]
+                    elif tags is None: 
+                        tags = []
+                    tags = list(dict.fromkeys([str(t).strip() for t in tags if str(t).strip()]))
                     
-                    if info:
-                        data_block = info.get('data', {}) if 'data' in info else info
-                        tags = data_block.get('tags', [])
-                        if isinstance(tags, str): 
-                            tags = [t.strip() for t in tags.split(',') if t.strip()]
-                        elif tags is None: 
-                            tags = []
-                        tags = list(dict.fromkeys([str(t).strip() for t in tags if str(t).strip()]))
-                        
-                        char_name = info.get('name') or data_block.get('name') or os.path.splitext(os.path.basename(full_path))[0]
-                        
-                        calc_data = data_block.copy()
-                        if 'name' not in calc_data: calc_data['name'] = char_name
-                        token_count = calculate_token_count(calc_data)
-                        has_wi, wi_name = get_wi_meta(data_block)
-                        keep_fav = db_info['fav'] if db_info else 0
-
-                        # 优化：仅在文件真正变更时重置 hash，否则保留旧 hash (避免昂贵的 hash 计算)
-                        if file_changed:
-                            file_hash = "" # 下次读取或手动更新时再计算，此处保持为空以示脏数据
-                        else:
-                            file_hash = (db_info.get('hash', "") if db_info else "")
-
-                        cursor.execute('''
-                                INSERT OR REPLACE INTO card_metadata
-                                (id, char_name, description, first_mes, mes_example, tags, category, creator, char_version, last_modified, file_hash, file_size, token_count, has_character_book, character_book_name, is_favorite)
-                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                            ''', (
-                                file_id, char_name,
-                                data_block.get('description', ''), 
-                                data_block.get('first_mes', ''), 
-                                data_block.get('mes_example', ''),
-                                json.dumps(tags), category, 
-                                data_block.get('creator', ''), 
-                                data_block.get('character_version', ''),
-                                current_mtime, file_hash, current_size, 
-                                token_count, has_wi, wi_name,
-                                keep_fav
-                            ))
-                        changes_detected = True
-
-        # 3. 清理已删除文件
-        for db_id in list(db_files_map.keys()):
+                    char_name = info.get('name') or data_block.get('name') or os.path.splitext(os.path.basename(full_path))[0]
+                    
+                    calc_data = data_block.copy()
+                    if 'name' not in calc_data: calc_data['name'] = char_name
+                    token_count = calculate_token_count(calc_data)
+                    has_wi, wi_name = get_wi_meta(data_block)
+                    keep_fav = db_info['fav'] if db_info else 0
+
+                    # 优化：仅在文件真正变更时重置 hash，否则保留旧 hash (避免昂贵的 hash 计算)
+                    if file_changed:
+                        file_hash = "" # 下次读取或手动更新时再计算，此处保持为空以示脏数据
+                    else:
+                        file_hash = (db_info.get('hash', "") if db_info else "")
+
+                    cursor.execute('''
+                            INSERT OR REPLACE INTO card_metadata
+                            (id, char_name, tags, category, creator, char_version, last_modified, file_hash, file_size, token_count, has_character_book, character_book_name, is_favorite, wi_checked_mtime, sidecar_ext)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ''', (
+                            file_id, char_name,
+                            json.dumps(tags), category, 
+                            data_block.get('creator', ''), 
+                            data_block.get('character_version', ''),
+                            current_mtime, file_hash, current_size, 
+                            token_count, has_wi, wi_name,
+                            keep_fav, current_mtime, sidecar_ext
+                        ))
+                    upsert_card_text(cursor, file_id, data_block)
+                    changes_detected = True
+                    if file_changed:
+                        thumb_ids.append(file_id)
+
+        # 3. 清理已删除文件 (有目录读取失败时跳过，避免把暂时不可读的卡片当作已删除)
+        for db_id in ([] if scan_errors else list(db_files_map.keys())):
             if db_id not in fs_found_files:
                 cursor.execute("DELETE FROM card_metadata WHERE id = ?", (db_id,))
                 changes_detected = True
 
         if changes_detected:
             conn.commit()
-            logger.info("Background scan detected changes. Updating cache...")
+            scope = "full" if dirs is None else f"{len(dirs)} dir(s)"
+            logger.info(f"Background scan ({scope}) detected changes. Updating cache...")
             schedule_reload(reason="background_scanner")
+            if thumb_ids:
+                enqueue_thumbnails(thumb_ids)
+
+def resolve_watch_mode(root_key, root_path):
+    """
+    解析资料库根目录的变动检测方式：watchdog | poll | off。
+    配置 fs_watch_mode 可以是字符串 (所有根目录通用) 或 {根目录配置键: 模式}；
+    auto 时网络文件系统 (SMB/NFS 等) 使用轮询，本地磁盘使用 watchdog。
+    """
+    modes = current_config.get("fs_watch_mode", "auto")
+    mode = modes if isinstance(modes, str) else (modes or {}).get(root_key, "auto")
+    mode = str(mode).lower()
+    if mode not in ("watchdog", "poll", "off"):
+        mode = "poll" if is_network_path(root_path) else "watchdog"
+        logger.info(f"fs_watch_mode auto -> {mode} for {root_key}")
+    return mode
 
 def start_background_scanner():
     """启动后台扫描线程与（可选的）文件系统监听"""
@@ -264,7 +423,14 @@ def start_background_scanner():
         
         # 根据配置决定是否启动自动文件监听
         enable_auto_scan = current_config.get("enable_auto_scan", True)
-        if enable_auto_scan:
-            start_fs_watcher()
-        else:
-            logger.info("Auto file system watcher is disabled by config (enable_auto_scan = false).")
\ No newline at end of file
+        if not enable_auto_scan:
+            logger.info("Auto file system watcher is disabled by config (enable_auto_scan = false).")
+            return
+
+        mode = resolve_watch_mode("cards_dir", CARDS_FOLDER)
+        if mode == "off":
+            logger.info("Auto file system watcher is disabled for cards_dir (fs_watch_mode = off).")
+        elif mode == "poll" or not start_fs_watcher():
+            # 内部引用，避免循环引用
+            from core.services.poll_service import start_poller
+            ctx.fs_poller = start_poller(CARDS_FOLDER)
\ No newline at end of file
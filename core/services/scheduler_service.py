@@ -0,0 +1,233 @@
+import time
+import heapq
+import queue
+import itertools
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 单个任务执行超过该时长 (秒) 时记录警告：同一执行线程上的长任务会推迟其它任务
+SLOW_TASK_SECONDS = 5.0
+
+
+class _Entry:
+    """一个待执行的键控任务"""
+    __slots__ = ('key', 'func', 'args', 'due', 'deadline', 'first_requested', 'interval', 'version', 'coalesced', 'worker')
+
+    def __init__(self, key, func, args, due, deadline, interval=None, worker=None):
+        self.key = key
+        self.func = func
+        self.args = args
+        self.due = due
+        self.deadline = deadline            # 防抖的最晚执行时间 (max_wait)，None 表示不限制
+        self.first_requested = time.time()
+        self.interval = interval            # 周期任务的间隔，None 表示一次性任务
+        self.version = 0
+        self.coalesced = 0
+        self.worker = worker                # 执行线程名，None 表示在调度线程内执行
+
+
+class TaskScheduler:
+    """
+    统一的延迟任务调度器：一个调度线程 + 按到期时间排序的优先队列。
+    - 任务按 key 合并：同一 key 在执行前多次提交只执行一次 (以最后一次提交的函数/参数为准)；
+    - defer 为防抖语义：每次提交把执行时间推迟到 now + delay，但不晚于首次提交后的 max_wait；
+    - every 为周期任务，上一轮执行结束后再计算下一次到期时间；
+    - 调度线程只负责计时与合并：未指定 worker 的任务直接在调度线程中执行，必须保持短小；
+      耗时任务 (缓存重建、VACUUM 等) 指定 worker 名，到期后交给该名字的专用执行线程，
+      同一 worker 上的任务串行执行，不会拖慢其它 worker 与调度线程。
+    替代原先每次调用都新建 threading.Timer 的防抖方式，事件风暴下线程数保持恒定。
+    """
+    def __init__(self):
+        self._entries = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._workers = {}
+        self._running = {}
+        self._stats = {}
+
+    # ================= 提交 =================
+
+    def defer(self, key, func, delay=1.0, max_wait=None, args=(), worker=None):
+        """
+        防抖提交：delay 秒内无新提交才执行；持续有提交时最迟在首次提交后 max_wait 秒执行。
+        worker 为执行线程名，耗时任务应指定。
+        """
+        now = time.time()
+        with self._cond:
+            entry = self._entries.get(key)
+            if entry and entry.interval is None:
+                entry.func, entry.args, entry.worker = func, args, worker
+                entry.coalesced += 1
+                due = now + delay
+                if entry.deadline is not None:
+                    due = min(due, entry.deadline)
+                self._set_due(entry, due)
+            else:
+                deadline = now + max_wait if max_wait is not None else None
+                entry = _Entry(key, func, args, now + delay, deadline, worker=worker)
+                self._entries[key] = entry
+                self._push(entry)
+            self._ensure_started()
+
+    def every(self, key, func, interval, initial_delay=None, args=(), worker=None):
+        """注册周期任务 (重复注册会替换原任务)；worker 含义同 defer"""
+        now = time.time()
+        with self._cond:
+            delay = interval if initial_delay is None else initial_delay
+            entry = _Entry(key, func, args, now + delay, None, interval=interval, worker=worker)
+            old = self._entries.get(key)
+            if old:
+                entry.version = old.version + 1
+            self._entries[key] = entry
+            self._push(entry)
+            self._ensure_started()
+
+    def cancel(self, key):
+        """取消尚未执行的任务；返回是否存在"""
+        with self._cond:
+            entry = self._entries.pop(key, None)
+            if entry:
+                entry.version += 1  # 使堆中残留项失效
+            return entry is not None
+
+    def is_pending(self, key):
+        with self._cond:
+            return key in self._entries
+
+    # ================= 指标 =================
+
+    def get_stats(self):
+        """调度器指标：队列深度、正在执行的任务、各 worker 的积压、各 key 的执行次数/合并次数/延迟/耗时"""
+        with self._cond:
+            now = time.time()
+            pending = {
+                key: {
+                    "due_in": round(max(0.0, e.due - now), 3),
+                    "waiting": round(now - e.first_requested, 3),
+                    "coalesced": e.coalesced,
+                    "periodic": e.interval is not None,
+                }
+                for key, e in self._entries.items()
+            }
+            return {
+                "queue_depth": len(self._entries),
+                "running": sorted(self._running.values()),
+                "workers": {name: q.qsize() for name, q in self._workers.items()},
+                "pending": pending,
+                "tasks": {k: dict(v) for k, v in self._stats.items()},
+            }
+
+    # ================= 内部实现 =================
+
+    def _push(self, entry):
+        heapq.heappush(self._heap, (entry.due, next(self._seq), entry.key, entry.version))
+        self._cond.notify()
+
+    def _set_due(self, entry, due):
+        entry.due = due
+        entry.version += 1
+        self._push(entry)
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, daemon=True, name="scheduler")
+            self._thread.start()
+
+    def _next_due(self):
+        """取出下一个到期任务；没有到期任务时返回 (None, 需要等待的秒数)"""
+        while self._heap:
+            due, _, key, version = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                heapq.heappop(self._heap)  # 已被推迟/取消的残留项
+                continue
+            wait = due - time.time()
+            if wait > 0:
+                return None, wait
+            heapq.heappop(self._heap)
+            return entry, 0
+        return None, None
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                entry, wait = self._next_due()
+                if entry is None:
+                    self._cond.wait(wait)
+                    continue
+                if entry.interval is None:
+                    del self._entries[entry.key]
+                work_queue = self._worker_queue(entry.worker) if entry.worker else None
+
+            if work_queue is None:
+                self._execute(entry)
+            else:
+                # 周期任务在执行结束后才重新排期，因此同一 key 不会在 worker 队列中堆积
+                work_queue.put(entry)
+
+    def _worker_queue(self, name):
+        """取得 (必要时创建) 指定名字的执行线程的任务队列 (调用方持有 self._cond)"""
+        work_queue = self._workers.get(name)
+        if work_queue is None:
+            work_queue = self._workers[name] = queue.Queue()
+            threading.Thread(target=self._worker_loop, args=(work_queue,), daemon=True, name=f"scheduler-{name}").start()
+        return work_queue
+
+    def _worker_loop(self, work_queue):
+        while True:
+            self._execute(work_queue.get())
+
+    def _execute(self, entry):
+        """在当前线程执行任务并记录指标；周期任务执行结束后重新排期"""
+        thread_name = threading.current_thread().name
+        with self._cond:
+            self._running[thread_name] = entry.key
+
+        started = time.time()
+        error = None
+        try:
+            entry.func(*entry.args)
+        except Exception as e:
+            error = str(e)
+            logger.error(f"Scheduled task '{entry.key}' failed: {e}")
+        finished = time.time()
+
+        with self._cond:
+            self._running.pop(thread_name, None)
+            self._record(entry, started, finished, error)
+            # 周期任务：执行结束后重新排期 (期间未被替换/取消时)
+            if entry.interval is not None and self._entries.get(entry.key) is entry:
+                self._set_due(entry, finished + entry.interval)
+
+        if finished - started > SLOW_TASK_SECONDS:
+            logger.warning(f"Scheduled task '{entry.key}' took {finished - started:.1f}s")
+
+    def _record(self, entry, started, finished, error):
+        stats = self._stats.setdefault(entry.key, {
+            "runs": 0, "errors": 0, "coalesced": 0,
+            "last_latency": 0.0, "max_latency": 0.0,
+            "last_duration": 0.0, "max_duration": 0.0,
+            "last_run": 0.0, "last_error": None,
+        })
+        # 延迟：从到期时间到实际开始执行 (衡量调度线程/执行线程是否被长任务阻塞)
+        latency = max(0.0, started - entry.due)
+        duration = finished - started
+        stats["runs"] += 1
+        stats["coalesced"] += entry.coalesced
+        stats["last_latency"] = round(latency, 4)
+        stats["max_latency"] = round(max(stats["max_latency"], latency), 4)
+        stats["last_duration"] = round(duration, 4)
+        stats["max_duration"] = round(max(stats["max_duration"], duration), 4)
+        stats["last_run"] = started
+        if error:
+            stats["errors"] += 1
+            stats["last_error"] = error
+        entry.coalesced = 0
+
+
+# 全局单例
+scheduler = TaskScheduler()
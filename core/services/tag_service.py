@@ -0,0 +1,213 @@
+import os
+import json
+import sqlite3
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# === 基础设施 ===
+from core.config import CARDS_FOLDER, DEFAULT_DB_PATH
+from core.context import ctx
+from core.data.db_session import execute_with_retry
+from core.data.tag_index import get_tag_card_map
+
+# === 服务依赖 ===
+from core.services.scan_service import suppress_fs_events
+from core.services.cache_service import schedule_reload
+
+# === 工具函数 ===
+from core.utils.image import extract_card_info, write_card_metadata
+
+logger = logging.getLogger(__name__)
+
+# 并行读写卡片文件的线程数 (PNG 重编码主要耗在 zlib，会释放 GIL)
+TAG_WRITE_WORKERS = min(8, (os.cpu_count() or 2) * 2)
+
+
+def normalize_tag_list(tags):
+    """将 tags 字段统一为去重、去空白、保持原顺序的字符串列表"""
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    elif not isinstance(tags, list):
+        tags = []
+    return list(dict.fromkeys(str(t).strip() for t in tags if str(t).strip()))
+
+
+def _rewrite_card_tags(card_id, transform):
+    """
+    读取单张卡片，应用 transform(old_tags) -> new_tags 并写回文件。
+    标签无变化时返回 None；写入失败时抛出异常。
+    """
+    full_path = os.path.join(CARDS_FOLDER, card_id.replace('/', os.sep))
+    info = extract_card_info(full_path)
+    if not info or not isinstance(info, dict):
+        raise ValueError("无法解析卡片")
+
+    # 兼容 V2/V3：只写回 data block，不污染顶层
+    is_v3 = isinstance(info.get("data"), dict)
+    data_block = info["data"] if is_v3 else info
+
+    old_tags = normalize_tag_list(data_block.get("tags"))
+    new_tags = transform(old_tags)
+    if new_tags == old_tags:
+        return None
+
+    data_block["tags"] = new_tags
+    suppress_fs_events(full_path, 2.0)
+    if not write_card_metadata(full_path, info):
+        raise IOError("写入元数据失败")
+
+    st = os.stat(full_path)
+    ctx.record_self_write_mtime(full_path, st.st_mtime)
+    return {
+        "id": card_id,
+        "old_tags": old_tags,
+        "tags": new_tags,
+        "last_modified": st.st_mtime,
+        "file_size": st.st_size,
+    }
+
+
+def apply_tag_changes(card_ids, transform, progress_cb=None, cancel_cb=None):
+    """
+    批量修改标签的公共管线：
+    1. 线程池并行读取/改写卡片文件；
+    2. 所有成功项在一个数据库事务中 executemany 写入；
+    3. 内存缓存做一次批量更新。
+    单卡失败不会中断整批，失败项在返回值中列出。
+
+    Args:
+        card_ids: 需要处理的卡片 ID 列表。
+        transform: 函数 old_tags(list) -> new_tags(list)。
+        progress_cb: 可选回调 progress_cb(done, total)。
+        cancel_cb: 可选回调，返回 True 时跳过尚未开始的卡片 (已写入的文件仍会同步到数据库)。
+
+    Returns:
+        (updated, failed): updated 为变更记录列表，failed 为 [{"id", "error"}]。
+    """
+    card_ids = list(dict.fromkeys(card_ids))
+    total = len(card_ids)
+    updated, failed = [], []
+    if not card_ids:
+        return updated, failed
+
+    def _task(cid):
+        if cancel_cb and cancel_cb():
+            return cid, None, None
+        try:
+            return cid, _rewrite_card_tags(cid, transform), None
+        except Exception as e:
+            return cid, None, str(e)
+
+    with ThreadPoolExecutor(max_workers=TAG_WRITE_WORKERS) as pool:
+        for done, (cid, result, error) in enumerate(pool.map(_task, card_ids), start=1):
+            if error:
+                failed.append({"id": cid, "error": error})
+            elif result:
+                updated.append(result)
+            if progress_cb:
+                progress_cb(done, total)
+
+    if updated:
+        rows = [
+            (json.dumps(r["tags"], ensure_ascii=False), r["last_modified"], r["file_size"], r["last_modified"], r["id"])
+            for r in updated
+        ]
+
+        def _commit():
+            with sqlite3.connect(DEFAULT_DB_PATH, timeout=30) as conn:
+                # 只改标签不影响世界书：已检查过的卡片把 WI 检查标记顺延到新的 mtime；
+                # 文件内容已改写，清空 file_hash 交给后台哈希线程重算 (与扫描器处理变更文件一致)
+                conn.executemany('''
+                    UPDATE card_metadata SET tags = ?, last_modified = ?, file_size = ?, file_hash = '',
+                        wi_checked_mtime = CASE WHEN wi_checked_mtime IS last_modified THEN ? ELSE wi_checked_mtime END
+                    WHERE id = ?
+                ''', rows)
+
+        execute_with_retry(_commit)
+
+        missing = ctx.cache.bulk_update_tags(updated) if ctx.cache else []
+        # Bundle 非主版本不在缓存 id_map 中，交给防抖重载重新聚合
+        if missing:
+            schedule_reload(reason="tag_changes")
+
+    if failed:
+        logger.warning(f"Tag changes failed on {len(failed)} card(s): {failed[:5]}")
+    return updated, failed
+
+
+def _collect_tagged_ids(tags, category=None):
+    """通过 card_tags 索引定位包含任一标签的卡片 (可限定分类)"""
+    with sqlite3.connect(DEFAULT_DB_PATH, timeout=30) as conn:
+        tag_map = get_tag_card_map(conn, tags, category or None)
+    ids = []
+    for tag in tags:
+        ids.extend(tag_map.get(tag, []))
+    return list(dict.fromkeys(ids))
+
+
+def delete_tags(tags, category=None, progress_cb=None, cancel_cb=None):
+    """
+    从卡片中删除指定标签 (PNG 与 JSON 卡片均支持)。
+    只打开索引中确实包含这些标签的文件。
+
+    Returns:
+        (updated, failed, affected_tags)
+    """
+    tags_set = set(normalize_tag_list(list(tags)))
+    if not tags_set:
+        return [], [], set()
+
+    def _transform(old_tags):
+        return [t for t in old_tags if t not in tags_set]
+
+    card_ids = _collect_tagged_ids(list(tags_set), category)
+    updated, failed = apply_tag_changes(card_ids, _transform, progress_cb, cancel_cb)
+
+    affected = set()
+    for r in updated:
+        affected |= set(r["old_tags"]) & tags_set
+    return updated, failed, affected
+
+
+def update_tags(card_ids, add_tags=None, remove_tags=None, progress_cb=None, cancel_cb=None):
+    """
+    对指定卡片批量增删标签 (先删后加，新增标签追加在末尾，保持原有顺序)。
+
+    Returns:
+        (updated, failed)
+    """
+    add_list = normalize_tag_list(add_tags or [])
+    remove_set = set(normalize_tag_list(remove_tags or []))
+    if not add_list and not remove_set:
+        return [], []
+
+    def _transform(old_tags):
+        kept = [t for t in old_tags if t not in remove_set]
+        return list(dict.fromkeys(kept + [t for t in add_list if t not in remove_set]))
+
+    return apply_tag_changes(card_ids, _transform, progress_cb, cancel_cb)
+
+
+def rename_tags(mapping, category=None, progress_cb=None, cancel_cb=None):
+    """
+    批量重命名标签；若新名称已存在于卡片上则自动合并 (去重保持顺序)。
+
+    Args:
+        mapping: {old_tag: new_tag}
+
+    Returns:
+        (updated, failed)
+    """
+    mapping = {
+        str(k).strip(): str(v).strip()
+        for k, v in (mapping or {}).items()
+        if str(k).strip() and str(v).strip() and str(k).strip() != str(v).strip()
+    }
+    if not mapping:
+        return [], []
+
+    def _transform(old_tags):
+        return list(dict.fromkeys(mapping.get(t, t) for t in old_tags))
+
+    card_ids = _collect_tagged_ids(list(mapping.keys()), category)
+    return apply_tag_changes(card_ids, _transform, progress_cb, cancel_cb)
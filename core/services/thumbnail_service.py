@@ -0,0 +1,722 @@
+import os
+import sys
+import time
+import sqlite3
+import threading
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# === 基础设施 ===
+from core.config import CARDS_FOLDER, THUMB_FOLDER, DEFAULT_DB_PATH, current_config
+from core.context import ctx
+from core.data.db_session import execute_with_retry
+from core.data.card_placeholder import store_placeholders
+from core.data.thumb_index import load_thumb_index, store_thumb_index
+
+# === 服务依赖 ===
+from core.services.scheduler_service import scheduler
+from core.services.job_service import job_manager
+
+# === 工具函数 ===
+from core.utils.image import (
+    find_sidecar_image, render_thumbnail, placeholder_from_file, is_avif_supported, THUMB_WIDTH, THUMB_FORMATS
+)
+from core.utils.hash import get_content_hash
+from core.utils.walker import scan_tree
+
+logger = logging.getLogger(__name__)
+
+# 预生成进程数：留一个核给 Web 请求
+DEFAULT_THUMB_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+# 每个工作进程最多同时排队的任务数 (其余留在优先队列里，视图切换时可以及时插队)
+THUMB_INFLIGHT_PER_WORKER = 2
+# 占位图攒够多少条写一次库
+THUMB_RESULT_FLUSH_SIZE = 100
+# 可用的缩略图宽度：网格 150/300/600 (按卡片宽度与像素密度选择)，详情预览 1024
+THUMB_VARIANT_WIDTHS = (150, THUMB_WIDTH, 600, 1024)
+DETAIL_PREVIEW_WIDTH = 1024
+# 批量缩略图接口单次最多返回的卡片数 (网格每页上限)
+THUMB_BATCH_MAX = 500
+# 缩略图索引落库 / 访问时间写回的调度任务 key
+THUMB_INDEX_FLUSH_KEY = "thumb_index_flush"
+THUMB_ACCESS_FLUSH_KEY = "thumb_access_flush"
+# 两者都涉及磁盘/数据库写入 (可能等待数据库锁)，在专用执行线程上运行
+THUMB_INDEX_WORKER = "thumb_index"
+
+# 缩略图 GC：默认磁盘预算 (MB，0 表示不限)、执行间隔 (小时)
+DEFAULT_THUMB_CACHE_MAX_MB = 2048
+DEFAULT_THUMB_GC_INTERVAL_HOURS = 24
+# 超出预算时清理到预算的该比例，避免每次 GC 只删几个文件
+THUMB_GC_TARGET_RATIO = 0.9
+# 最近该时长内写入的缩略图不视为孤立文件 (可能刚生成、索引尚未记录)
+THUMB_GC_GRACE_SECONDS = 600
+# GC 后台任务类型 (处理函数在 resources 蓝图中注册)
+THUMB_GC_JOB = "thumbnail_gc"
+
+
+class _ThumbIndex:
+    """
+    缩略图索引的内存镜像：原图相对路径 -> (mtime, size, 内容哈希)。
+    首次使用时从数据库加载；新增/变更项由统一调度器防抖落库，请求线程不直接写库。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = None
+        self._dirty = {}
+        self._accessed = {}     # 缩略图相对路径 -> 最近访问时间 (批量写回文件 mtime，作为 LRU 依据)
+
+    def _ensure_loaded(self):
+        # 需持有锁
+        if self._entries is None:
+            def _read():
+                with sqlite3.connect(DEFAULT_DB_PATH, timeout=30) as conn:
+                    return load_thumb_index(conn)
+            try:
+                self._entries = execute_with_retry(_read)
+            except Exception as e:
+                logger.warning(f"Failed to load thumbnail index: {e}")
+                self._entries = {}
+
+    @staticmethod
+    def _key(source):
+        return os.path.relpath(source, CARDS_FOLDER).replace('\\', '/')
+
+    def content_hash(self, source, compute=True):
+        """
+        返回原图的内容哈希；mtime/size 与索引一致时不读文件。
+        compute=False 时不读文件 (供请求线程使用)：索引未命中返回 None，由后台生成时计算。
+        """
+        st = os.stat(source)
+        key = self._key(source)
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(key)
+        if entry and entry[0] == st.st_mtime and entry[1] == st.st_size:
+            return entry[2]
+        if not compute:
+            return None
+
+        # 全量内容哈希：改名/移动后的文件得到相同哈希，直接命中已有缩略图。
+        # 不能用头尾采样签名：只改了中间元数据的同尺寸 PNG 会共用 (串用) 缩略图
+        content_hash = get_content_hash(source)
+        self._set(key, (st.st_mtime, st.st_size, content_hash))
+        return content_hash
+
+    def forget(self, source):
+        self._set(self._key(source), None)
+
+    def touch(self, thumb_rel):
+        """记录缩略图被访问 (只写内存)；首次记录时安排一次延迟写回"""
+        with self._lock:
+            first = not self._accessed
+            self._accessed[thumb_rel] = time.time()
+        if first:
+            scheduler.defer(THUMB_ACCESS_FLUSH_KEY, self.flush_access, delay=60.0, worker=THUMB_INDEX_WORKER)
+
+    def flush_access(self):
+        """把访问时间写回缩略图文件的 mtime：内容寻址后 mtime 不再用于判断新鲜度"""
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+        for rel, ts in accessed.items():
+            try:
+                os.utime(thumb_full_path(rel), (ts, ts))
+            except OSError:
+                pass
+
+    def snapshot(self):
+        with self._lock:
+            self._ensure_loaded()
+            return dict(self._entries)
+
+    def prune(self, keys):
+        """批量移除索引项 (原图已删除或已变化)"""
+        if not keys:
+            return
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self._dirty[key] = None
+        scheduler.defer(THUMB_INDEX_FLUSH_KEY, self.flush, delay=2.0, max_wait=10.0, worker=THUMB_INDEX_WORKER)
+
+    def _set(self, key, value):
+        with self._lock:
+            self._ensure_loaded()
+            if value is None:
+                if self._entries.pop(key, None) is None:
+                    return
+            else:
+                self._entries[key] = value
+            self._dirty[key] = value
+        scheduler.defer(THUMB_INDEX_FLUSH_KEY, self.flush, delay=2.0, max_wait=10.0, worker=THUMB_INDEX_WORKER)
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+
+        def _write():
+            with sqlite3.connect(DEFAULT_DB_PATH, timeout=30) as conn:
+                store_thumb_index(conn, dirty)
+        try:
+            execute_with_retry(_write)
+        except Exception as e:
+            logger.warning(f"Failed to save thumbnail index: {e}")
+
+
+thumb_index = _ThumbIndex()
+
+
+def thumb_relpath(content_hash, width=THUMB_WIDTH, fmt='WEBP'):
+    """缩略图在 THUMB_FOLDER 下的相对路径：按内容哈希前 4 位分两级子目录，避免单目录文件过多"""
+    ext = THUMB_FORMATS[fmt][0]
+    return f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}_w{width}.{ext}"
+
+
+def pick_thumb_width(requested):
+    """选择不小于请求宽度的最小变体；参数缺失或非法时使用默认网格宽度"""
+    try:
+        requested = int(requested)
+    except (TypeError, ValueError):
+        return THUMB_WIDTH
+    for width in THUMB_VARIANT_WIDTHS:
+        if width >= requested:
+            return width
+    return THUMB_VARIANT_WIDTHS[-1]
+
+
+def negotiate_thumb_format(accept):
+    """
+    根据 Accept 选择编码格式：明确声明 AVIF (且可编码) -> AVIF，明确声明 WebP -> WebP，
+    否则 JPEG (不支持 WebP 的浏览器只会发送 image/* 之类的通配)。没有 Accept 头时保持原来的 WebP。
+    """
+    if not accept:
+        return 'WEBP'
+    explicit = {value.lower() for value, quality in accept if quality > 0}
+    if 'image/avif' in explicit and _avif_enabled():
+        return 'AVIF'
+    if 'image/webp' in explicit:
+        return 'WEBP'
+    return 'JPEG'
+
+
+_avif_state = {}
+
+def _avif_enabled():
+    if 'enabled' not in _avif_state:
+        _avif_state['enabled'] = current_config.get("thumb_avif", True) and is_avif_supported()
+    return _avif_state['enabled']
+
+
+def card_image_path(card_id, verify=False):
+    """
+    卡片对应的图片路径：JSON 卡片为其伴生图 (没有时返回 None)。
+    伴生图取自扫描时记录的结果，不逐个探测扩展名；verify=True 时确认记录仍有效 (见 sidecar_path)。
+    """
+    source = os.path.join(CARDS_FOLDER, card_id.replace('/', os.sep))
+    if card_id.lower().endswith('.json'):
+        if ctx.cache:
+            return ctx.cache.sidecar_path(card_id, verify)
+        return find_sidecar_image(source)
+    return source
+
+
+def resolve_thumbnail(card_id, width=THUMB_WIDTH, fmt='WEBP', compute=True):
+    """
+    返回指定宽度/格式的 (原图路径, 缩略图相对路径)。没有可用图片时原图路径为 None；
+    原图不存在或无法读取时缩略图相对路径为 None。
+    缩略图按原图内容寻址：同一图片无论位于哪个文件夹、叫什么名字都共用一份缩略图。
+    compute=False 时只查索引、不读原图 (请求线程)：内容哈希尚未计算时缩略图相对路径同样为 None。
+    """
+    source = card_image_path(card_id)
+    if not source:
+        return None, None
+    try:
+        content_hash = thumb_index.content_hash(source, compute)
+    except OSError:
+        if not card_id.lower().endswith('.json'):
+            return source, None
+        # 记录的伴生图已不存在 (外部删除/改了格式)：重新探测一次
+        source = card_image_path(card_id, verify=True)
+        if not source:
+            return None, None
+        try:
+            content_hash = thumb_index.content_hash(source, compute)
+        except OSError:
+            return source, None
+    if not content_hash:
+        return source, None
+    return source, thumb_relpath(content_hash, width, fmt)
+
+
+def thumb_full_path(rel):
+    return os.path.join(THUMB_FOLDER, rel.replace('/', os.sep))
+
+
+def collect_cached_thumbnails(card_ids, width=THUMB_WIDTH, fmt='WEBP'):
+    """
+    批量定位已缓存的缩略图 (供网格整页一次往返加载)：
+    返回 ([(card_id, 缩略图相对路径), ...], [缩略图尚未生成的 card_id])。
+    只读缓存不生成，也不读原图计算哈希 (升级或改写后索引未命中的卡片同样按缺失处理)；
+    缺失的卡片由后台计算哈希并生成。
+    """
+    found, missing = [], []
+    for card_id in card_ids[:THUMB_BATCH_MAX]:
+        _, thumb_rel = resolve_thumbnail(card_id, width, fmt, compute=False)
+        if thumb_rel and os.path.exists(thumb_full_path(thumb_rel)):
+            found.append((card_id, thumb_rel))
+        else:
+            missing.append(card_id)
+    if missing:
+        enqueue_thumbnails(missing)
+    return found, missing
+
+
+def invalidate_thumbnail(card_id):
+    """卡片图片被改写后调用：丢弃索引中的内容哈希，下次请求重新计算 (旧缩略图由 GC 回收)"""
+    source = card_image_path(card_id)
+    if source:
+        thumb_index.forget(source)
+
+
+def _needs_placeholder(card_id):
+    """卡片在列表缓存中但还没有占位图 (不在缓存中的历史版本等无需补算)"""
+    card = ctx.cache.id_map.get(card_id) if ctx.cache else None
+    return card is not None and not card.get('placeholder')
+
+
+def save_thumbnail_results(results):
+    """
+    把生成缩略图时顺带算出的占位图批量写库，并同步到列表缓存。
+    results: [(card_id, placeholder, color)]。
+    后台预生成与请求线程共用，应在锁外调用。
+    """
+    if not results:
+        return
+    placeholders = {card_id: (placeholder, color) for card_id, placeholder, color in results if placeholder}
+
+    def _write():
+        with sqlite3.connect(DEFAULT_DB_PATH, timeout=30) as conn:
+            store_placeholders(conn, placeholders)
+    try:
+        execute_with_retry(_write)
+    except Exception as e:
+        logger.debug(f"Failed to store thumbnail results: {e}")
+        return
+    if ctx.cache and placeholders:
+        ctx.cache.update_placeholders(placeholders)
+
+
+def _lower_priority():
+    """工作进程初始化：降低调度优先级，让出 CPU 给前台请求"""
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+
+
+def _category_of(card_id):
+    return card_id.rsplit('/', 1)[0] if '/' in card_id else ""
+
+
+class ThumbnailBuilder:
+    """
+    后台缩略图预生成：扫描、上传、导入把卡片 ID 投递进来，在进程池中生成 WebP 缩略图。
+    优先级：请求线程未命中的缩略图 > 当前页卡片 > 当前浏览的文件夹 (含子文件夹) > 其它 (按投递顺序)。
+    投递与调整优先级只操作内存队列，不会阻塞请求线程。
+    """
+    def __init__(self):
+        self._lock = threading.Condition()
+        self._pending = OrderedDict()    # 分类 -> OrderedDict(card_id -> None)
+        self._urgent = OrderedDict()     # 当前页的卡片
+        self._requests = OrderedDict()   # 请求未命中的 (card_id, 宽度, 格式)，可能不是当前预生成的变体
+        self._rendering = set()          # 生成中的缩略图相对路径，避免重复提交同一张
+        self._pending_count = 0
+        self._focus = None
+        self._executor = None
+        self._slots = None
+        self._thread = None
+        self._results = []              # 待写库的 (card_id, 占位图, 主色调)
+        # 预生成的尺寸/格式：跟随浏览器最近一次请求的网格缩略图 (卡片宽度、像素密度、Accept)
+        self._variant = (THUMB_WIDTH, 'WEBP')
+        self._stats = {"done": 0, "skipped": 0, "failed": 0, "in_flight": 0, "mode": None}
+
+    # ================= 投递 =================
+
+    def enqueue(self, card_ids):
+        """投递需要 (重新) 生成缩略图的卡片；已在队列中的忽略"""
+        with self._lock:
+            added = 0
+            for cid in card_ids:
+                if not cid:
+                    continue
+                bucket = self._pending.setdefault(_category_of(cid), OrderedDict())
+                if cid not in bucket:
+                    bucket[cid] = None
+                    added += 1
+            self._pending_count += added
+            if added:
+                self._lock.notify()
+
+    def request(self, card_id, width, fmt):
+        """
+        请求线程缓存未命中时调用：以最高优先级生成指定尺寸/格式的缩略图，立即返回。
+        已排队或正在生成的同一缩略图不会重复提交。
+        """
+        with self._lock:
+            key = (card_id, width, fmt)
+            if key not in self._requests:
+                self._requests[key] = None
+                self._lock.notify()
+
+    def focus(self, category, card_ids=None):
+        """
+        标记当前浏览的文件夹与页面 (列表接口调用)：card_ids 立即插到队首，
+        该文件夹下已排队的卡片次之。只调整顺序，不会投递新卡片以外的工作。
+        """
+        with self._lock:
+            self._focus = (category or "").lower()
+            if card_ids is not None:
+                self._urgent = OrderedDict((cid, None) for cid in card_ids if cid)
+            self._lock.notify()
+
+    def note_variant(self, width, fmt):
+        """网格缩略图请求时调用：之后按该尺寸/格式预生成"""
+        if width < DETAIL_PREVIEW_WIDTH:
+            self._variant = (width, fmt)
+
+    # ================= 调度 =================
+
+    def _take_from(self, category):
+        bucket = self._pending.get(category)
+        cid, _ = bucket.popitem(last=False)
+        if not bucket:
+            del self._pending[category]
+        self._pending_count -= 1
+        return cid
+
+    def _next_task(self):
+        """按优先级取出下一项 (card_id, 宽度, 格式) (需持有锁)；请求未命中的优先于一切预生成"""
+        if self._requests:
+            key, _ = self._requests.popitem(last=False)
+            return key
+        cid = self._next_card()
+        return None if cid is None else (cid, *self._variant)
+
+    def _next_card(self):
+        """按优先级取出下一张卡片 (需持有锁)；当前页卡片不计入 pending"""
+        if self._urgent:
+            cid, _ = self._urgent.popitem(last=False)
+            # 同一卡片若也在普通队列中，一并移除
+            bucket = self._pending.get(_category_of(cid))
+            if bucket is not None and cid in bucket:
+                del bucket[cid]
+                if not bucket:
+                    del self._pending[_category_of(cid)]
+                self._pending_count -= 1
+            return cid
+        if not self._pending:
+            return None
+        focus = self._focus
+        if focus is not None:
+            prefix = focus + '/'
+            for category in self._pending:
+                low = category.lower()
+                if not focus or low == focus or low.startswith(prefix):
+                    return self._take_from(category)
+        return self._take_from(next(iter(self._pending)))
+
+    def _create_executor(self, workers):
+        # 打包环境 (PyInstaller) 下子进程会重新执行入口，退回线程池
+        if not getattr(sys, 'frozen', False) and current_config.get("thumb_use_processes", True):
+            try:
+                # spawn：不从已有多个线程的 Web 进程 fork，避免继承持有中的锁
+                executor = ProcessPoolExecutor(
+                    max_workers=workers, initializer=_lower_priority,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                self._stats["mode"] = "process"
+                return executor
+            except (OSError, NotImplementedError, ImportError) as e:
+                logger.warning(f"Process pool unavailable for thumbnails, using threads: {e}")
+        self._stats["mode"] = "thread"
+        return ThreadPoolExecutor(max_workers=workers)
+
+    def start(self, workers=DEFAULT_THUMB_WORKERS):
+        if self._thread and self._thread.is_alive():
+            return
+        workers = max(1, int(workers))
+        self._executor = self._create_executor(workers)
+        self._slots = threading.Semaphore(workers * THUMB_INFLIGHT_PER_WORKER)
+        self._thread = threading.Thread(target=self._dispatch_loop, daemon=True, name="thumb-builder")
+        self._thread.start()
+        logger.info(f"Thumbnail builder started ({self._stats['mode']} pool, {workers} worker(s)).")
+
+    def _dispatch_loop(self):
+        while True:
+            with self._lock:
+                task = self._next_task()
+                if task is None:
+                    results = self._take_results()
+                    if not results:
+                        self._lock.wait(5)
+            if task is None:
+                save_thumbnail_results(results)
+                continue
+
+            cid, width, fmt = task
+            try:
+                source, thumb_rel = resolve_thumbnail(cid, width, fmt)
+            except Exception:
+                thumb_rel = None
+            if not thumb_rel:
+                self._count("skipped")
+                continue
+            thumb_path = thumb_full_path(thumb_rel)
+            with self._lock:
+                if thumb_rel in self._rendering:
+                    # 同一缩略图已在生成中 (同内容的另一张卡片，或请求与预生成撞上)
+                    self._stats["skipped"] += 1
+                    continue
+            if os.path.exists(thumb_path):
+                if not _needs_placeholder(cid):
+                    self._count("skipped")
+                    continue
+                # 缩略图已存在但卡片还没有占位图 (旧缓存)：从缩略图补算，无需重新解码原图
+                work = (placeholder_from_file, thumb_path)
+            else:
+                os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+                work = (render_thumbnail, source, thumb_path, width, fmt)
+
+            self._slots.acquire()
+            with self._lock:
+                self._stats["in_flight"] += 1
+                self._rendering.add(thumb_rel)
+            try:
+                future = self._executor.submit(*work)
+            except (BrokenProcessPool, RuntimeError) as e:
+                self._slots.release()
+                with self._lock:
+                    self._stats["in_flight"] -= 1
+                    self._rendering.discard(thumb_rel)
+                logger.warning(f"Thumbnail pool broken, switching to threads: {e}")
+                self._executor = ThreadPoolExecutor(max_workers=DEFAULT_THUMB_WORKERS)
+                self._stats["mode"] = "thread"
+                self._requeue(task)
+                continue
+            future.add_done_callback(lambda f, task=task, thumb_rel=thumb_rel: self._on_done(task, thumb_rel, f))
+
+    def _requeue(self, task):
+        """生成失败 (进程池损坏) 的任务放回队列：请求未命中的仍以最高优先级重试"""
+        with self._lock:
+            cid, width, fmt = task
+            if (width, fmt) != self._variant:
+                self._requests[task] = None
+            else:
+                bucket = self._pending.setdefault(_category_of(cid), OrderedDict())
+                if cid not in bucket:
+                    bucket[cid] = None
+                    self._pending_count += 1
+            self._lock.notify()
+
+    def _on_done(self, task, thumb_rel, future):
+        self._slots.release()
+        card_id = task[0]
+        results = None
+        with self._lock:
+            self._stats["in_flight"] -= 1
+            self._rendering.discard(thumb_rel)
+        try:
+            placeholder, color = future.result()
+        except BrokenProcessPool:
+            # 工作进程异常退出：放回队列，下次提交时切换到线程池
+            self._requeue(task)
+            return
+        except Exception as e:
+            self._count("failed")
+            logger.debug(f"Thumbnail pregeneration failed for {card_id}: {e}")
+            return
+        with self._lock:
+            self._stats["done"] += 1
+            self._results.append((card_id, placeholder, color))
+            if len(self._results) >= THUMB_RESULT_FLUSH_SIZE:
+                results = self._take_results()
+        if results:
+            save_thumbnail_results(results)
+
+    def _take_results(self):
+        """取走待写入的占位图 (需持有锁)"""
+        results, self._results = self._results, []
+        return results
+
+    def _count(self, key, delta=1):
+        with self._lock:
+            self._stats[key] += delta
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_status(self):
+        """预生成进度快照 (可直接 JSON 序列化)"""
+        with self._lock:
+            return {
+                **self._stats,
+                "pending": self._pending_count + len(self._urgent) + len(self._requests),
+                "variant": f"w{self._variant[0]}.{THUMB_FORMATS[self._variant[1]][0]}",
+                "focus": self._focus,
+            }
+
+
+# 全局单例
+thumb_builder = ThumbnailBuilder()
+
+
+def enqueue_thumbnails(card_ids):
+    """扫描/上传/导入后调用：投递卡片到后台缩略图预生成 (未启动时忽略)"""
+    if not thumb_builder.running:
+        return
+    thumb_builder.enqueue(card_ids)
+
+
+def start_thumbnail_builder():
+    """
+    启动后台缩略图预生成 (可通过 thumb_pregenerate 关闭)，
+    并把资料库中全部卡片以最低优先级投递一遍：已有新鲜缩略图的只做一次 stat 即跳过。
+    """
+    if not current_config.get("thumb_pregenerate", True):
+        logger.info("Thumbnail pregeneration is disabled by config (thumb_pregenerate = false).")
+        return
+    thumb_builder.start(current_config.get("thumb_workers") or DEFAULT_THUMB_WORKERS)
+    if ctx.cache:
+        with ctx.cache.lock:
+            ids = [c['id'] for c in ctx.cache.cards]
+        thumb_builder.enqueue(ids)
+
+
+# ================= 缩略图 GC =================
+
+def _live_hashes(progress_cb=None, cancel_cb=None):
+    """
+    遍历缩略图索引，返回仍然有效的内容哈希集合。
+    原图已不存在或已变化 (mtime/size 不一致) 的索引项被移除，其哈希不再计为有效。
+    """
+    entries = thumb_index.snapshot()
+    live, stale = set(), []
+    for done, (path, (mtime, size, content_hash)) in enumerate(entries.items(), start=1):
+        if cancel_cb and cancel_cb():
+            return None
+        if progress_cb and done % 1000 == 0:
+            progress_cb(done, len(entries))
+        try:
+            st = os.stat(os.path.join(CARDS_FOLDER, path.replace('/', os.sep)))
+            if st.st_mtime == mtime and st.st_size == size:
+                live.add(content_hash)
+                continue
+        except FileNotFoundError:
+            pass
+        except OSError:
+            # 暂时无法访问 (如网络共享断开)：保守地视为有效
+            live.add(content_hash)
+            continue
+        stale.append(path)
+    thumb_index.prune(stale)
+    return live, len(stale)
+
+
+def collect_thumbnail_garbage(max_bytes=None, progress_cb=None, cancel_cb=None):
+    """
+    缩略图缓存 GC：
+    1. 删除原图已不存在的缩略图 (含旧版扁平目录遗留文件与残留临时文件)；
+    2. 总大小超出预算时，按最近访问时间 (文件 mtime) 从旧到新删除，直到低于预算的 90%。
+
+    Args:
+        max_bytes: 磁盘预算 (字节)；None 表示读取配置 thumb_cache_max_mb，0 表示不限。
+
+    Returns:
+        dict: 清理统计 (含 reclaimed_bytes)；被取消时返回 None。
+    """
+    if max_bytes is None:
+        max_bytes = int(current_config.get("thumb_cache_max_mb", DEFAULT_THUMB_CACHE_MAX_MB) or 0) * 1024 * 1024
+    started = time.time()
+    thumb_index.flush_access()
+    thumb_index.flush()
+
+    result = _live_hashes(progress_cb, cancel_cb)
+    if result is None:
+        return None
+    live, index_pruned = result
+
+    # 缩略图目录不使用扫描忽略规则：残留的 .tmp 也需要清理
+    tree = scan_tree(THUMB_FOLDER, ignore=[])
+    stats = {
+        "files": len(tree.files), "index_pruned": index_pruned,
+        "orphans_removed": 0, "lru_removed": 0, "reclaimed_bytes": 0,
+        "bytes_before": sum(f.size for f in tree.files),
+    }
+
+    def _remove(entry, kind):
+        try:
+            os.remove(entry.path)
+        except OSError:
+            return False
+        stats[kind] += 1
+        stats["reclaimed_bytes"] += entry.size
+        return True
+
+    kept = []
+    for entry in tree.files:
+        if cancel_cb and cancel_cb():
+            return None
+        recent = entry.mtime > started - THUMB_GC_GRACE_SECONDS
+        content_hash = entry.name.split('_', 1)[0]
+        if entry.name.endswith('.tmp'):
+            orphan = not recent
+        elif not entry.category or content_hash not in live:
+            # 根目录下的文件是旧版按文件名哈希存放的缩略图，一律视为孤立
+            orphan = not recent or not entry.category
+        else:
+            orphan = False
+        if not (orphan and _remove(entry, "orphans_removed")):
+            kept.append(entry)
+
+    # 预算：按最近访问时间从旧到新淘汰
+    total = sum(f.size for f in kept)
+    if max_bytes and total > max_bytes:
+        target = max_bytes * THUMB_GC_TARGET_RATIO
+        for entry in sorted(kept, key=lambda f: f.mtime):
+            if total <= target:
+                break
+            if _remove(entry, "lru_removed"):
+                total -= entry.size
+
+    stats["bytes_after"] = stats["bytes_before"] - stats["reclaimed_bytes"]
+    stats["budget_bytes"] = max_bytes
+    stats["duration"] = round(time.time() - started, 2)
+    logger.info(
+        f"Thumbnail GC: removed {stats['orphans_removed']} orphan(s) and {stats['lru_removed']} LRU file(s), "
+        f"reclaimed {stats['reclaimed_bytes'] / 1024 / 1024:.1f} MB"
+    )
+    return stats
+
+
+def _submit_thumbnail_gc():
+    """调度器周期回调：没有进行中的 GC 任务时提交一次"""
+    if ctx.init_status.get('status') != 'ready':
+        return
+    if any(j['type'] == THUMB_GC_JOB for j in job_manager.list_jobs(active_only=True)):
+        return
+    job_manager.submit(THUMB_GC_JOB, {})
+
+
+def start_thumbnail_gc():
+    """按 thumb_gc_interval_hours 定期执行缩略图 GC (0 表示关闭定期执行，仍可手动触发)"""
+    hours = float(current_config.get("thumb_gc_interval_hours", DEFAULT_THUMB_GC_INTERVAL_HOURS) or 0)
+    if hours <= 0:
+        logger.info("Periodic thumbnail GC is disabled by config (thumb_gc_interval_hours = 0).")
+        return
+    # 启动后稍等片刻再执行第一次，避开初始化时的磁盘高峰
+    scheduler.every(THUMB_GC_JOB, _submit_thumbnail_gc, hours * 3600, initial_delay=600)
@@ -69,13 +69,53 @@ def save_json_atomic(path, data):
 def is_card_file(filename):
     return filename.lower().endswith(('.png', '.json'))
 
-def safe_move_to_trash(src_path, trash_folder_path):
+def is_sidecar_image(filename):
+    """是否可能是 JSON 卡片的伴生图 (扩展名见 SIDECAR_EXTENSIONS)"""
+    return filename.lower().endswith(tuple(SIDECAR_EXTENSIONS))
+
+# 网络文件系统类型 (/proc/mounts 中的 fstype)
+NETWORK_FS_TYPES = {
+    'nfs', 'nfs4', 'cifs', 'smb', 'smbfs', 'smb3', 'afs', 'ncpfs', '9p',
+    'fuse.sshfs', 'fuse.rclone', 'fuse.gvfsd-fuse', 'davfs', 'glusterfs', 'ceph',
+}
+
+def is_network_path(path):
+    """
+    判断路径是否位于网络文件系统 (SMB/NFS 等) 上。
+    这类挂载上 inotify/ReadDirectoryChangesW 收不到其它机器的修改，需要改用轮询检测。
+    无法判断时返回 False。
+    """
+    try:
+        path = os.path.realpath(path)
+        if os.name == 'nt':
+            if path.startswith('\\\\'):
+                return True  # UNC 路径
+            import ctypes
+            drive = os.path.splitdrive(path)[0] + '\\'
+            return ctypes.windll.kernel32.GetDriveTypeW(drive) == 4  # DRIVE_REMOTE
+
+        best_mount, best_type = '', ''
+        with open('/proc/mounts', 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                # /proc/mounts 中空格等字符以八进制转义
+                mount_point = parts[1].replace('\\040', ' ')
+                if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) and len(mount_point) >= len(best_mount):
+                    best_mount, best_type = mount_point, parts[2]
+        return best_type.lower() in NETWORK_FS_TYPES
+    except Exception:
+        return False
+
+def safe_move_to_trash(src_path, trash_folder_path, sidecars=None):
     """
     将文件或文件夹安全移动到回收站。
     策略：
     1. 保持原文件名主体。
     2. 追加 _时间戳_随机码 防止冲突。
     3. 如果是 JSON 卡片，尝试同时移动同名图片，并保持后缀一致以便恢复。
+       sidecars 为已知的伴生图路径列表 (扫描时记录) 时直接使用，不再逐个探测扩展名。
     """
     if not os.path.exists(src_path):
         return False
@@ -102,8 +142,13 @@ def safe_move_to_trash(src_path, trash_folder_path):
         # === 特殊处理：如果是 JSON 卡片，尝试移动所有伴生图片 ===
         if ext_part.lower() == '.json':
             # 查找同名图片 (去掉 break，遍历所有可能的后缀)
-            for img_ext in ['.png', '.webp', '.jpg', '.jpeg']:
-                sidecar_src = os.path.join(os.path.dirname(src_path), name_part + img_ext)
+            if sidecars is None:
+                sidecars = [
+                    os.path.join(os.path.dirname(src_path), name_part + img_ext)
+                    for img_ext in SIDECAR_EXTENSIONS
+                ]
+            for sidecar_src in sidecars:
+                img_ext = os.path.splitext(sidecar_src)[1]
                 if os.path.exists(sidecar_src):
                     # 使用相同的 unique_suffix
                     sidecar_target_name = f"{name_part}{unique_suffix}{img_ext}"
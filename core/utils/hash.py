@@ -37,6 +37,37 @@ def get_file_hash_and_size(file_path):
         logger.error(f"Error calculating file hash: {e}")
         return "", 0
 
+# 全量内容哈希的读块大小
+_CONTENT_HASH_CHUNK = 1024 * 1024
+
+# 元数据哈希忽略的字段：标签由本库管理，时间戳随导出工具变化，都不代表卡片内容不同
+_META_HASH_IGNORED_KEYS = ('tags', 'create_date', 'creation_date', 'modification_date')
+
+def get_content_hash(file_path):
+    """
+    计算文件的全量内容哈希 (BLAKE2b-128)，用于严格查重。
+    与 get_file_hash_and_size 的采样签名不同，这里读取整个文件。
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CONTENT_HASH_CHUNK), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def get_card_meta_hash(info):
+    """
+    计算卡片数据的规范化哈希：同一张卡片被不同工具重新导出 (PNG/JSON、V2/V3、字段顺序不同) 时结果相同。
+    """
+    if not isinstance(info, dict):
+        return ""
+    data_block = info.get('data') if isinstance(info.get('data'), dict) else info
+    data_block = {
+        k: v for k, v in data_block.items()
+        if k not in _META_HASH_IGNORED_KEYS and k not in ('spec', 'spec_version')
+    }
+    json_str = json.dumps(data_block, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(json_str.encode('utf-8'), digest_size=16).hexdigest()
+
 def _calculate_data_hash(data):
     """
     计算数据的 MD5 哈希。
@@ -1,10 +1,14 @@
 import os
+import io
 import json
 import base64
-import hashlib
 import shutil
 import logging
 from PIL import Image, PngImagePlugin
+try:
+    import numpy as np
+except ImportError:  # NumPy 为可选依赖：缺失时感知哈希退化为纯 Python 实现
+    np = None
 from core.consts import SIDECAR_EXTENSIONS
 from core.config import INTERNAL_DIR
 from core.utils.data import normalize_card_v3, deterministic_sort, sanitize_for_utf8
@@ -170,6 +174,109 @@ def resize_image_if_needed(img):
         return img.resize((new_width, new_height), Image.Resampling.LANCZOS)
     return img
 
+def compute_dhash(img, hash_size=8):
+    """
+    计算图片的差值感知哈希 (dHash, 64 位无符号整数)。
+    对缩放、重新压缩、轻微调色不敏感，用于查找近似重复的头像。
+    """
+    gray = img.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    if np is not None:
+        px = np.asarray(gray, dtype=np.int16)
+        bits = (px[:, 1:] > px[:, :-1]).flatten()
+        return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+    px = list(gray.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (1 if px[offset + col + 1] > px[offset + col] else 0)
+    return value
+
+# 网格缩略图宽度 (像素)
+THUMB_WIDTH = 300
+
+# 缩略图编码格式 -> (扩展名, MIME, 保存参数)
+THUMB_FORMATS = {
+    'AVIF': ('avif', 'image/avif', {'quality': 55, 'speed': 8}),
+    'WEBP': ('webp', 'image/webp', {'quality': 75, 'method': 3}),
+    'JPEG': ('jpg', 'image/jpeg', {'quality': 80, 'optimize': True, 'progressive': True}),
+}
+
+def is_avif_supported():
+    """当前 Pillow 是否能编码 AVIF (Pillow 11.2+ 内置，或安装了 pillow-avif-plugin)"""
+    try:
+        from PIL import features
+        return bool(features.check('avif'))
+    except Exception:
+        return False
+
+# 网格占位图宽度 (像素)：以 base64 WebP 内联在卡片列表中，缩略图加载前模糊显示
+PLACEHOLDER_WIDTH = 16
+
+def compute_placeholder(img):
+    """
+    由 (已缩小的) RGB 图片生成低清占位图与主色调：
+    返回 (data URI 形式的 16px WebP, '#rrggbb')。
+    """
+    w, h = img.size
+    small = img.resize((PLACEHOLDER_WIDTH, max(1, round(h * PLACEHOLDER_WIDTH / w))), Image.Resampling.BOX)
+    buf = io.BytesIO()
+    small.save(buf, 'WEBP', quality=30, method=4)
+    data_uri = 'data:image/webp;base64,' + base64.b64encode(buf.getvalue()).decode('ascii')
+
+    # 主色调：中位切分量化为少量颜色后取像素最多的一种 (比直接取平均色更接近视觉主色)
+    quantized = small.quantize(colors=5, method=Image.Quantize.MEDIANCUT)
+    palette = quantized.getpalette()
+    _, index = max(quantized.getcolors())
+    r, g, b = palette[index * 3:index * 3 + 3]
+    return data_uri, f"#{r:02x}{g:02x}{b:02x}"
+
+def placeholder_from_file(thumb_path):
+    """
+    从已有缩略图文件补算占位图 (旧缓存生成时还没有占位图)。
+    返回值与 render_thumbnail 一致。
+    """
+    with Image.open(thumb_path) as img:
+        return compute_placeholder(img.convert('RGB'))
+
+def render_thumbnail(src_path, dest_path, width=THUMB_WIDTH, fmt='WEBP'):
+    """
+    从原图生成指定宽度与格式 (AVIF / WEBP / JPEG) 的缩略图并原子写入 dest_path，
+    返回 (占位图 data URI, 主色调)，基于缩小后的图片计算。
+    请求线程与后台预生成进程池共用 (只依赖参数，可在子进程中执行)。
+    """
+    with Image.open(src_path) as img:
+        # 优化：使用 draft 模式加速加载
+        img.draft('RGB', (width, width * 2))
+
+        if img.mode in ('RGBA', 'LA'):
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1])
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        # 优化：限制最大尺寸计算 (不放大小图)
+        w, h = img.size
+        if w > width:
+            # 小尺寸用 BILINEAR 平衡速度和质量；详情预览尺寸较大，用 LANCZOS 保证清晰度
+            resample = Image.Resampling.BILINEAR if width <= THUMB_WIDTH else Image.Resampling.LANCZOS
+            img = img.resize((width, int(h * (width / w))), resample)
+
+        # 先写临时文件再替换，避免并发请求读到半截文件
+        temp_path = f"{dest_path}.{os.getpid()}.tmp"
+        try:
+            img.save(temp_path, fmt, **THUMB_FORMATS[fmt][2])
+            os.replace(temp_path, dest_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        # 顺便计算占位图 (基于已缩小的图片，几乎没有额外开销)
+        return compute_placeholder(img)
+
 def find_sidecar_image(json_path):
     """
     根据 JSON 文件的路径，查找是否存在同名的图片文件。
@@ -198,27 +305,3 @@ def clean_sidecar_images(json_path, exclude_ext=None):
                 print(f"Deleted old sidecar: {img_path}")
             except Exception as e:
                 print(f"Failed to delete sidecar {img_path}: {e}")
-
-def clean_thumbnail_cache(rel_path, thumb_folder):
-    """
-    主动删除指定卡片 ID 对应的 WebP 缩略图缓存。
-    确保下次请求时，服务器会重新从原图生成最新的缩略图。
-    """
-    try:
-        # 逻辑必须与 serve_thumbnail 中的 hash 逻辑一致
-        filename = os.path.basename(rel_path)
-        
-        # 如果是 JSON 卡片，serve_thumbnail 是根据同名图片生成的 hash
-        # 而 api_update_card_file 中我们通常已经把它转成了 .png 或本身就是 .png
-        # 简单起见，尝试清理 .png 后缀对应的缓存
-        base_name = os.path.splitext(filename)[0]
-        potential_names = [filename, base_name + ".png"]
-        
-        for name in potential_names:
-            thumb_hash_name = hashlib.md5(name.encode('utf-8')).hexdigest() + ".webp"
-            thumb_path = os.path.join(thumb_folder, thumb_hash_name)
-            if os.path.exists(thumb_path):
-                os.remove(thumb_path)
-                # print(f"DEBUG: 已清理缩略图缓存 {thumb_path}")    
-    except Exception as e:
-        print(f"清理缩略图失败: {e}")
\ No newline at end of file
@@ -0,0 +1,187 @@
+import os
+import re
+import fnmatch
+import logging
+
+# === 基础设施 ===
+from core.config import TRASH_FOLDER, THUMB_FOLDER, TEMP_DIR, load_config
+
+logger = logging.getLogger(__name__)
+
+# 聚合文件夹 (Bundle) 标记文件名
+BUNDLE_MARKER = '.bundle'
+
+# 默认忽略规则 (fnmatch 通配符，匹配文件/目录名；含 / 的规则匹配相对路径)
+# - .* : 隐藏文件与目录 (.trash / .git / .DS_Store 等)
+# - *.tmp / *.part / *.crdownload : 原子写入与下载中的临时文件
+DEFAULT_IGNORE_PATTERNS = ['.*', '*.tmp', '*.part', '*.crdownload', '~$*', 'Thumbs.db', 'desktop.ini']
+
+# 无论规则如何都不进入的系统目录 (卡片目录被配置在数据目录附近时防止扫到回收站/缩略图)
+_SYSTEM_DIRS = {os.path.normcase(os.path.abspath(p)) for p in (TRASH_FOLDER, THUMB_FOLDER, TEMP_DIR)}
+
+
+class IgnoreRules:
+    """预编译的忽略规则，名称规则与路径规则分别合并为一个正则"""
+    def __init__(self, patterns=None):
+        patterns = [p.strip() for p in (patterns or []) if p and p.strip()]
+        name_pats = [p for p in patterns if '/' not in p]
+        path_pats = [p.strip('/') for p in patterns if '/' in p]
+        self.patterns = patterns
+        self._name_re = self._compile(name_pats)
+        self._path_re = self._compile(path_pats)
+
+    @staticmethod
+    def _compile(pats):
+        if not pats:
+            return None
+        flags = re.IGNORECASE if os.name == 'nt' else 0
+        return re.compile('|'.join(fnmatch.translate(p) for p in pats), flags)
+
+    def match(self, name, rel_path):
+        if self._name_re and self._name_re.match(name):
+            return True
+        if self._path_re and self._path_re.match(rel_path):
+            return True
+        return False
+
+    def match_path(self, rel_path):
+        """判断相对路径本身或其任一上级目录是否被忽略 (用于 watchdog 事件等单路径场景)"""
+        parts = rel_path.replace('\\', '/').strip('/').split('/')
+        for i, name in enumerate(parts):
+            if name == BUNDLE_MARKER and i == len(parts) - 1:
+                return False
+            if self.match(name, '/'.join(parts[:i + 1])):
+                return True
+        return False
+
+
+def get_ignore_rules(patterns=None):
+    """
+    获取忽略规则。patterns 为 None 时读取配置项 scan_ignore_patterns，
+    未配置则使用 DEFAULT_IGNORE_PATTERNS。
+    """
+    if patterns is None:
+        patterns = load_config().get('scan_ignore_patterns')
+        if not isinstance(patterns, list):
+            patterns = DEFAULT_IGNORE_PATTERNS
+    return IgnoreRules(patterns)
+
+
+class FileEntry:
+    """遍历结果中的单个文件，stat 信息来自 DirEntry (Windows 下无需额外系统调用)"""
+    __slots__ = ('rel_path', 'category', 'name', 'path', 'mtime', 'size')
+
+    def __init__(self, rel_path, category, name, path, mtime, size):
+        self.rel_path = rel_path    # 相对根目录的路径 (统一 /)，即卡片 ID
+        self.category = category    # 所在目录的相对路径，根目录为 ""
+        self.name = name
+        self.path = path            # 完整物理路径
+        self.mtime = mtime
+        self.size = size
+
+
+class TreeScan:
+    """一次遍历的结果"""
+    def __init__(self):
+        self.files = []             # [FileEntry]
+        self.folders = []           # 子目录相对路径 (不含根目录)，父目录在前
+        self.bundle_dirs = set()    # 含 .bundle 标记的目录相对路径
+        self.dir_mtimes = {}        # 目录相对路径 -> st_mtime_ns (仅 dir_stat=True 时收集，含根目录)
+        self.errors = 0             # 无法读取的目录数
+
+
+def scan_tree(root, file_filter=None, ignore=None, max_depth=None, collect_files=True, with_stat=True,
+              rel_root="", dir_stat=False, throttle=None):
+    """
+    基于 os.scandir 的目录遍历，所有树遍历 (扫描器、缓存重建、首次导入、世界书列表等) 共用。
+    一次遍历同时收集文件、子目录与 .bundle 标记，并复用 DirEntry 的 stat 结果。
+
+    Args:
+        root: 遍历根目录。
+        file_filter: 文件名过滤函数 name -> bool；None 表示所有文件。
+        ignore: IgnoreRules 或通配符列表；None 表示读取配置 (见 get_ignore_rules)。
+        max_depth: 最大下探层数，0 表示只看根目录本层；None 不限制。
+        collect_files: False 时只收集目录与 bundle 标记 (缓存重建的目录发现)。
+        with_stat: False 时不读取文件的 mtime/size (均为 0)。
+        rel_root: root 自身的相对路径前缀 (只遍历某个子目录时使用，结果路径仍相对资料库根目录)。
+        dir_stat: True 时记录各目录的 mtime (轮询检测用)。
+        throttle: 可选回调，每次 scandir 前调用 (用于 IO 限速)。
+
+    Returns:
+        TreeScan
+    """
+    if not isinstance(ignore, IgnoreRules):
+        ignore = get_ignore_rules(ignore)
+
+    result = TreeScan()
+    if dir_stat:
+        try:
+            result.dir_mtimes[rel_root] = os.stat(root).st_mtime_ns
+        except OSError:
+            pass
+    # 显式栈 (深度优先)，每层按名称排序，保证结果稳定
+    stack = [(root, rel_root, 0)]
+    while stack:
+        dir_path, rel_dir, depth = stack.pop()
+        if throttle:
+            throttle()
+        try:
+            with os.scandir(dir_path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            result.errors += 1
+            logger.debug(f"scandir failed: {dir_path} - {e}")
+            continue
+
+        subdirs = []
+        for entry in entries:
+            name = entry.name
+            if name == BUNDLE_MARKER:
+                if rel_dir:
+                    result.bundle_dirs.add(rel_dir)
+                continue
+
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            if ignore.match(name, rel_path):
+                continue
+
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+
+            if is_dir:
+                if os.path.normcase(os.path.abspath(entry.path)) in _SYSTEM_DIRS:
+                    continue
+                result.folders.append(rel_path)
+                if dir_stat:
+                    try:
+                        result.dir_mtimes[rel_path] = entry.stat().st_mtime_ns
+                    except OSError:
+                        pass
+                # 与 os.walk 默认行为一致：不跟随目录符号链接
+                if (max_depth is None or depth < max_depth) and not entry.is_symlink():
+                    subdirs.append((entry.path, rel_path, depth + 1))
+                continue
+
+            if not collect_files or (file_filter and not file_filter(name)):
+                continue
+
+            mtime = size = 0
+            if with_stat:
+                try:
+                    st = entry.stat()
+                    mtime, size = st.st_mtime, st.st_size
+                except OSError:
+                    continue
+            result.files.append(FileEntry(rel_path, rel_dir, name, entry.path, mtime, size))
+
+        # 逆序入栈，使子目录按名称顺序出栈
+        stack.extend(reversed(subdirs))
+
+    return result
+
+
+def iter_files(root, file_filter=None, ignore=None, max_depth=None, with_stat=True):
+    """scan_tree 的便捷封装：只返回文件列表"""
+    return scan_tree(root, file_filter, ignore, max_depth, with_stat=with_stat).files
@@ -2,6 +2,8 @@
  * static/js/api/automation.js
  */
 
+import { resolveJobResponse } from './jobs.js';
+
 export async function listRuleSets() {
     const res = await fetch('/api/automation/rulesets');
     return res.json();
@@ -36,7 +38,7 @@ export async function executeRules(payload) {
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(payload)
     });
-    return res.json();
+    return resolveJobResponse(await res.json());
 }
 
 export async function setGlobalRuleset(id) {
@@ -11,6 +11,71 @@ export async function listCards(params) {
     return res.json();
 }
 
+// 单个批量请求的 URL 长度上限：卡片 ID 多为百分号编码的中文路径，
+// 按数量分批仍可能超出代理/服务器常见的 8KB 限制 (414/431)，因此按 URL 长度切分
+const THUMB_BATCH_URL_MAX = 6000;
+
+function splitThumbnailBatch(ids, width) {
+    const base = `/api/thumbnails/batch?w=${Math.round(width)}`;
+    const urls = [];
+    let parts = [], length = base.length;
+    ids.forEach(id => {
+        const part = '&id=' + encodeURIComponent(id);
+        if (parts.length && length + part.length > THUMB_BATCH_URL_MAX) {
+            urls.push(base + parts.join(''));
+            parts = [];
+            length = base.length;
+        }
+        parts.push(part);
+        length += part.length;
+    });
+    if (parts.length) urls.push(base + parts.join(''));
+    return urls;
+}
+
+async function fetchThumbnailBatch(url, accept, signal) {
+    const res = await fetch(url, { headers: { Accept: accept }, signal });
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+
+    const buf = await res.arrayBuffer();
+    const manifestLength = new DataView(buf).getUint32(0);
+    const manifest = JSON.parse(new TextDecoder().decode(new Uint8Array(buf, 4, manifestLength)));
+    const base = 4 + manifestLength;
+
+    const urls = {};
+    manifest.items.forEach(item => {
+        const bytes = new Uint8Array(buf, base + item.offset, item.length);
+        urls[item.id] = URL.createObjectURL(new Blob([bytes], { type: manifest.mime }));
+    });
+    return { urls, missing: manifest.missing || [], queued: !!manifest.queued };
+}
+
+// 批量获取一页网格缩略图 (通常一次往返；ID 过多时按 URL 长度拆成几个并行请求，各自可按 ETag 返回 304)
+// 响应体：4 字节大端清单长度 + 清单 JSON + 缩略图字节依次拼接
+// 返回 { urls: { 卡片ID: blob URL }, missing: [尚未生成缩略图的卡片ID], queued: 缺失的卡片是否已在后台生成 }，
+// blob URL 由调用方负责释放
+export async function getThumbnailBatch(ids, width, accept, signal) {
+    const results = await Promise.allSettled(
+        splitThumbnailBatch(ids, width).map(url => fetchThumbnailBatch(url, accept, signal))
+    );
+    const failed = results.find(r => r.status === 'rejected');
+    if (failed) {
+        // 部分请求失败：释放已成功部分创建的 blob URL
+        results.forEach(r => {
+            if (r.status === 'fulfilled') Object.values(r.value.urls).forEach(url => URL.revokeObjectURL(url));
+        });
+        throw failed.reason;
+    }
+
+    const merged = { urls: {}, missing: [], queued: false };
+    results.forEach(({ value }) => {
+        Object.assign(merged.urls, value.urls);
+        merged.missing.push(...value.missing);
+        merged.queued = merged.queued || value.queued;
+    });
+    return merged;
+}
+
 // 获取原始元数据 (JSON)
 export async function getCardMetadata(id) {
     const res = await fetch('/api/get_raw_metadata', {
@@ -0,0 +1,52 @@
+/**
+ * static/js/api/jobs.js
+ * 后台任务 API (长耗时操作提交为任务，前端轮询进度)
+ */
+
+const POLL_INTERVAL = 800;
+const FINISHED = ['succeeded', 'failed', 'cancelled'];
+
+export async function getJobs(params = {}) {
+    const query = new URLSearchParams(params).toString();
+    const res = await fetch(`/api/jobs${query ? '?' + query : ''}`);
+    return res.json();
+}
+
+export async function getJob(jobId) {
+    const res = await fetch(`/api/jobs/${encodeURIComponent(jobId)}`);
+    return res.json();
+}
+
+export async function cancelJob(jobId) {
+    const res = await fetch(`/api/jobs/${encodeURIComponent(jobId)}/cancel`, { method: 'POST' });
+    return res.json();
+}
+
+// 轮询直到任务结束，返回任务处理函数的结果 (与旧版同步接口的响应格式一致)
+export async function waitForJob(jobId, onProgress = null) {
+    while (true) {
+        const res = await getJob(jobId);
+        if (!res.success) return res;
+        const job = res.job;
+        if (onProgress) onProgress(job);
+        if (FINISHED.includes(job.status)) {
+            if (job.status === 'succeeded') {
+                return job.result || { success: true };
+            }
+            if (job.status === 'cancelled') {
+                return { success: false, cancelled: true, msg: '任务已取消', job };
+            }
+            return { success: false, msg: job.error || '任务失败', job };
+        }
+        await new Promise(resolve => setTimeout(resolve, POLL_INTERVAL));
+    }
+}
+
+// 若接口返回的是任务句柄则等待其完成，否则原样返回
+export async function resolveJobResponse(res, onProgress = null) {
+    if (res && res.success && res.job_id) {
+        const result = await waitForJob(res.job_id, onProgress);
+        return { ...res, ...result };
+    }
+    return res;
+}
@@ -3,6 +3,8 @@
  * 系统、文件、标签与备份 API
  */
 
+import { resolveJobResponse } from './jobs.js';
+
 // 获取服务器状态
 export async function getServerStatus() {
     const res = await fetch('/api/status');
@@ -92,7 +94,7 @@ export async function moveFolder(payload) {
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(payload)
     });
-    return res.json();
+    return resolveJobResponse(await res.json());
 }
 
 // === 标签操作 ===
@@ -104,7 +106,7 @@ export async function batchUpdateTags(payload) {
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(payload)
     });
-    return res.json();
+    return resolveJobResponse(await res.json());
 }
 
 export async function deleteTags(payload) {
@@ -114,7 +116,17 @@ export async function deleteTags(payload) {
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(payload)
     });
-    return res.json();
+    return resolveJobResponse(await res.json());
+}
+
+export async function renameTags(payload) {
+    // payload: { mapping: { oldTag: newTag }, category }
+    const res = await fetch('/api/rename_tags', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload)
+    });
+    return resolveJobResponse(await res.json());
 }
 
 // === 备份与快照 ===
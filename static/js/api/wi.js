@@ -3,6 +3,8 @@
  * 世界书与剪切板 API
  */
 
+import { resolveJobResponse } from './jobs.js';
+
 // 获取世界书列表
 export async function listWorldInfo(params) {
     // params: { search, type, page, page_size }
@@ -55,7 +57,7 @@ export async function deleteWorldInfo(filePath) {
 // 迁移散乱 Lorebooks
 export async function migrateLorebooks() {
     const res = await fetch('/api/tools/migrate_lorebooks', { method: 'POST' });
-    return res.json();
+    return resolveJobResponse(await res.json());
 }
 
 // === 剪切板相关 ===
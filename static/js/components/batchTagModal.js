@@ -104,7 +104,9 @@ export default function batchTagModal() {
             })
             .then(res => {
                 if (res.success) {
-                    alert("成功更新 " + res.updated + " 张卡片");
+                    let msg = "成功更新 " + res.updated + " 张卡片";
+                    if (res.failed && res.failed.length) msg += "，失败 " + res.failed.length + " 张";
+                    alert(msg);
                     
                     // 清理状态
                     if (mode === "add") this.batchTagInputAdd = "";
@@ -5,6 +5,7 @@
 
 import {
     listCards,
+    getThumbnailBatch,
     deleteCards,
     findCardPage,
     moveCard,
@@ -12,6 +13,10 @@ import {
 } from '../api/card.js';
 
 import { batchUpdateTags } from '../api/system.js';
+import { withImageWidth, getImageAccept } from '../utils/format.js';
+
+// 批量缩略图中后台生成中的卡片的重试间隔 (毫秒)；用尽后回退到单张接口 (仍未生成时返回占位图，不会下载原图)
+const THUMB_RETRY_DELAYS = [1000, 2000, 4000, 8000, 16000];
 
 export default function cardGrid() {
     return {
@@ -31,6 +36,13 @@ export default function cardGrid() {
         _fetchCardsTimer: null,
         _suppressAutoFetch: false, // 用于 locateCard 期间暂停自动刷新
 
+        // 整页批量缩略图：thumb_url -> blob URL；批量请求返回前不发起单张请求
+        thumbBlobUrls: {},
+        thumbBatchPending: false,
+        // 后台生成中的缩略图 (thumb_url -> true)：重试期间只显示占位图
+        thumbRetrying: {},
+        _thumbBatchAbort: null,
+
         dragOverMain: false,
         dragCounter: 0,
 
@@ -197,6 +209,96 @@ export default function cardGrid() {
             };
         },
 
+        // 网格缩略图：按卡片宽度与屏幕像素密度请求合适的尺寸变体
+        gridThumbUrl(card) {
+            const blobUrl = this.thumbBlobUrls[card.thumb_url];
+            if (blobUrl) return blobUrl;
+            if (this.thumbBatchPending || this.thumbRetrying[card.thumb_url]) return null;
+            return withImageWidth(card.thumb_url, this._gridThumbWidth());
+        },
+
+        // 缩略图到达前的低清占位图与主色调 (随列表返回，无需额外请求)
+        placeholderStyle(card) {
+            const style = {};
+            if (card.dominant_color) style.backgroundColor = card.dominant_color;
+            if (card.placeholder) style.backgroundImage = `url("${card.placeholder}")`;
+            return style;
+        },
+
+        _gridThumbWidth() {
+            return (this.$store.global.settingsForm.card_width || 220) * (window.devicePixelRatio || 1);
+        },
+
+        // 整页缩略图一次往返加载；未缓存的卡片 (missing) 已由后端投递到后台生成，
+        // 按退避间隔重试，仍缺失或失败时回退到单张接口
+        loadThumbBatch() {
+            try { if (this._thumbBatchAbort) this._thumbBatchAbort.abort(); } catch (e) { console.error(e); }
+            this.thumbRetrying = {};
+            const cards = this.cards.filter(c => c.thumb_url);
+            if (cards.length === 0) {
+                this._replaceThumbBlobUrls({});
+                this.thumbBatchPending = false;
+                return;
+            }
+
+            const controller = new AbortController();
+            this._thumbBatchAbort = controller;
+            this.thumbBatchPending = true;
+
+            getImageAccept()
+                .then(accept => getThumbnailBatch(cards.map(c => c.id), this._gridThumbWidth(), accept, controller.signal)
+                    .then(({ urls, missing, queued }) => {
+                        if (controller.signal.aborted) {
+                            Object.values(urls).forEach(url => URL.revokeObjectURL(url));
+                            return;
+                        }
+                        const byThumbUrl = {};
+                        cards.forEach(c => { if (urls[c.id]) byThumbUrl[c.thumb_url] = urls[c.id]; });
+                        this._replaceThumbBlobUrls(byThumbUrl);
+                        // 后台生成池不可用时无需等待，直接回退到单张接口
+                        if (queued) this._retryMissingThumbs(cards.filter(c => missing.includes(c.id)), accept, controller);
+                    }))
+                .catch(err => {
+                    if (err && err.name !== 'AbortError') console.error(err);
+                })
+                .finally(() => {
+                    if (this._thumbBatchAbort === controller) this.thumbBatchPending = false;
+                });
+        },
+
+        // 后台生成中的缩略图：按 THUMB_RETRY_DELAYS 退避重新批量拉取，期间显示占位图
+        _retryMissingThumbs(cards, accept, controller, attempt = 0) {
+            const retrying = {};
+            if (attempt < THUMB_RETRY_DELAYS.length) cards.forEach(c => { retrying[c.thumb_url] = true; });
+            this.thumbRetrying = retrying;
+            if (cards.length === 0 || attempt >= THUMB_RETRY_DELAYS.length) return;
+
+            setTimeout(() => {
+                if (controller.signal.aborted) return;
+                getThumbnailBatch(cards.map(c => c.id), this._gridThumbWidth(), accept, controller.signal)
+                    .then(({ urls, missing }) => {
+                        if (controller.signal.aborted) {
+                            Object.values(urls).forEach(url => URL.revokeObjectURL(url));
+                            return;
+                        }
+                        const next = { ...this.thumbBlobUrls };
+                        cards.forEach(c => { if (urls[c.id]) next[c.thumb_url] = urls[c.id]; });
+                        this.thumbBlobUrls = next;
+                        this._retryMissingThumbs(cards.filter(c => missing.includes(c.id)), accept, controller, attempt + 1);
+                    })
+                    .catch(err => {
+                        if (err && err.name !== 'AbortError') console.error(err);
+                        if (!controller.signal.aborted) this.thumbRetrying = {};
+                    });
+            }, THUMB_RETRY_DELAYS[attempt]);
+        },
+
+        _replaceThumbBlobUrls(next) {
+            const previous = this.thumbBlobUrls;
+            this.thumbBlobUrls = next;
+            Object.values(previous).forEach(url => URL.revokeObjectURL(url));
+        },
+
         // 统一处理增量更新 (插入/排序/去重)
         handleIncrementalUpdate(card) {
             // 1. 如果已存在，先移除 (确保可以重新插入到正确排序位置)
@@ -292,6 +394,7 @@ export default function cardGrid() {
             listCards(params) // 调用 API 模块
                 .then(data => {
                     this.cards = data.cards || [];
+                    this.loadThumbBatch();
 
                     // === 更新全局 Store (供 Sidebar 使用) ===
                     store.globalTagsPool = data.global_tags || [];
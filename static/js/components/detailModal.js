@@ -32,7 +32,7 @@ import {
 } from '../api/resource.js';
 
 import { getCleanedV3Data, updateWiKeys } from '../utils/data.js';
-import { formatDate, getVersionName, estimateTokens, formatWiKeys } from '../utils/format.js';
+import { formatDate, getVersionName, estimateTokens, formatWiKeys, toPreviewUrl } from '../utils/format.js';
 import { updateShadowContent } from '../utils/dom.js';
 import { createAutoSaver } from '../utils/autoSave.js'; 
 import { wiHelpers } from '../utils/wiHelpers.js';
@@ -96,6 +96,7 @@ export default function detailModal() {
         showSetResourceFolderModal: false,
 
         formatDate,
+        toPreviewUrl,
         estimateTokens,
         updateShadowContent,
         formatWiKeys,
@@ -739,7 +740,8 @@ export default function detailModal() {
 
         get displayImageUrl() {
             if (this.currentSkinIndex === -1 || this.skinImages.length === 0) {
-                return this.activeCard.image_url;
+                // 未放大时使用 1024px 预览图，放大查看细节时才加载原图
+                return this.zoomLevel > 100 ? this.activeCard.image_url : toPreviewUrl(this.activeCard.image_url);
             }
             const folder = this.activeCard.resource_folder || this.editingData.resource_folder;
             const file = this.skinImages[this.currentSkinIndex];
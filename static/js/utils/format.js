@@ -77,4 +77,32 @@ export function calculateTotalTokens(cardData, wiEntries) {
     }
 
     return estimateTokens(text);
-}
\ No newline at end of file
+}
+// 为缩略图 URL 追加宽度参数 (服务端据此选择 150/300/600/1024 的尺寸变体)
+export function withImageWidth(url, width) {
+    if (!url || !width) return url;
+    return url + (url.includes('?') ? '&' : '?') + 'w=' + Math.round(width);
+}
+
+// 原图 URL (/cards_file/...) 转为缩略图接口的预览 URL，避免详情页直接加载数 MB 的原图
+export function toPreviewUrl(url, width = 1024) {
+    if (!url || !url.startsWith('/cards_file/')) return url;
+    return withImageWidth('/api/thumbnail/' + url.slice('/cards_file/'.length), width);
+}
+
+// 1x1 AVIF 探测图：用于判断浏览器能否解码 AVIF
+const AVIF_PROBE = 'data:image/avif;base64,AAAAIGZ0eXBhdmlmAAAAAGF2aWZtaWYxbWlhZk1BMUIAAADrbWV0YQAAAAAAAAAhaGRscgAAAAAAAAAAcGljdAAAAAAAAAAAAAAAAAAAAAAOcGl0bQAAAAAAAQAAAB5pbG9jAAAAAEQAAAEAAQAAAAEAAAETAAAAIQAAAChpaW5mAAAAAAABAAAAGmluZmUCAAAAAAEAAGF2MDFDb2xvcgAAAABqaXBycAAAAEtpcGNvAAAAFGlzcGUAAAAAAAAAAQAAAAEAAAAQcGl4aQAAAAADCAgIAAAADGF2MUOBAAwAAAAAE2NvbHJuY2x4AAEADQAGgAAAABdpcG1hAAAAAAAAAAEAAQQBAoMEAAAAKW1kYXQSAAoIGAAGiAhoNCAyExlHh4Yhh5555oAAAJBAyRxgimo=';
+let _imageAcceptPromise = null;
+
+// fetch 请求图片时使用的 Accept：与浏览器加载 <img> 时协商出相同的格式，两条路径共用同一份缩略图缓存
+export function getImageAccept() {
+    if (!_imageAcceptPromise) {
+        _imageAcceptPromise = new Promise(resolve => {
+            const img = new Image();
+            img.onload = () => resolve(img.width > 0);
+            img.onerror = () => resolve(false);
+            img.src = AVIF_PROBE;
+        }).then(avif => (avif ? 'image/avif,' : '') + 'image/webp,image/*,*/*;q=0.8');
+    }
+    return _imageAcceptPromise;
+}
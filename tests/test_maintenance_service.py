@@ -0,0 +1,40 @@
+import sqlite3
+
+from core.services import maintenance_service
+from core.services.maintenance_service import _task_vacuum
+
+
+def _fragmented_db(path, rows=3000):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+    conn.execute("VACUUM;")
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, data TEXT)")
+    conn.executemany("INSERT INTO t (data) VALUES (?)", [("x" * 1000,) for _ in range(rows)])
+    conn.commit()
+    conn.execute("DELETE FROM t")
+    conn.commit()
+    return conn
+
+
+def test_incremental_vacuum_frees_pages(tmp_path):
+    conn = _fragmented_db(str(tmp_path / "frag.db"))
+    before = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+    assert before > 100
+
+    result = _task_vacuum(conn)
+
+    after = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+    assert result["mode"] == "incremental"
+    assert after == 0
+    assert result["freed_pages"] == before
+
+
+def test_incremental_vacuum_respects_page_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(maintenance_service, "INCREMENTAL_VACUUM_PAGES", 50)
+    conn = _fragmented_db(str(tmp_path / "frag.db"))
+    before = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+
+    result = _task_vacuum(conn)
+
+    assert result["freed_pages"] == 50
+    assert conn.execute("PRAGMA freelist_count;").fetchone()[0] == before - 50